@@ -2,34 +2,50 @@
 This will be the main file for the simulated ADCS subsystem.
 """
 
+import argparse
+import os
 import sys
 import threading
 import time
 from queue import Empty  # Import is needed from use of queue timeouts
 
+# Add parent directory to path so we can import modules from there
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# pylint: disable=wrong-import-position
 from tcp_server import TcpListener
 from adcs_subsystem import ADCSSubsystem
+import command_stats
+import power_table
+import sim_logging
+import socket_stuff
+# pylint: enable=wrong-import-position
 
 SLEEP_TIME = 5  # in seconds
 EXIT_FLAG = b"EXIT"
 DEFAULT_HOST = "127.0.0.1"
 DEFAULT_PORT = 42123
+STATS_COMMAND = "STATS"
 
+LOGGER = sim_logging.get_logger("ADCS")
+STATS = command_stats.CommandStats()
+POWER = power_table.PowerSwitch("ADCS")
 
-def command_line_handler(argv) -> tuple[int, str]:
+
+def command_line_handler(argv) -> argparse.Namespace:
     """
     Control flow for what to return depending on the commandline arg.
 
     **Change here if you need to change the port and address values**
 
     Returns:
-        (PORT, HOST)
+        Namespace with port, host, unix_path and seqpacket
     """
+    parser = argparse.ArgumentParser(description="Simulated ADCS subsystem")
+    socket_stuff.add_address_arguments(parser, DEFAULT_PORT, message_oriented=True)
+    parser.add_argument("host", nargs="?", default=DEFAULT_HOST,
+                        help=f"Host address (default: {DEFAULT_HOST})")
 
-    ret_port = int(argv[1]) if len(argv) > 1 else DEFAULT_PORT
-    ret_host = argv[2] if len(argv) > 2 else DEFAULT_HOST
-
-    return ret_port, ret_host
+    return parser.parse_args(argv[1:])
 
 
 def command_parser(data: str):
@@ -46,7 +62,7 @@ def listen(adcs: ADCSSubsystem, stop: threading.Event):
     while not stop.is_set():
         try:
             received = adcs.read_bytes(timeout=SLEEP_TIME)
-            print(received)
+            LOGGER.debug("%s", received)
             if not received or received.rstrip() == EXIT_FLAG:
                 stop.set()  # begin closing server
                 return
@@ -83,13 +99,35 @@ def handle_output(adcs: ADCSSubsystem, data_list: list):
     This prevents tasks with short run times from being blocked by
     longer tasks
     """
-    transmit = run_command(data_list, adcs)
+    encoded = execute_command(data_list, adcs)
 
-    if transmit is not None:
-        encoded = str(transmit).encode("utf-8")
+    if encoded is not None:
         adcs.tx_buffer.put(encoded)
 
 
+def execute_command(data_list: list, adcs: ADCSSubsystem):
+    """
+    Runs a parsed command, recording its statistics, and returns
+    the encoded response (or None if there is nothing to send).
+    Only STATS is answered while the EPS has the ADCS powered off
+    """
+    if data_list[0] != STATS_COMMAND and not POWER.is_on():
+        LOGGER.debug("Powered off, ignoring %s", data_list)
+        return None
+
+    start = time.perf_counter()
+    transmit = run_command(data_list, adcs)
+    encoded = None if transmit is None else str(transmit).encode("utf-8")
+
+    command = data_list[0]
+    if command != STATS_COMMAND:
+        if command not in adcs.commands:
+            command = command_stats.INVALID_COMMAND
+        STATS.record(command, time.perf_counter() - start, len(":".join(data_list)),
+                     len(encoded or b""), bool(encoded and encoded.startswith(b"INVALID COMMAND")))
+    return encoded
+
+
 def send(adcs: ADCSSubsystem, stop: threading.Event):
     """
     function that will continuously check the tx buffer for
@@ -111,6 +149,8 @@ def run_command(data: list, adcs: ADCSSubsystem):
     wishes to send back to the OBC
     """
     command = data[0]
+    if command == STATS_COMMAND:
+        return STATS.report() + "\n"
     try:
         func = adcs.commands[command][0]
         num_params = adcs.commands[command][1]
@@ -128,12 +168,12 @@ def run_command(data: list, adcs: ADCSSubsystem):
 
 
 if __name__ == "__main__":
-    port, host = command_line_handler(sys.argv)
-    addr = (host, port)
+    args = command_line_handler(sys.argv)
 
-    print(f"Starting ADCS subsystem on port {port}")
+    sim_logging.configure_logging()
+    LOGGER.info("Starting ADCS subsystem on %s", args.unix_path or f"port {args.port}")
 
-    server = TcpListener(port, host)
+    server = TcpListener(args.port, args.host, args.unix_path, args.seqpacket)
     server.set_debug(True)
 
     adcs_subsystem = ADCSSubsystem(server)
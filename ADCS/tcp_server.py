@@ -1,22 +1,27 @@
 """Holds the TcpListener class allowing the creation of TCP servers"""
 
-import socket
 from abstract_interface import ConnectionProtocol
+import sim_logging
+import socket_stuff
+
+LOGGER = sim_logging.get_logger("ADCS.tcp_server")
 
 
 class TcpListener(ConnectionProtocol):
     """
-    The abstract implementation of a TCP server
+    The abstract implementation of a TCP server.
+    Listens on a Unix domain socket instead when given a unix_path
     """
 
-    def __init__(self, port: int, host: str):
+    def __init__(self, port: int, host: str, unix_path: str = None, seqpacket: bool = False):
         """ """
-        self.listening_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.listening_sock.bind((host, port))
+        self.listening_sock = socket_stuff.create_listening_socket(host, port, unix_path,
+                                                                   seqpacket)
 
         # For book keeping
         self.host = host
         self.port = port
+        self.unix_path = unix_path
 
         self.connection_socket = None
         self.client_addr = None
@@ -39,7 +44,7 @@ class TcpListener(ConnectionProtocol):
         """"Sends data from the host"""
         self.connection_socket.sendall(data)
         if self.debug:
-            print(f"SENT {data}")
+            LOGGER.debug("SENT %s", data)
 
     def recv(self, timeout: float) -> bytes:
         """Receives data from the client"""
@@ -52,7 +57,7 @@ class TcpListener(ConnectionProtocol):
         self.connection_socket.settimeout(None)
 
         if self.debug:
-            print(f"RECV f{buffer}")
+            LOGGER.debug("RECV %s", buffer)
         return buffer
 
     def __repr__(self):
@@ -63,3 +68,4 @@ class TcpListener(ConnectionProtocol):
         TcpListener destructor. When no longer used, we should free up resources.
         """
         self.listening_sock.close()
+        socket_stuff.remove_unix_socket(self.unix_path)
@@ -0,0 +1,69 @@
+"""This program times the CRC of DFGM packets, and the rest of the work of emitting them
+
+It builds real packets with DFGMSimulator (without a connection), then times computing the CRC
+of a packet, and advancing to and formatting a whole packet including its CRC. The results are
+printed as JSON: the microseconds each takes per packet, and the fraction of one core they use at
+the emit rate.
+
+Usage:
+    python3 dfgm_crc_benchmark.py [--rate HZ] [--repeat N]
+
+Copyright 2024 [Devin Headrick]. Licensed under the Apache License, Version 2.0
+"""
+
+import argparse
+import json
+import timeit
+import dfgm_subsystem
+
+DEFAULT_REPEAT = 20000
+
+
+def time_per_call(function, repeat):
+    """Returns the best average seconds per call of a function over five runs of repeat calls"""
+    return min(timeit.repeat(function, number=repeat, repeat=5)) / repeat
+
+
+def main():
+    """Time the CRC and packet formatting, and print the results"""
+    parser = argparse.ArgumentParser(description="Times the CRC of DFGM packets")
+    parser.add_argument("--rate", type=float, default=dfgm_subsystem.PACKET_EMIT_RATE,
+                        help="packets per second the costs are reported at")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="calls timed per run")
+    args = parser.parse_args()
+
+    simulator = dfgm_subsystem.DFGMSimulator(None)
+    packet = simulator.next_packet()
+    crc_time = time_per_call(lambda: dfgm_subsystem.packet_crc(packet), args.repeat)
+    format_time = time_per_call(simulator.next_packet, args.repeat)
+
+    print(json.dumps({
+        "packet_bytes": len(packet),
+        "rate_hz": args.rate,
+        "crc_us": round(crc_time * 1e6, 3),
+        "next_packet_us": round(format_time * 1e6, 3),
+        "crc_core_fraction": round(crc_time * args.rate, 6),
+        "next_packet_core_fraction": round(format_time * args.rate, 6),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
+
+
+# pylint: disable=duplicate-code
+# no error
+__author__ = "Devin Headrick"
+__copyright__ = """
+    Copyright 2024 [Devin Headrick]
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License."""
@@ -0,0 +1,197 @@
+"""This module contains the magnetometer dataset replayed by the simulated DFGM
+
+The text data file has a line per sample: the date and time, the x, y and z field (nT), then the
+12 housekeeping (HK) values. Parsing it is slow, so the first load converts it to a compact
+binary cache next to it (the same name with a .bin extension), which later loads memory map
+read-only. Every simulator in a process then shares the one mapping, and starting up costs the
+same however large the dataset is.
+
+The cache records the modification time and size of the text file it was made from, and is
+rebuilt whenever they no longer match. Its layout, all little endian:
+    header: CACHE_MAGIC, text file mtime (ns, int64), text file size (int64), sample count (int64)
+    mag data: per sample, the DAC and ADC values of x, y and z (uint16)
+    HK data: per sample, the 12 HK values (float32)
+
+Copyright 2024 [Devin Headrick]. Licensed under the Apache License, Version 2.0
+"""
+
+import array
+import functools
+import mmap
+import os
+import struct
+import sys
+
+# Add parent directory to path so we can import modules from there
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import sim_logging # pylint: disable=C0413
+
+# Columns of each line of the data file
+FIELD_COLUMNS = slice(6, 9)
+HK_COLUMNS = slice(9, 21)
+
+# Each field component is sent as a coarse DAC value plus a fine ADC value of the remainder, both
+# offset binary uint16. These scales are the simulator's own, not the flight calibration
+DAC_STEP = 2.0                 # nT per DAC count, so the DAC spans +-65536 nT
+ADC_STEP = DAC_STEP / 65536    # nT per ADC count
+UINT16_OFFSET = 32768
+
+SAMPLE_STRUCT = struct.Struct("<6H")  # x_DAC, x_ADC, y_DAC, y_ADC, z_DAC, z_ADC
+HK_STRUCT = struct.Struct("<12f")
+CACHE_MAGIC = b"DFGMSIM1"
+CACHE_HEADER = struct.Struct("<8sqqq")  # 32 bytes, so the data after it is aligned
+
+LOGGER = sim_logging.get_logger("DFGM")
+
+
+def field_to_dac_adc(field):
+    '''Converts a field component to its DAC and ADC values
+
+    Args:
+        field (float): The field component, in nT
+
+    Returns:
+        tuple: The DAC and ADC values, each an offset binary uint16
+    '''
+    dac = min(max(round(field / DAC_STEP), -UINT16_OFFSET), UINT16_OFFSET - 1)
+    adc = round((field - dac * DAC_STEP) / ADC_STEP)
+    adc = min(max(adc, -UINT16_OFFSET), UINT16_OFFSET - 1)
+    return dac + UINT16_OFFSET, adc + UINT16_OFFSET
+
+
+class DFGMDataset(): # pylint: disable=too-few-public-methods
+    '''The samples of a data file, held as read-only little endian binary'''
+
+    def __init__(self, mag_data, hk_data):
+        '''
+        Args:
+            mag_data (bytes-like): SAMPLE_STRUCT of every sample, back to back
+            hk_data (bytes-like): HK_STRUCT of every sample, back to back
+        '''
+        self.mag_data = memoryview(mag_data).cast('B')
+        self.hk_data = memoryview(hk_data).cast('B')
+        self.sample_count = len(self.mag_data) // SAMPLE_STRUCT.size
+
+    def house_keeping(self, index):
+        '''Returns the HK values of a sample, as a tuple of floats'''
+        return HK_STRUCT.unpack_from(self.hk_data, index * HK_STRUCT.size)
+
+
+def cache_path(path):
+    '''Returns the path of the binary cache of a data file'''
+    return os.path.splitext(path)[0] + ".bin"
+
+
+@functools.lru_cache(maxsize=None)
+def load_dataset(path):
+    '''Loads a data file from its cache, building the cache first if it is missing or stale.
+    Each file is only loaded once per process
+
+    Args:
+        path (str): The path of the text data file
+
+    Returns:
+        DFGMDataset: The samples of the file
+    '''
+    status = os.stat(path)
+    dataset = read_cache(cache_path(path), status)
+    if dataset is not None:
+        return dataset
+
+    LOGGER.info("Building the sample cache of %s", path)
+    mag_data, hk_data = parse_data_file(path)
+    try:
+        write_cache(cache_path(path), status, mag_data, hk_data)
+    except OSError as error_msg:
+        LOGGER.warning("Could not write the sample cache, keeping it in memory: %s", error_msg)
+        return DFGMDataset(mag_data, hk_data)
+    return read_cache(cache_path(path), status) or DFGMDataset(mag_data, hk_data)
+
+
+def parse_data_file(path):
+    '''Parses a text data file
+
+    Returns:
+        tuple: The mag data and HK data of every sample, as little endian arrays
+    '''
+    mag_data = array.array('H')
+    hk_data = array.array('f')
+    with open(path, "r", encoding="utf-8") as data_file:
+        for line in data_file:
+            values = line.split()
+            if not values:
+                continue
+            for field in values[FIELD_COLUMNS]:
+                mag_data.extend(field_to_dac_adc(float(field)))
+            hk_data.extend(float(value) for value in values[HK_COLUMNS])
+    if sys.byteorder == "big":
+        mag_data.byteswap()
+        hk_data.byteswap()
+    return mag_data, hk_data
+
+
+def write_cache(path, status, mag_data, hk_data):
+    '''Writes the cache of a data file, replacing any old cache in one step
+
+    Args:
+        path (str): The path of the cache
+        status (os.stat_result): The status of the data file
+        mag_data (array): The mag data of every sample
+        hk_data (array): The HK data of every sample
+    '''
+    sample_count = len(mag_data) * mag_data.itemsize // SAMPLE_STRUCT.size
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_path, "wb") as cache_file:
+            cache_file.write(CACHE_HEADER.pack(CACHE_MAGIC, status.st_mtime_ns, status.st_size,
+                                               sample_count))
+            cache_file.write(mag_data)
+            cache_file.write(hk_data)
+        os.replace(temporary_path, path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.unlink(temporary_path)
+
+
+def read_cache(path, status):
+    '''Maps the cache of a data file, if it exists and is of the file as it is now
+
+    Args:
+        path (str): The path of the cache
+        status (os.stat_result): The status of the data file
+
+    Returns:
+        DFGMDataset: The samples in the cache, or None if there is no valid cache
+    '''
+    try:
+        with open(path, "rb") as cache_file:
+            mapping = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):  # ValueError: the cache is empty
+        return None
+
+    if len(mapping) >= CACHE_HEADER.size:
+        magic, mtime, size, count = CACHE_HEADER.unpack_from(mapping)
+        mag_end = CACHE_HEADER.size + count * SAMPLE_STRUCT.size
+        if (magic == CACHE_MAGIC and mtime == status.st_mtime_ns and size == status.st_size
+                and len(mapping) == mag_end + count * HK_STRUCT.size):
+            view = memoryview(mapping)
+            return DFGMDataset(view[CACHE_HEADER.size:mag_end], view[mag_end:])
+    mapping.close()
+    return None
+
+
+# pylint: disable=duplicate-code
+# no error
+__author__ = "Devin Headrick"
+__copyright__ = """
+    Copyright 2024 [Devin Headrick]
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License."""
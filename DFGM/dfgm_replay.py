@@ -0,0 +1,105 @@
+"""This program replays a recording of the DFGM packet stream, made with dfgm_subsystem.py --record,
+in place of the simulated DFGM
+
+It listens on the same port (or Unix domain socket) as the DFGM simulator, and sends every client
+that connects the recorded packets, unchanged, with their recorded spacing sped up by --speed,
+or as fast as the client takes them with --max-speed. Hours of field-captured data can then be
+pushed through the OBC pipeline in minutes. Each client gets the whole replay to itself, and is
+disconnected once it ends.
+
+Usage: dfgm_replay.py DIR [port] [--unix PATH [--seqpacket]] [--speed X | --max-speed]
+    [--start SECONDS] [--pid PID]
+
+Copyright 2024 [Devin Headrick]. Licensed under the Apache License, Version 2.0
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+import packet_recorder
+
+# Add parent directory to path so we can import modules from there
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import sim_logging # pylint: disable=C0413
+import socket_stuff # pylint: disable=C0413
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 1802
+
+LOGGER = sim_logging.get_logger("DFGM replay")
+
+
+def replay_to_client(conn, address, recording, args):
+    """Replays the recording to a connected client, then disconnects it"""
+    LOGGER.info("Replaying to %s", address)
+    started = time.monotonic()
+    speed = None if args.max_speed else args.speed
+    with conn:
+        try:
+            sent = recording.replay(conn, speed, args.start, args.pid)
+        except OSError as error_msg:
+            LOGGER.info("Client %s disconnected: %s", address, error_msg)
+            return
+    LOGGER.info("Replayed %d packets to %s in %.1f s", sent, address, time.monotonic() - started)
+
+
+def main():
+    """Serve the replay of a recording to every client that connects"""
+    parser = argparse.ArgumentParser(description="Replays a recorded DFGM packet stream")
+    parser.add_argument("directory", help="the directory of the recording")
+    socket_stuff.add_address_arguments(parser, DEFAULT_PORT, message_oriented=True)
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="how many times faster than recorded the packets are sent")
+    parser.add_argument("--max-speed", action="store_true",
+                        help="send the packets as fast as the client takes them")
+    parser.add_argument("--start", type=float, default=0.0,
+                        help="seconds into the recording to start at")
+    parser.add_argument("--pid", type=int,
+                        help="start at the first packet with this PID from the start time")
+    args = parser.parse_args()
+    if args.speed <= 0:
+        parser.error("the speed must be more than 0")
+
+    sim_logging.configure_logging()
+    try:
+        recording = packet_recorder.Recording(args.directory)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    LOGGER.info("Replaying %d packets (%.1f s) from %s on %s", len(recording),
+                recording.duration(), args.directory, args.unix_path or f"port {args.port}")
+
+    with socket_stuff.create_listening_socket(DEFAULT_HOST, args.port, args.unix_path,
+                                              args.seqpacket) as s:
+        try:
+            while True:
+                conn, address = s.accept()
+                # A Unix domain socket client has no address of its own
+                client = (conn, address or args.unix_path, recording, args)
+                threading.Thread(target=replay_to_client, args=client, daemon=True).start()
+        except KeyboardInterrupt:
+            LOGGER.info("Keyboard interrupt detected. Closing socket.")
+        finally:
+            socket_stuff.remove_unix_socket(args.unix_path)
+
+
+if __name__ == "__main__":
+    main()
+
+
+# pylint: disable=duplicate-code
+# no error
+__author__ = "Devin Headrick"
+__copyright__ = """
+    Copyright 2024 [Devin Headrick]
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License."""
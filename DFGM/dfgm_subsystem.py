@@ -12,9 +12,25 @@ packet sent outward from the DFGM board every second as well.
 No commands are required to be sent to the DFMG board directly as its main purpose is to only
 record data and send it outward to another board (OBC) for processing/saving.
 
+One simulator generates the packets, and every connected client receives the same stream, with
+the same PIDs (see packet_broadcaster.py). Clients too slow to keep up lose packets, or are
+disconnected with --slow-client disconnect.
+
+Packets are sent on a deadline schedule (see emit_schedule.py), so the rate does not drift. For
+testing, a connected client may change the schedule by sending lines of text, which are not
+answered:
+    rate:<packets per simulated second>
+    acceleration:<simulated seconds per real second>
+    catchup:<skip|burst>
+The packets sent, deadlines missed and jitter are logged every REPORT_INTERVAL seconds.
+
+With --record DIR, every packet sent is also appended to a recording in DIR (see
+packet_recorder.py), which dfgm_replay.py can send back to the OBC later.
+
 Data sent by the DFGM board will be in a byte format; it's not readable if you print it out
 
-Usage: dfgm_subsystem.py non-default_port_num
+Usage: dfgm_subsystem.py [non-default_port_num] [--unix PATH [--seqpacket]] [--rate HZ]
+    [--acceleration X] [--catch-up skip|burst] [--slow-client drop|disconnect] [--record DIR]
 
 Ref:
     - DFGM packet definition:
@@ -23,16 +39,37 @@ Ref:
 Copyright 2023 [Daniel Sacro]. Licensed under the Apache License, Version 2.0
 """
 
+import argparse
+import binascii
+import logging
+import os
+import selectors
+import struct
 import sys
-import socket
 import time
-from struct import pack
+import dfgm_dataset
+import emit_schedule
+import packet_broadcaster
+import packet_recorder
+
+# Add parent directory to path so we can import modules from there
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import power_table # pylint: disable=C0413
+import sim_logging # pylint: disable=C0413
+import socket_stuff # pylint: disable=C0413
 
 DEFAULT_HOST = '127.0.0.1'
 DEFAULT_PORT = 1802
 TOTAL_SAMPLES = 100
 
 PACKET_EMIT_RATE = 1 #Rate that packet emits per second (Hz)
+REPORT_INTERVAL = 60.0 # Real seconds between reports of the emission schedule's accuracy
+CONTROL_SETTINGS = {"rate": "rate", "acceleration": "acceleration", "catchup": "catch_up"}
+# Real magnetometer samples replayed by the simulator, found next to this file
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "0c4R0196.txt")
+
+LOGGER = sim_logging.get_logger("DFGM")
+POWER = power_table.PowerSwitch("DFGM")
 
 # Format/order of housekeeping data
 house_keeping_data = {
@@ -52,7 +89,7 @@ house_keeping_data = {
 
 # Format of a raw magnetic field data sample to be processed by the OBC
 magnetic_field_tuple = {
-    "x_DAC": 1, 
+    "x_DAC": 1,
     "x_ADC": 1,
     "y_DAC": 2,
     "y_ADC": 2,
@@ -60,9 +97,6 @@ magnetic_field_tuple = {
     "z_ADC": 3
 }
 
-# There are always 100 samples in each packet from the DFGM
-magnetic_field_data = [magnetic_field_tuple] * TOTAL_SAMPLES
-
 # Format of the complete DFGM data packet
 default_packet = {
     "DLE": 0x10, # Data Link Escape
@@ -73,7 +107,7 @@ default_packet = {
     "FS": 100, # Sampling Frequency
     "PPS Offset": 1, # "U32 offset in ticks from last PPS edge"
     "HK_data": house_keeping_data,
-    "mag_data": magnetic_field_data, 
+    "mag_data": TOTAL_SAMPLES, # There are always 100 samples in each packet from the DFGM
     "Board ID": 1,
     "Sensor ID": 1,
     "Reserved 1": 55, # Reserved 1-5 are unused; reserved for any future uses
@@ -82,163 +116,242 @@ default_packet = {
     "Reserved 4": 55,
     "Reserved 5": 55,
     "ETX": 3, # End of Text
-    "CRC": 0 # Packet info
+    "CRC": 0 # Packet info, filled in by packet_crc()
 }
 
-class DFGMSimulator:
+# Little endian layout of the packet, in the order of default_packet: DLE, STX, PID and Packet Type
+# as uint8, Packet Length and FS as uint16, PPS Offset as uint32, the HK data as float16, the mag
+# data as uint16, Board ID and Sensor ID as uint16, Reserved 1-5 and ETX as uint8, and CRC as
+# uint16. The mag data is copied into the packet as stored in the dataset, so is not packed
+HEADER_STRUCT = struct.Struct(f"<4B2HI{len(house_keeping_data)}e")
+MAG_DATA_STRUCT = struct.Struct(f"<{TOTAL_SAMPLES * len(magnetic_field_tuple)}H")
+TRAILER_STRUCT = struct.Struct("<2H6B")
+CRC_STRUCT = struct.Struct("<H")
+PACKET_STRUCT = struct.Struct(HEADER_STRUCT.format + MAG_DATA_STRUCT.format[1:]
+                              + TRAILER_STRUCT.format[1:] + CRC_STRUCT.format[1:])
+MAG_DATA_OFFSET = HEADER_STRUCT.size
+TRAILER_OFFSET = MAG_DATA_OFFSET + MAG_DATA_STRUCT.size
+CRC_OFFSET = TRAILER_OFFSET + TRAILER_STRUCT.size
+# The CRC is CRC-16/CCITT-FALSE (polynomial 0x1021, initial value 0xFFFF) of every byte before it
+CRC_INITIAL = 0xFFFF
+
+
+def packet_crc(packet_bytes):
+    '''Computes the CRC of a packet
+
+    Args:
+        packet_bytes (bytes-like): The packet, with or without its CRC field
+
+    Returns:
+        int: The CRC of the bytes before the CRC field
+    '''
+    return binascii.crc_hqx(memoryview(packet_bytes)[:CRC_OFFSET], CRC_INITIAL)
+
+
+class DFGMSimulator: # pylint: disable=too-many-instance-attributes
     '''Simulates the DFGM board's functionality'''
 
-    def __init__(self, client_socket):
+    def __init__(self, client_socket, schedule=None, recorder=None):
+        '''
+        Args:
+            client_socket (socket): Where packets are sent, anything with a sendall() method
+                (e.g. a PacketBroadcaster)
+            schedule (EmitSchedule): When packets are sent, PACKET_EMIT_RATE if None
+            recorder (PacketRecorder): Records every packet sent, if not None
+        '''
         self.client_socket = client_socket
-        self.is_first_packet = True
-        self.packet = None
-        self.house_keeping_bytes = None
-        self.magnetic_field_bytes = None
-        self.packet_bytes = bytearray(b'')
-
-        with open("0c4R0196.txt", "r", encoding="utf-8") as d:
-            self.data = d.read().splitlines()
-
-    def start(self):
-        '''Simulates the DFGM board's ON state'''
-        while True:
-            try:
-                if self.is_first_packet:
-                    self.generate_packet()
-                    self.is_first_packet = False
-                else:
-                    self.update_packet()
-                self.format_packet()
-                self.send_packet()
-                self.print_packet()
-                time.sleep(1/PACKET_EMIT_RATE) # Force packet to send every 1 second
-            except BrokenPipeError:
-                print("Client disconnected abruptly")
-                break
-        self.client_socket.close()
+        self.schedule = schedule or emit_schedule.EmitSchedule(PACKET_EMIT_RATE)
+        self.recorder = recorder
+        self.next_report = time.monotonic() + REPORT_INTERVAL
+        self.packet = None # None until the first packet is generated
+        # Every packet is packed into the same buffer, and sent from a view of it without copying
+        self.packet_bytes = bytearray(PACKET_STRUCT.size)
+        self.packet_view = memoryview(self.packet_bytes)
+
+        # Shared read-only by every simulator in the process
+        self.dataset = dfgm_dataset.load_dataset(DATA_FILE)
+        self.sample_index = 0 # Index of the first sample of the current packet
+
+    def emit(self):
+        '''Sends the packets that are due, if the DFGM is powered, and reports on the schedule'''
+        # No packets are emitted while the EPS has the DFGM powered off
+        powered = POWER.is_on()
+        count = self.schedule.due(sending=powered)
+        for _ in range(count if powered else 0):
+            self.next_packet()
+            self.send_packet()
+            self.print_packet()
+
+        if time.monotonic() >= self.next_report:
+            self.next_report += REPORT_INTERVAL
+            LOGGER.info("Emitted %s", self.schedule.report())
+
+    def handle_control(self, line):
+        '''Applies the schedule setting in a control line received from a client
+
+        Args:
+            line (bytes): The line received, without its newline
+        '''
+        setting, _, value = line.decode("utf-8", "replace").strip().partition(':')
+        try:
+            if setting not in CONTROL_SETTINGS:
+                raise ValueError(f"unknown setting '{setting}'")
+            value = value if setting == "catchup" else float(value)
+            self.schedule.configure(**{CONTROL_SETTINGS[setting]: value})
+            LOGGER.info("Emission %s set to %s", setting, value)
+        except ValueError as e:
+            LOGGER.warning("Ignoring control line %r: %s", line, e)
+
+    def next_packet(self):
+        '''Advances to and formats the next data packet
+
+        Returns:
+            bytearray: The bytes of the packet
+        '''
+        if self.packet is None:
+            self.generate_packet()
+        else:
+            self.update_packet()
+        self.format_packet()
+        return self.packet_bytes
 
     def generate_packet(self):
-        '''Generates a new data packet'''
-        self.packet = default_packet
-        pid = self.packet["PID"]
-        values = self.data[pid - 1].split()
-        self.packet["HK_data"]["Core Voltage"] = float(values[0])
-        self.packet["HK_data"]["Sensor Temperature"] = float(values[1])
-        self.packet["HK_data"]["Reference Temperature"] = float(values[2])
-        self.packet["HK_data"]["Board Temperature"] = float(values[2])
-        self.packet["HK_data"]["Positive Rail Voltage"] = float(values[3])
-        self.packet["HK_data"]["Input Voltage"] = float(values[4])
-        self.packet["HK_data"]["Reference Voltage"] = float(values[5])
-        self.packet["HK_data"]["Input Current"] = float(values[6])
-        self.packet["HK_data"]["Reserved 1"] = float(values[7])
-        self.packet["HK_data"]["Reserved 2"] = float(values[8])
-        self.packet["HK_data"]["Reserved 3"] = float(values[9])
-        self.packet["HK_data"]["Reserved 4"] = float(values[10])
+        '''Generates a new data packet from the first samples of the data file'''
+        self.packet = dict(default_packet, HK_data=dict(house_keeping_data))
+        self.sample_index = 0
+        self.read_house_keeping()
 
     def update_packet(self):
-        '''Arbitrarily updates parameters of the current packet'''
-        self.packet["PID"] += 1 # Should increase by 1 on each packet
-        pid = self.packet["PID"]
-        values = self.data[pid - 1].split()
-        self.packet["HK_data"]["Core Voltage"] = float(values[9])
-        self.packet["HK_data"]["Sensor Temperature"] = float(values[10])
-        self.packet["HK_data"]["Reference Temperature"] = float(values[11])
-        self.packet["HK_data"]["Board Temperature"] = float(values[12])
-        self.packet["HK_data"]["Positive Rail Voltage"] = float(values[13])
-        self.packet["HK_data"]["Input Voltage"] = float(values[14])
-        self.packet["HK_data"]["Reference Voltage"] = float(values[15])
-        self.packet["HK_data"]["Input Current"] = float(values[16])
-        self.packet["HK_data"]["Reserved 1"] = float(values[17])
-        self.packet["HK_data"]["Reserved 2"] = float(values[18])
-        self.packet["HK_data"]["Reserved 3"] = float(values[19])
-        self.packet["HK_data"]["Reserved 4"] = float(values[20])
+        '''Advances the current packet to the next samples of the data file, replaying the file
+        from the start once it runs out
+        '''
+        self.packet["PID"] = (self.packet["PID"] + 1) % 256 # uint8, increases by 1 on each packet
+        self.sample_index = (self.sample_index + TOTAL_SAMPLES) % self.dataset.sample_count
+        self.read_house_keeping()
+
+    def read_house_keeping(self):
+        '''Sets the HK data of the current packet to that of its first sample'''
+        self.packet["HK_data"].update(zip(house_keeping_data,
+                                         self.dataset.house_keeping(self.sample_index)))
 
     def format_packet(self):
-        '''Formats the current data packet into a byte array'''
-        # Force each house keeping data value to be in uint16 form
-        self.house_keeping_bytes = bytearray(b'')
-        # pylint: disable=consider-using-dict-items
-        for hk_item in house_keeping_data:
-            self.house_keeping_bytes.extend(pack("e", house_keeping_data[hk_item]))
-
-        # Force each magnetic field coordinate value to be in uint16 form
-        self.magnetic_field_bytes = bytearray(b'')
-        for sample in magnetic_field_data:
-            for coordinate in sample:
-                self.magnetic_field_bytes.extend(pack("H", sample[coordinate]))
-
-        # Combine and format default packet bytes
-        self.packet_bytes = bytearray(b'')
-        for packet_section in default_packet:
-            packet_section_value = default_packet[packet_section]
-            if packet_section in ["DLE", "STX", "PID", "Packet Type", "ETX"]:
-                # Force these data packet sections to be in uint8 form
-                self.packet_bytes.extend(pack("B", packet_section_value))
-                # pylint: disable=line-too-long
-            elif packet_section in ["Reserved 1", "Reserved 2", "Reserved 3", "Reserved 4", "Reserved 5"]:
-                # Force these data packet sections to be in uint8 form
-                self.packet_bytes.extend(pack("B", packet_section_value))
-            elif packet_section in ["Packet Length", "FS", "Board ID", "Sensor ID", "CRC"]:
-                # Force these data packet sections to be in uint16 form
-                self.packet_bytes.extend(pack("H", packet_section_value))
-            elif packet_section in ["PPS Offset"]:
-                # Force these data packet sections to be in uint32 form
-                self.packet_bytes.extend(pack("I", packet_section_value))
-            elif packet_section in ["HK_data"]:
-                # Append previously packed bytes to this array of bytes
-                self.packet_bytes.extend(self.house_keeping_bytes)
-            elif packet_section in ["mag_data"]:
-                # Append previously packed bytes to this array of bytes
-                self.packet_bytes.extend(self.magnetic_field_bytes)
+        '''Packs the current data packet into the packet buffer'''
+        packet = self.packet
+        HEADER_STRUCT.pack_into(
+            self.packet_bytes, 0,
+            packet["DLE"], packet["STX"], packet["PID"], packet["Packet Type"],
+            packet["Packet Length"], packet["FS"], packet["PPS Offset"],
+            *packet["HK_data"].values())
+        self.copy_mag_data()
+        TRAILER_STRUCT.pack_into(
+            self.packet_bytes, TRAILER_OFFSET,
+            packet["Board ID"], packet["Sensor ID"], packet["Reserved 1"], packet["Reserved 2"],
+            packet["Reserved 3"], packet["Reserved 4"], packet["Reserved 5"], packet["ETX"])
+        packet["CRC"] = packet_crc(self.packet_view)
+        CRC_STRUCT.pack_into(self.packet_bytes, CRC_OFFSET, packet["CRC"])
+
+    def copy_mag_data(self):
+        '''Copies the mag data of the packet's samples into the packet buffer, wrapping around to
+        the start of the data file if it ends part way through the packet
+        '''
+        mag_data = self.dataset.mag_data
+        source = self.sample_index * dfgm_dataset.SAMPLE_STRUCT.size
+        offset = MAG_DATA_OFFSET
+        while offset < TRAILER_OFFSET:
+            length = min(TRAILER_OFFSET - offset, len(mag_data) - source)
+            self.packet_view[offset:offset + length] = mag_data[source:source + length]
+            offset += length
+            source = 0
 
     def send_packet(self):
-        '''Sends the current packet through the socket'''
-        self.client_socket.send(self.packet_bytes)
+        '''Sends the current packet through the socket, and records it'''
+        self.client_socket.sendall(self.packet_view)
+        if self.recorder is not None:
+            self.recorder.record(self.packet_view)
 
     def print_packet(self):
-        '''Prints the current packet to the terminal'''
-        print("Measured packet size: " + str(len(self.packet_bytes)) + "\n")
-        print("Packet Bytes (Hexadecimal): \n" + self.packet_bytes.hex() + "\n")
-        print("Packet contents: ")
+        '''Logs the current packet at debug level'''
+        # Formatting the whole packet is expensive, so skip it entirely unless it will be logged
+        if not LOGGER.isEnabledFor(logging.DEBUG):
+            return
+
+        # The bytes themselves are kept with --record, rather than dumped here
+        lines = ["Measured packet size: " + str(len(self.packet_bytes)),
+                 "Packet contents: "]
 
         for param in self.packet:
             if param == "HK_data":
                 # Format HK data in a neat way
                 hk_data = self.packet[param]
-                print("HK Data:")
+                lines.append("HK Data:")
                 for hk_param in hk_data:
-                    print("\t" + str(hk_param) + ": " + str(hk_data[hk_param]))
+                    lines.append("\t" + str(hk_param) + ": " + str(hk_data[hk_param]))
             elif param == "mag_data":
-                # Format Mag data in a "neat" way
-                print("Mag Data:")
-                # all dummy xyz tuples are same
-                print("\t" + str(self.packet[param][0]) + " * 100 samples")
+                # Format Mag data in a "neat" way, showing only the first of the samples
+                lines.append("Mag Data:")
+                first_sample = MAG_DATA_STRUCT.unpack_from(self.packet_bytes, MAG_DATA_OFFSET)
+                first_sample = dict(zip(magnetic_field_tuple, first_sample))
+                lines.append("\t" + str(first_sample) + " (first of "
+                             + str(self.packet[param]) + " samples)")
             else:
-                print(str(param) + ": " + str(self.packet[param]))
-        print("\n\n\n") # Separate packets in console
+                lines.append(str(param) + ": " + str(self.packet[param]))
+        LOGGER.debug("\n".join(lines))
 
 if __name__ == "__main__":
-    # If there is no arg, port is default. Otherwise use the arg
-    PORT = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PORT
-
-    print(f"Starting DFGM subsystem on port {PORT}\n")
-
-    # Create a socket and bind it to the port. Listen indefinitely for client connections
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        # Tell OS to reuse socket addr if not previously closed
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((DEFAULT_HOST, int(PORT)))
-        s.listen()
-
-        while True:
-            try:
-                conn, addr = s.accept()
-                with conn:
-                    print(f"Connected with {addr}")
-                    simulator = DFGMSimulator(conn)
-                    simulator.start()
-            except BrokenPipeError as e:
-                print(f"Client connection closed: {e}")
+    parser = argparse.ArgumentParser(description="Simulated DFGM subsystem")
+    # If there is no port arg, port is default. Otherwise use the arg
+    socket_stuff.add_address_arguments(parser, DEFAULT_PORT, message_oriented=True)
+    parser.add_argument("--rate", type=float, default=PACKET_EMIT_RATE,
+                        help="packets per simulated second")
+    parser.add_argument("--acceleration", type=float, default=1.0,
+                        help="simulated seconds per real second")
+    parser.add_argument("--catch-up", choices=emit_schedule.CATCH_UP_POLICIES,
+                        default=emit_schedule.CATCH_UP_SKIP,
+                        help="whether deadlines missed are skipped or sent in a burst")
+    parser.add_argument("--slow-client", choices=packet_broadcaster.SLOW_CLIENT_POLICIES,
+                        default=packet_broadcaster.SLOW_CLIENT_DROP,
+                        help="whether clients that fall behind lose packets or are disconnected")
+    parser.add_argument("--record", metavar="DIR",
+                        help="also append every packet sent to a recording in DIR")
+    args = parser.parse_args()
+    try:
+        emit_schedule.EmitSchedule(args.rate, args.acceleration, args.catch_up)
+    except ValueError as e:
+        parser.error(str(e))
+
+    sim_logging.configure_logging()
+    LOGGER.info("Starting DFGM subsystem on %s", args.unix_path or f"port {args.port}")
+    # Loaded up front, so no connection waits for it
+    dfgm_dataset.load_dataset(DATA_FILE)
+
+    # Create a socket and bind it to the port. Generate packets for every client that connects
+    with socket_stuff.create_listening_socket(DEFAULT_HOST, args.port, args.unix_path,
+                                              args.seqpacket) as s, \
+            selectors.DefaultSelector() as selector:
+        s.setblocking(False)
+        # The listening socket is the only registered object without a subscriber attached
+        selector.register(s, selectors.EVENT_READ, None)
+        broadcaster = packet_broadcaster.PacketBroadcaster(selector, args.slow_client)
+        session_recorder = packet_recorder.PacketRecorder(args.record) if args.record else None
+        simulator = DFGMSimulator(broadcaster, emit_schedule.EmitSchedule(
+            args.rate, args.acceleration, args.catch_up), session_recorder)
+        broadcaster.on_control = simulator.handle_control
+        try:
+            while True:
+                for key, mask in selector.select(simulator.schedule.timeout()):
+                    if key.data is None:
+                        broadcaster.accept(s)
+                    else:
+                        broadcaster.handle_event(key.data, mask)
+                simulator.emit()
+        except KeyboardInterrupt:
+            LOGGER.info("Keyboard interrupt detected. Closing socket.")
+        finally:
+            LOGGER.info("Emitted %s", simulator.schedule.report())
+            broadcaster.close()
+            if session_recorder is not None:
+                session_recorder.close()
+            socket_stuff.remove_unix_socket(args.unix_path)
 
 # The following is program metadata
 __author__ = "Daniel Sacro"
@@ -4,76 +4,71 @@ from the DFGM payload on ExAlta3.
 The program is meant to be used along with dfgm_subsystem.py and mainly serves as a way to
 see how data can be received and read from the subsystem.
 
-The program also utilizes the local host IP '127.0.0.1'.
+Packets are received with packet_receiver.py, so the receiver resynchronizes on its own if it
+connects part way through a packet or bytes are corrupted, and only packets with a valid CRC are
+printed. The packets received, PID gaps, CRC failures and decode time are printed when the
+subsystem disconnects or the receiver is interrupted.
 
-Usage: dfgm_test_receiver.py
+The program also utilizes the local host IP '127.0.0.1', or a Unix domain socket with --unix PATH
+(adding --seqpacket if the subsystem was started with it).
+
+Usage: dfgm_test_receiver.py [port] [--unix PATH [--seqpacket]]
 
 Copyright 2024 [Daniel Sacro]. Licensed under the Apache License, Version 2.0
 """
 
-import socket
-import struct
+import argparse
+import os
+import sys
+import dfgm_subsystem
+import packet_receiver
+
+# Add parent directory to path so we can import modules from there
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import socket_stuff # pylint: disable=C0413
 
 DEFAULT_HOST = '127.0.0.1'
 DEFAULT_PORT = 1802
-PACKET_SIZE = 1248
-
-with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-    s.connect((DEFAULT_HOST, DEFAULT_PORT))
-    while True:
-        data = s.recv(PACKET_SIZE)
-        if not data:
-            break
-
-        # Print packet contents into a readable form
-        print("Packet contents: ")
-
-        # Packet info
-        print("DLE: " + str(data[0]))
-        print("STX: " + str(data[1]))
-        print("PID: " + str(data[2]))
-        print("Packet Type: " + str(data[3]))
-        print("Packet Length: " + str(int.from_bytes(data[4:6], "little")))
-        print("FS: " + str(int.from_bytes(data[6:8], "little")))
-        print("PPS Offset: " + str(int.from_bytes(data[8:12], "little")))
-
-        # Housekeeping data
-        print("HK Data:")
-        print("\tCore Voltage: " + str(struct.unpack("e", data[12:14])))
-        print("\tSensor Temperature: " + str(struct.unpack("e", data[14:16])))
-        print("\tReference Temperature: " + str(struct.unpack("e", data[16:18])))
-        print("\tBoard Temperature: " + str(struct.unpack("e", data[18:20])))
-        print("\tPositive Rail Voltage: " + str(struct.unpack("e", data[20:22])))
-        print("\tInput Voltage: " + str(struct.unpack("e", data[22:24])))
-        print("\tReference Voltage: " + str(struct.unpack("e", data[24:26])))
-        print("\tInput Current: " + str(struct.unpack("e", data[26:28])))
-        print("\tReserved 1: " + str(struct.unpack("e", data[28:30])))
-        print("\tReserved 2: " + str(struct.unpack("e", data[30:32])))
-        print("\tReserved 3: " + str(struct.unpack("e", data[32:34])))
-        print("\tReserved 4: " + str(struct.unpack("e", data[34:36])))
-
-        # DFGM Tuple
-        print("Mag Data: ")
-        MAG_TUPLE = "(" + str(int.from_bytes(data[36:38], "little")) + ", "
-        MAG_TUPLE += str(int.from_bytes(data[38:40], "little")) + ", "
-        MAG_TUPLE += str(int.from_bytes(data[40:42], "little")) + ", "
-        MAG_TUPLE += str(int.from_bytes(data[42:44], "little")) + ", "
-        MAG_TUPLE += str(int.from_bytes(data[44:46], "little")) + ", "
-        MAG_TUPLE += str(int.from_bytes(data[46:48], "little")) + ")"
-        print("\t" + MAG_TUPLE + " * 100 samples")
-
-        # Board info
-        print("Board ID: " + str(int.from_bytes(data[1236:1238], "little")))
-        print("Sensor ID: " + str(int.from_bytes(data[1238:1240], "little")))
-        print("Reserved 1: " + str(data[1240]))
-        print("Reserved 2: " + str(data[1241]))
-        print("Reserved 3: " + str(data[1242]))
-        print("Reserved 4: " + str(data[1243]))
-        print("Reserved 5: " + str(data[1244]))
-        print("ETX: " + str(data[1245]))
-        print("CRC: " + str(int.from_bytes(data[1246:1248], "little")))
-
-        print("\n\n")
+
+parser = argparse.ArgumentParser(description="Receives and prints packets from the DFGM")
+socket_stuff.add_address_arguments(parser, DEFAULT_PORT, message_oriented=True)
+args = parser.parse_args()
+
+with socket_stuff.connect_socket(DEFAULT_HOST, args.port, args.unix_path, args.seqpacket) as s:
+    receiver = packet_receiver.PacketReceiver(s)
+    try:
+        for packet in receiver:
+            # Print packet contents into a readable form
+            print("Packet contents: ")
+
+            # Packet info
+            print("PID: " + str(packet.pid))
+            print("Packet Type: " + str(packet.packet_type))
+            print("Packet Length: " + str(packet.packet_length))
+            print("FS: " + str(packet.fs))
+            print("PPS Offset: " + str(packet.pps_offset))
+
+            # Housekeeping data
+            print("HK Data:")
+            for name, value in zip(dfgm_subsystem.house_keeping_data, packet.hk_data):
+                print("\t" + name + ": " + str(value))
+
+            # DFGM Tuple
+            print("Mag Data: ")
+            print("\t" + str(packet.mag_data[:6]) + " (first of 100 samples)")
+
+            # Board info
+            print("Board ID: " + str(packet.board_id))
+            print("Sensor ID: " + str(packet.sensor_id))
+            print("Reserved: " + str(packet.reserved))
+            print("CRC: " + str(packet.crc) + " (valid)")
+
+            print("\n\n")
+
+    except KeyboardInterrupt:
+        pass
+
+print(receiver.report())
 
 # pylint: disable=duplicate-code
 __author__ = "Daniel Sacro"
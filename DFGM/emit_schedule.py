@@ -0,0 +1,157 @@
+"""This module contains the schedule the simulated DFGM emits its packets on
+
+Packets are due at fixed deadlines on the monotonic clock, the n-th at start + n * period, rather
+than after sleeping a period once the previous packet is sent. The time taken to format and send
+a packet therefore never accumulates into drift, however long the simulator runs.
+
+The period is 1 / (rate * acceleration): the rate is the packets per simulated second (1 Hz on
+the real board), and the acceleration how many simulated seconds pass per real second, so data
+volume tests can run faster than real time. Both can be changed while packets are streaming.
+
+When the emitter falls behind by more than a period (e.g. the process was suspended), the catch
+up policy decides what happens to the deadlines it missed:
+    skip  - send one packet now and resume at the next deadline, counting the rest as missed
+    burst - send a packet for every missed deadline (at most MAX_BURST) back to back
+
+How late each packet was sent (its jitter), the deadlines missed and the deadlines that passed
+with nothing sent (the DFGM was powered off) are measured, and reported by report().
+
+Copyright 2024 [Devin Headrick]. Licensed under the Apache License, Version 2.0
+"""
+
+import math
+import time
+
+CATCH_UP_SKIP = "skip"
+CATCH_UP_BURST = "burst"
+CATCH_UP_POLICIES = (CATCH_UP_SKIP, CATCH_UP_BURST)
+MAX_RATE = 1000.0    # packets per real second, with any acceleration
+MAX_BURST = 100      # most packets sent at once to catch up; older deadlines are skipped
+
+
+class EmitSchedule(): # pylint: disable=too-many-instance-attributes
+    """Deadlines for emitting packets at a fixed rate, and how well they were kept"""
+
+    def __init__(self, rate=1.0, acceleration=1.0, catch_up=CATCH_UP_SKIP, clock=time.monotonic):
+        """
+        Args:
+            rate (float): Packets per simulated second
+            acceleration (float): Simulated seconds per real second
+            catch_up (str): The catch up policy, one of CATCH_UP_POLICIES
+            clock (function): Returns the current time in seconds, monotonic
+        """
+        self.clock = clock
+        self.rate = 1.0
+        self.acceleration = 1.0
+        self.catch_up = CATCH_UP_SKIP
+        self.anchor = None  # the time of deadline 0, set when the schedule is first used
+        self.index = 0      # the number of the next deadline
+        self.configure(rate, acceleration, catch_up)
+
+        self.emitted = 0
+        self.missed = 0
+        self.powered_off = 0
+        self.total_jitter = 0.0
+        self.total_squared_jitter = 0.0
+        self.max_jitter = 0.0
+
+    @property
+    def period(self):
+        """The real seconds between deadlines"""
+        return 1 / (self.rate * self.acceleration)
+
+    def configure(self, rate=None, acceleration=None, catch_up=None):
+        """Change the rate, acceleration or catch up policy, leaving those given as None
+
+        Deadlines restart from the next deadline, or from now if that is sooner at the new rate.
+
+        Raises:
+            ValueError: A setting is out of range
+        """
+        rate = self.rate if rate is None else rate
+        acceleration = self.acceleration if acceleration is None else acceleration
+        catch_up = self.catch_up if catch_up is None else catch_up
+        if not (rate > 0 and acceleration > 0 and rate * acceleration <= MAX_RATE):
+            raise ValueError(f"rate * acceleration must be more than 0 and at most {MAX_RATE}")
+        if catch_up not in CATCH_UP_POLICIES:
+            raise ValueError(f"catch up policy must be one of {', '.join(CATCH_UP_POLICIES)}")
+
+        if self.anchor is not None:
+            self.anchor = min(self.deadline(), self.clock() + 1 / (rate * acceleration))
+            self.index = 0
+        self.rate = rate
+        self.acceleration = acceleration
+        self.catch_up = catch_up
+
+    def deadline(self):
+        """The time the next packet is due at"""
+        return self.anchor + self.index * self.period
+
+    def timeout(self):
+        """Returns the seconds until the next packet is due, 0 if it already is"""
+        now = self.clock()
+        if self.anchor is None:
+            self.anchor = now
+        return max(self.deadline() - now, 0.0)
+
+    def due(self, sending=True):
+        """Returns the number of packets to send now, and moves on past their deadlines
+
+        Args:
+            sending (bool): Whether the packets due will be sent. If not, their deadlines are
+                counted as powered off rather than as packets emitted, and add no jitter
+
+        Returns:
+            int: 0 if the next deadline has not been reached, otherwise at least 1
+        """
+        now = self.clock()
+        if self.anchor is None:
+            self.anchor = now
+        lateness = now - self.deadline()
+        if lateness < 0:
+            return 0
+
+        passed = int(lateness // self.period) + 1  # deadlines reached, including the next one
+        count = min(passed, MAX_BURST) if self.catch_up == CATCH_UP_BURST else 1
+        self.missed += passed - count
+        self.index += passed
+        if not sending:
+            self.powered_off += count
+            return count
+        # The packets sent are those of the latest deadlines passed
+        for deadline_index in range(passed - count, passed):
+            jitter = lateness - deadline_index * self.period
+            self.total_jitter += jitter
+            self.total_squared_jitter += jitter * jitter
+            self.max_jitter = max(self.max_jitter, jitter)
+        self.emitted += count
+        return count
+
+    def report(self):
+        """Returns a line summarising the packets sent, the deadlines missed or passed while
+        powered off, and the jitter
+        """
+        mean = self.total_jitter / self.emitted if self.emitted else 0.0
+        rms = math.sqrt(self.total_squared_jitter / self.emitted) if self.emitted else 0.0
+        return (f"{self.emitted} packets at {self.rate:g} Hz x{self.acceleration:g} "
+                f"({self.catch_up}), {self.missed} deadlines missed, {self.powered_off} "
+                f"deadlines powered off, jitter mean "
+                f"{mean * 1000:.3f} ms, rms {rms * 1000:.3f} ms, "
+                f"max {self.max_jitter * 1000:.3f} ms")
+
+
+# pylint: disable=duplicate-code
+# no error
+__author__ = "Devin Headrick"
+__copyright__ = """
+    Copyright 2024 [Devin Headrick]
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License."""
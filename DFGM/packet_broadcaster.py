@@ -0,0 +1,190 @@
+"""This module contains the fan-out of one stream of packets to many subscribers
+
+A single generator (e.g. the DFGM simulator) sends each packet once, to the broadcaster, which
+queues the same immutable copy of it on every connected subscriber and writes the queues out
+through non-blocking sockets as they drain. The OBC, a ground monitor and a recorder can then
+all consume one stream, for the cost of generating it once.
+
+Each subscriber's queue holds at most max_queued packets. A subscriber too slow to keep up is
+handled by the slow client policy:
+    drop       - packets that do not fit in its full queue are dropped, for it alone
+    disconnect - it is disconnected once its queue is full
+A packet partly written to a stream socket is always finished, so subscribers only ever lose
+whole packets.
+
+Anything a subscriber sends is split into lines, each passed to the broadcaster's control
+handler, if it has one. The partial line each subscriber has sent so far is kept apart from the
+others', and a subscriber that sends more than MAX_CONTROL_LINE bytes without a newline is
+disconnected.
+
+Copyright 2024 [Devin Headrick]. Licensed under the Apache License, Version 2.0
+"""
+
+import collections
+import os
+import selectors
+import sys
+
+# Add parent directory to path so we can import modules from there
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import sim_logging # pylint: disable=C0413
+import socket_stuff # pylint: disable=C0413
+
+SLOW_CLIENT_DROP = "drop"
+SLOW_CLIENT_DISCONNECT = "disconnect"
+SLOW_CLIENT_POLICIES = (SLOW_CLIENT_DROP, SLOW_CLIENT_DISCONNECT)
+MAX_QUEUED_PACKETS = 64
+MAX_CONTROL_LINE = 1024  # bytes of a control line a subscriber may send before its newline
+
+LOGGER = sim_logging.get_logger("broadcaster")
+
+
+class Subscriber(): # pylint: disable=too-few-public-methods
+    """A connected subscriber, and the packets queued for it"""
+    __slots__ = ('conn', 'address', 'queue', 'events', 'sent', 'dropped', 'control_buffer')
+
+    def __init__(self, conn, address):
+        self.conn = conn
+        self.address = address
+        self.queue = collections.deque()  # memoryviews of what is left to send of each packet
+        self.events = selectors.EVENT_READ  # the events registered with the selector
+        self.sent = 0
+        self.dropped = 0
+        self.control_buffer = b''  # the control line received so far, up to its newline
+
+
+class PacketBroadcaster():
+    """Sends every packet given to sendall() to all subscribers, registered with a selector
+
+    The owner's event loop registers the listening socket with no data, calls accept() when it
+    is readable, and calls handle_event() for every other key it selects.
+    """
+
+    def __init__(self, selector, policy=SLOW_CLIENT_DROP, max_queued=MAX_QUEUED_PACKETS):
+        """
+        Args:
+            selector (selectors.BaseSelector): The selector of the owner's event loop
+            policy (str): The slow client policy, one of SLOW_CLIENT_POLICIES
+            max_queued (int): The most packets queued for a subscriber
+        """
+        self.selector = selector
+        self.policy = policy
+        self.max_queued = max_queued
+        self.subscribers = []
+        # Called with each control line a subscriber sends, without its newline
+        self.on_control = None
+
+    def accept(self, listening_socket):
+        """Accept a pending connection as a new subscriber"""
+        try:
+            conn, address = listening_socket.accept()
+        except BlockingIOError:
+            return
+        LOGGER.info("Subscriber connected: %s", address)
+        conn.setblocking(False)
+        subscriber = Subscriber(conn, address)
+        self.subscribers.append(subscriber)
+        self.selector.register(conn, selectors.EVENT_READ, subscriber)
+
+    def sendall(self, data):
+        """Queue a packet for every subscriber, and send as much of it as they will take now
+
+        Args:
+            data (bytes-like): The packet, which is copied once however many subscribers there are
+        """
+        if not self.subscribers:
+            return
+        packet = memoryview(bytes(data))
+        for subscriber in list(self.subscribers):
+            if len(subscriber.queue) >= self.max_queued:
+                if self.policy == SLOW_CLIENT_DISCONNECT:
+                    self.remove(subscriber, "too slow to keep up")
+                    continue
+                subscriber.dropped += 1
+                continue
+            subscriber.queue.append(packet)
+            self.flush(subscriber)
+
+    def flush(self, subscriber):
+        """Send the subscriber's queued packets until its socket would block"""
+        queue = subscriber.queue
+        try:
+            while queue:
+                sent = subscriber.conn.send(queue[0])
+                if sent < len(queue[0]):
+                    queue[0] = queue[0][sent:]
+                    break
+                queue.popleft()
+                subscriber.sent += 1
+        except BlockingIOError:
+            pass
+        except OSError as error_msg:
+            self.remove(subscriber, f"connection lost: {error_msg}")
+            return
+        # Only wait for the socket to be writable while there is something to write
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if queue else 0)
+        if events != subscriber.events:
+            subscriber.events = events
+            self.selector.modify(subscriber.conn, events, subscriber)
+
+    def handle_event(self, subscriber, mask):
+        """Service a subscriber the selector found readable or writable"""
+        if mask & selectors.EVENT_READ:
+            try:
+                data = subscriber.conn.recv(socket_stuff.RECV_BUFFER_SIZE)
+            except BlockingIOError:
+                data = None
+            except OSError as error_msg:
+                self.remove(subscriber, f"connection lost: {error_msg}")
+                return
+            if data == b'':
+                self.remove(subscriber, "disconnected")
+                return
+            if data:
+                self.receive_control(subscriber, data)
+                if subscriber not in self.subscribers:
+                    return
+        if mask & selectors.EVENT_WRITE:
+            self.flush(subscriber)
+
+    def receive_control(self, subscriber, data):
+        """Pass each control line a subscriber has now sent in full to the control handler"""
+        *lines, subscriber.control_buffer = (subscriber.control_buffer + data).split(b'\n')
+        if len(subscriber.control_buffer) > MAX_CONTROL_LINE:
+            self.remove(subscriber, "sent a control line that is too long")
+            return
+        if self.on_control is not None:
+            for line in lines:
+                self.on_control(line)
+
+    def remove(self, subscriber, reason):
+        """Disconnect a subscriber"""
+        if subscriber not in self.subscribers:
+            return
+        self.subscribers.remove(subscriber)
+        self.selector.unregister(subscriber.conn)
+        subscriber.conn.close()
+        LOGGER.info("Subscriber %s %s after %d packets, %d dropped", subscriber.address, reason,
+                    subscriber.sent, subscriber.dropped)
+
+    def close(self):
+        """Disconnect every subscriber"""
+        for subscriber in list(self.subscribers):
+            self.remove(subscriber, "closed")
+
+
+# pylint: disable=duplicate-code
+# no error
+__author__ = "Devin Headrick"
+__copyright__ = """
+    Copyright 2024 [Devin Headrick]
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License."""
@@ -0,0 +1,181 @@
+"""This module contains a receiver of the packets sent by the DFGM, for the OBC side test harness
+
+Packets are read with recv_into() straight into a preallocated receive buffer, however the socket
+delivers them: a stream socket may split a packet across reads, or join several into one. Each
+packet is found by its framing, then decoded with one call of the precompiled PACKET_STRUCT.
+
+A packet is only accepted when it starts with DLE and STX, has the expected Packet Length, has
+ETX before its CRC, and its CRC is valid. Anything else (e.g. the receiver connected part way
+through a packet, or bytes were corrupted) is skipped a byte at a time until the next DLE STX, so
+the receiver resynchronizes on its own.
+
+The receiver counts the packets accepted, the bytes skipped, the CRC failures and the gaps in the
+PIDs (packets lost by the sender or the link), and times decoding each packet (checking its CRC
+and unpacking it). report() summarises them.
+
+Usage:
+    receiver = PacketReceiver(sock)
+    for packet in receiver:
+        ...  # a DFGMPacket
+    print(receiver.report())
+
+Copyright 2024 [Devin Headrick]. Licensed under the Apache License, Version 2.0
+"""
+
+import time
+import dfgm_subsystem
+
+PACKET_SIZE = dfgm_subsystem.PACKET_STRUCT.size
+FRAME_START = bytes((dfgm_subsystem.default_packet["DLE"], dfgm_subsystem.default_packet["STX"]))
+ETX = dfgm_subsystem.default_packet["ETX"]
+ETX_OFFSET = dfgm_subsystem.CRC_OFFSET - 1
+LENGTH_OFFSET = 4
+BUFFER_PACKETS = 16 # Packets the receive buffer holds
+
+# Index of each part of the packet in the values PACKET_STRUCT unpacks
+HK_INDEX = 7
+MAG_DATA_INDEX = HK_INDEX + len(dfgm_subsystem.house_keeping_data)
+TRAILER_INDEX = MAG_DATA_INDEX + dfgm_subsystem.TOTAL_SAMPLES * len(
+    dfgm_subsystem.magnetic_field_tuple)
+
+
+class DFGMPacket(): # pylint: disable=too-many-instance-attributes,too-few-public-methods
+    """The fields of a received packet"""
+    __slots__ = ('pid', 'packet_type', 'packet_length', 'fs', 'pps_offset', 'hk_data',
+                 'mag_data', 'board_id', 'sensor_id', 'reserved', 'crc')
+
+    def __init__(self, values):
+        """
+        Args:
+            values (tuple): The values PACKET_STRUCT unpacks from the packet
+        """
+        (_, _, self.pid, self.packet_type, self.packet_length, self.fs,
+         self.pps_offset) = values[:HK_INDEX]
+        self.hk_data = values[HK_INDEX:MAG_DATA_INDEX]  # in the order of house_keeping_data
+        self.mag_data = values[MAG_DATA_INDEX:TRAILER_INDEX]  # 6 values per sample
+        self.board_id, self.sensor_id = values[TRAILER_INDEX:TRAILER_INDEX + 2]
+        self.reserved = values[TRAILER_INDEX + 2:-2]
+        self.crc = values[-1]
+
+
+class PacketReceiver(): # pylint: disable=too-many-instance-attributes
+    """Receives, checks and decodes the packets arriving on a socket"""
+
+    def __init__(self, sock, buffer_packets=BUFFER_PACKETS, clock=time.monotonic):
+        """
+        Args:
+            sock (socket): The connected socket, anything with a recv_into() method
+            buffer_packets (int): The packets the receive buffer holds, at least 2
+            clock (function): Returns the current time in seconds, monotonic
+        """
+        self.sock = sock
+        self.clock = clock
+        self.buffer = bytearray(max(buffer_packets, 2) * PACKET_SIZE)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # the first byte not yet consumed
+        self.end = 0    # the end of the bytes received
+
+        self.first_receive = None
+        self.last_pid = None
+        self.packets = 0
+        self.pid_gaps = 0
+        self.missing_packets = 0
+        self.skipped_bytes = 0
+        self.crc_failures = 0
+        self.decode_time = 0.0
+
+    def __iter__(self):
+        """Yields every packet received, until the sender disconnects"""
+        while True:
+            packet = self.next_buffered()
+            if packet is not None:
+                yield packet
+            elif not self.receive():
+                return
+
+    def receive(self):
+        """Reads whatever the socket has into the buffer, waiting for it if there is nothing
+
+        Returns:
+            int: The number of bytes read, 0 if the sender has disconnected
+        """
+        # Move what is left of a partial packet to the front once a whole packet no longer fits
+        # after it, so a packet is always contiguous and a datagram is never truncated
+        if len(self.buffer) - self.end < PACKET_SIZE:
+            remaining = self.end - self.start
+            self.view[:remaining] = self.view[self.start:self.end]
+            self.start, self.end = 0, remaining
+        count = self.sock.recv_into(self.view[self.end:])
+        if self.first_receive is None:
+            self.first_receive = self.clock()
+        self.end += count
+        return count
+
+    def next_buffered(self):
+        """Returns the next valid packet already in the buffer, or None if there is no whole one"""
+        buffer = self.buffer
+        while self.end - self.start >= PACKET_SIZE:
+            start = self.start
+            if (buffer[start] != FRAME_START[0] or buffer[start + 1] != FRAME_START[1]
+                    or buffer[start + ETX_OFFSET] != ETX
+                    or int.from_bytes(buffer[start + LENGTH_OFFSET:start + LENGTH_OFFSET + 2],
+                                      "little") != PACKET_SIZE):
+                self.resynchronize()
+                continue
+            decode_start = time.perf_counter()
+            values = dfgm_subsystem.PACKET_STRUCT.unpack_from(buffer, start)
+            if values[-1] != dfgm_subsystem.packet_crc(self.view[start:start + PACKET_SIZE]):
+                self.crc_failures += 1
+                self.resynchronize()
+                continue
+            packet = DFGMPacket(values)
+            self.decode_time += time.perf_counter() - decode_start
+            self.start += PACKET_SIZE
+            self.count_packet(packet.pid)
+            return packet
+        return None
+
+    def resynchronize(self):
+        """Skips to the next DLE STX after the start of the buffered bytes"""
+        found = self.buffer.find(FRAME_START, self.start + 1, self.end)
+        # A DLE as the last byte may be the start of a frame, so is kept
+        if found < 0:
+            found = self.end - 1 if self.buffer[self.end - 1] == FRAME_START[0] else self.end
+        self.skipped_bytes += found - self.start
+        self.start = found
+
+    def count_packet(self, pid):
+        """Counts a packet, and any gap between its PID and the previous packet's"""
+        if self.last_pid is not None:
+            missing = (pid - self.last_pid - 1) % 256  # the PID is a uint8
+            if missing:
+                self.pid_gaps += 1
+                self.missing_packets += missing
+        self.last_pid = pid
+        self.packets += 1
+
+    def report(self):
+        """Returns a line summarising the packets received, what was lost and the decode time"""
+        elapsed = self.clock() - self.first_receive if self.first_receive is not None else 0.0
+        rate = self.packets / elapsed if elapsed > 0 else 0.0
+        decode = self.decode_time / self.packets if self.packets else 0.0
+        return (f"{self.packets} packets at {rate:.1f} packets/s, {self.pid_gaps} PID gaps "
+                f"({self.missing_packets} packets missing), {self.crc_failures} CRC failures, "
+                f"{self.skipped_bytes} bytes skipped, decode {decode * 1e6:.1f} us/packet")
+
+
+# pylint: disable=duplicate-code
+# no error
+__author__ = "Devin Headrick"
+__copyright__ = """
+    Copyright 2024 [Devin Headrick]
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License."""
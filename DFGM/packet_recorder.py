@@ -0,0 +1,277 @@
+"""This module contains the recording of the DFGM packet stream, and its replay
+
+A recording is a directory of append-only segment files, each holding up to SEGMENT_PACKETS
+packets exactly as they were sent, and a side index per segment. The index has an entry per
+packet, all little endian:
+    time the packet was sent (seconds since the epoch, float64), offset of the packet in the
+    segment (uint64), length of the packet (uint32), PID (uint8), padding to 24 bytes
+Packets are never re-encoded: replay sends the recorded bytes straight from the segment files,
+with sendfile() on stream sockets, or from a memory map of the segment, one message per packet,
+on SOCK_SEQPACKET sockets.
+
+Replay keeps the recorded spacing of the packets, sped up by a factor (1x, Nx), or sends them as
+fast as the client takes them. It may start part way through a recording, at a time offset from
+its first packet and then at the first packet with a given PID.
+
+A recorder killed part way through writing a packet leaves it partly written, and it is ignored.
+Record each session into its own directory: recording into an existing directory continues it
+with new segments, and replay would wait out the time between the sessions.
+
+Copyright 2024 [Devin Headrick]. Licensed under the Apache License, Version 2.0
+"""
+
+import glob
+import mmap
+import os
+import socket
+import struct
+import time
+
+PID_OFFSET = 2 # of the uint8 PID in a DFGM packet
+SEGMENT_PACKETS = 3600 # An hour of packets at 1 Hz, about 4.5 MB
+SEGMENT_PATTERN = "segment-*.dfgm"
+INDEX_EXTENSION = ".idx"
+INDEX_STRUCT = struct.Struct("<dQIB3x")
+
+
+def segment_paths(directory):
+    """Returns the paths of the segment files in a recording, in the order they were recorded"""
+    return sorted(glob.glob(os.path.join(glob.escape(directory), SEGMENT_PATTERN)))
+
+
+class PacketRecorder():
+    """Appends every packet given to record() to a recording"""
+
+    def __init__(self, directory, segment_packets=SEGMENT_PACKETS, clock=time.time):
+        """
+        Args:
+            directory (str): The directory of the recording, created if it does not exist
+            segment_packets (int): The most packets in a segment
+            clock (function): Returns the current time in seconds since the epoch
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_packets = segment_packets
+        self.clock = clock
+        # Existing segments are never written to again
+        self.segment_number = len(segment_paths(directory))
+        self.data_file = None
+        self.index_file = None
+        self.count = 0  # packets in the current segment
+
+    def record(self, packet):
+        """Appends a packet, and its index entry, to the current segment
+
+        Args:
+            packet (bytes-like): The packet, as sent
+        """
+        if self.data_file is None or self.count >= self.segment_packets:
+            self.open_segment()
+        offset = self.data_file.tell()
+        self.data_file.write(packet)
+        self.index_file.write(INDEX_STRUCT.pack(self.clock(), offset, len(packet),
+                                                packet[PID_OFFSET]))
+        self.count += 1
+
+    def open_segment(self):
+        """Closes the current segment, and starts the next"""
+        self.close()
+        path = os.path.join(self.directory, f"segment-{self.segment_number:06d}.dfgm")
+        # Unbuffered, so every packet is in the recording as soon as it is sent, even if the
+        # simulator is killed
+        self.data_file = open(path, "ab", buffering=0) # pylint: disable=consider-using-with
+        self.index_file = open(path + INDEX_EXTENSION, "ab", # pylint: disable=consider-using-with
+                               buffering=0)
+        self.segment_number += 1
+        self.count = 0
+
+    def close(self):
+        """Closes the current segment"""
+        if self.data_file is not None:
+            self.data_file.close()
+            self.index_file.close()
+            self.data_file = self.index_file = None
+
+
+class Segment():
+    """A segment of a recording, and its index, memory mapped read-only"""
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): The path of the segment file
+        """
+        self.data_file = open(path, "rb") # pylint: disable=consider-using-with
+        self.data = map_file(self.data_file)
+        with open(path + INDEX_EXTENSION, "rb") as index_file:
+            self.index = map_file(index_file)
+        # A packet cut short when the recorder stopped is left out
+        self.count = len(self.index) // INDEX_STRUCT.size
+        while self.count and self.end(self.count - 1) > len(self.data):
+            self.count -= 1
+
+    def entry(self, position):
+        """Returns the time, offset, length and PID of a packet"""
+        return INDEX_STRUCT.unpack_from(self.index, position * INDEX_STRUCT.size)
+
+    def time(self, position):
+        """Returns the time a packet was sent"""
+        return self.entry(position)[0]
+
+    def offset(self, position):
+        """Returns the offset of a packet in the segment file"""
+        return self.entry(position)[1]
+
+    def end(self, position):
+        """Returns the offset of the end of a packet in the segment file"""
+        _, offset, length, _ = self.entry(position)
+        return offset + length
+
+    def find_time(self, target, after=False):
+        """Returns the position of the first packet sent at or after a time (only after it, if
+        after is True), or count if there is none
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.time(middle) <= target if after else self.time(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def send(self, sock, start, end):
+        """Sends packets start to end (exclusive) of the segment through a socket, unchanged"""
+        if sock.type != socket.SOCK_STREAM:
+            # Each packet must be a message of its own
+            for position in range(start, end):
+                sock.sendall(self.data[self.offset(position):self.end(position)])
+            return
+        offset = self.offset(start)
+        sock.sendfile(self.data_file, offset, self.end(end - 1) - offset)
+
+    def close(self):
+        """Unmaps and closes the segment"""
+        self.data.release()
+        self.index.release()
+        self.data_file.close()
+
+
+def map_file(file):
+    """Returns a read-only memoryview of a whole file, which is empty if the file is"""
+    if os.fstat(file.fileno()).st_size == 0:
+        return memoryview(b'')
+    return memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+class Recording():
+    """The packets of a recording, for replay"""
+
+    def __init__(self, directory):
+        """
+        Args:
+            directory (str): The directory of the recording
+
+        Raises:
+            FileNotFoundError: The directory holds no recorded packets
+        """
+        self.segments = []
+        for path in segment_paths(directory):
+            segment = Segment(path)
+            if segment.count:
+                self.segments.append(segment)
+            else:
+                segment.close()
+        if not self.segments:
+            raise FileNotFoundError(f"No recorded packets in {directory}")
+
+    def __len__(self):
+        return sum(segment.count for segment in self.segments)
+
+    def duration(self):
+        """Returns the seconds between the first and the last packet"""
+        return self.segments[-1].time(self.segments[-1].count - 1) - self.segments[0].time(0)
+
+    def seek(self, start=0.0, pid=None):
+        """Finds where replay starting at a time, and optionally a PID, begins
+
+        Args:
+            start (float): Seconds after the first packet
+            pid (int): Begin at the first packet with this PID from the start time, if not None
+
+        Returns:
+            tuple: The index of the segment and the position in it of the first packet, or None
+                if no packet matches
+        """
+        target = self.segments[0].time(0) + start
+        for segment_index, segment in enumerate(self.segments):
+            if segment.time(segment.count - 1) < target:
+                continue
+            position = segment.find_time(target)
+            target = float("-inf")  # every later packet is after the start time
+            if pid is None:
+                return segment_index, position
+            for position in range(position, segment.count):
+                if segment.entry(position)[3] == pid:
+                    return segment_index, position
+        return None
+
+    def replay(self, sock, speed=None, start=0.0, pid=None):
+        """Sends the recorded packets through a socket, with their recorded spacing
+
+        Args:
+            sock (socket): A connected, blocking socket
+            speed (float): How many times faster than recorded to send the packets, or None to
+                send them as fast as the client takes them
+            start (float): Seconds after the first packet to start at
+            pid (int): Start at the first packet with this PID from the start time, if not None
+
+        Returns:
+            int: The number of packets sent
+        """
+        found = self.seek(start, pid)
+        if found is None:
+            return 0
+        segment_index, position = found
+        first_time = self.segments[segment_index].time(position)
+        started = time.monotonic()
+        sent = 0
+        for segment in self.segments[segment_index:]:
+            while position < segment.count:
+                end = segment.count
+                if speed is not None:
+                    # Wait for the next packet, then send it with every other packet now due
+                    now = time.monotonic()
+                    due = started + (segment.time(position) - first_time) / speed
+                    if due > now:
+                        time.sleep(due - now)
+                        now = time.monotonic()
+                    end = segment.find_time(first_time + (now - started) * speed, after=True)
+                    end = max(end, position + 1)
+                segment.send(sock, position, end)
+                sent += end - position
+                position = end
+            position = 0
+        return sent
+
+    def close(self):
+        """Unmaps and closes every segment"""
+        for segment in self.segments:
+            segment.close()
+
+
+# pylint: disable=duplicate-code
+# no error
+__author__ = "Devin Headrick"
+__copyright__ = """
+    Copyright 2024 [Devin Headrick]
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License."""
@@ -25,21 +25,33 @@ Until we know more system specs I am assuming there are 2 types of commands that
 # Example requesting the state of the DFGM feedback switch
     SWITCH_REQUEST_COMMAND:DFGM
 
+# Example requesting several feedback switches in one round-trip (responses are returned together)
+    batch:SWITCH_REQUEST_COMMAND:DFGM|SWITCH_REQUEST_COMMAND:UHF_P
+
+Commands may also be sent binary encoded after a 0x02 handshake byte (see command_handler). The
+opcodes are 0 HELP, 1 BURNWIRE_SET_COMMAND and 2 SWITCH_REQUEST_COMMAND, with the deployable sent
+as its index in the state dictionary below, e.g. the bytes 02 01 00 02 00 request the DFGM switch.
+
 For now you can test your commands using netcat (nc) from the command line, and piping the command
 to the socket from a seperate text file. I have also added a brief bash script to test this program.
 
-Usage: deployables_subsystem.py
+Usage: deployables_subsystem.py [port] [--unix PATH]
 
 Copyright 2023 [Devin Headrick]. Licensed under the Apache License, Version 2.0
 """
 
+import argparse
+import os
 import sys
 import threading
 import random
 
-sys.path.append('../') # Add parent directory to path so we can import modules from there
+# Add parent directory to path so we can import modules from there
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 import socket_stuff # pylint: disable=C0413
 import command_handler # pylint: disable=C0413
+import power_table # pylint: disable=C0413
+import sim_logging # pylint: disable=C0413
 
 
 DEFAULT_HOST = '127.0.0.1'
@@ -52,6 +64,8 @@ SWITCH_REQUEST_COMMAND = "switch_request"
 BURNWIRE_PIN = "burnwire_pin"
 SWITCH_PIN = "switch_pin"
 
+LOGGER = sim_logging.get_logger("Deployables")
+
 
 # Each of the following pins variables represents a gpio.
 # 0 = LOW, 1 = HIGH
@@ -119,7 +133,7 @@ def simulate_deployable(deployable_component, burnwire_pin_value):
 
     #If burnwire pin is being set low
     deployables_state[deployable_component][BURNWIRE_PIN] = 0
-    return "Burnwire for {deployable_component} set low \0"
+    return f"Burnwire for {deployable_component} set low \0"
 
 
 def set_switch_pin_high(deployable_component):
@@ -136,80 +150,59 @@ def set_switch_pin_high(deployable_component):
     # If the burnwire pin is still high, set the switch pin high
     if deployables_state[deployable_component][BURNWIRE_PIN] == 1:
         deployables_state[deployable_component][SWITCH_PIN] = 1
-        print(f"Burnwire sim timer end. \
-              Switch pin set HIGH for {deployable_component}", flush=True)
+        LOGGER.info("Burnwire sim timer end. Switch pin set HIGH for %s", deployable_component)
     else:
-        print(f"Burnwire sim timer end. \
-              Switch pin left LOW for {deployable_component}", flush=True)
-
-
-class SetBurnwireCommand():  # pylint: disable=too-few-public-methods
-    """Execute a 'BURNWIRE_SET_COMMAND' type command to set a GPIO pin to HIGH or LOW"""
+        LOGGER.info("Burnwire sim timer end. Switch pin left LOW for %s", deployable_component)
 
-    def execute(self, params=None):
-        """
-        Args:
-            params (list): Name of the burnwire pin to set, and the value to set it to
 
-        Returns:
-            (str): A string indicating the burnwire setting, or an ERROR message
-        """
+def request_switch(deployable_component):
+    """Get the current value of a deployable's feedback switch GPIO pin
 
-        if params and len(params) == 2 and params[0] in deployables_state:
-            deployable_component = params[0]
-            burnwire_pin_value = params[1]
-            return simulate_deployable(deployable_component, int(burnwire_pin_value))
-        return "ERROR: Invalid burnwire set command \0"
-
-class RequestSwitchCommand():  # pylint: disable=too-few-public-methods
-    """Execute a 'SWITCH_REQUEST_COMMAND' type command to get the current value of a GPIO pin"""
-
-    def execute(self, params=None):
-        """
-        Args:
-            params (list): Name of the state parameter to request
+    Args:
+        deployable_component (str): The name of the deployable component to request
 
-        Returns:
-            str: A string containing the request parameter value, or an ERROR message
-        """
+    Returns:
+        str: A string containing the requested switch pin value
+    """
 
-        if params and len(params) == 1 and params[0] in deployables_state:
-            deployable_component = params[0]
-            return f"{params[0]}:{deployables_state[deployable_component][SWITCH_PIN]}\0"
-        return "ERROR: Invalid switch request command \0"
+    return f"{deployable_component}:{deployables_state[deployable_component][SWITCH_PIN]}\0"
 
 
 class DeployablesCommandFactory(command_handler.CommandFactory):  # pylint: disable=too-few-public-methods
-    """Extends abstract CommandFactory class to create command objects based on command type"""
-
-    def create_command(self, command_type):
-        """Create a command object based on the command type
-        Args:
-            command_type (str): The type of command to be created
+    """Extends CommandFactory class, registering the commands supported by the deployables"""
+    response_terminator = "\0"
+    power_switch = power_table.PowerSwitch("Deployables")
 
-        Returns:
-            Command: A command object of the associated command type
-        """
+    def __init__(self):
+        super().__init__()
+        deployable_arg = ("deployable", command_handler.one_of(deployables_state))
 
-        if command_type == BURNWIRE_SET_COMMAND:
-            return SetBurnwireCommand()
-        if command_type == SWITCH_REQUEST_COMMAND:
-            return RequestSwitchCommand()
-        return None
+        self.register_command(BURNWIRE_SET_COMMAND, simulate_deployable,
+                              (deployable_arg, ("value", int)),
+                              "Set a burnwire GPIO pin HIGH (1) or LOW (0)",
+                              "ERROR: Invalid burnwire set command \0")
+        self.register_command(SWITCH_REQUEST_COMMAND, request_switch,
+                              (deployable_arg,),
+                              "Get the value of a feedback switch GPIO pin",
+                              "ERROR: Invalid switch request command \0")
 
 
 if __name__ == "__main__":
-    # If there is no arg, port is default otherwise use the arg
-    PORT = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PORT
+    parser = argparse.ArgumentParser(description="Simulated Deployables subsystem")
+    # If there is no port arg, port is default otherwise use the arg
+    socket_stuff.add_address_arguments(parser, DEFAULT_PORT)
+    args = parser.parse_args()
 
-    print(f"\nStarting Deployables subsystem on port {PORT}\n", flush=True)
+    sim_logging.configure_logging()
+    LOGGER.info("Starting Deployables subsystem on %s", args.unix_path or f"port {args.port}")
 
     command_factory = DeployablesCommandFactory()
 
     # Pass the command factory concrete implementation into the command handler
     command_handler = command_handler.CommandHandler(command_factory)
 
-    socket_stuff.create_socket_and_listen(DEFAULT_HOST, PORT, command_handler)
+    socket_stuff.create_socket_and_listen(DEFAULT_HOST, args.port, command_handler,
+                                          args.unix_path)
 
 
 # pylint: disable=duplicate-code
@@ -1,10 +1,51 @@
-"""This python program represents a simulated version of the EPS payload for ExAlta3."""
+"""This python program represents a simulated version of the EPS payload for ExAlta3.
+
+The EPS is served by the shared command handler, so any number of clients (e.g. the OBC power
+manager, ground test tooling and other simulators) may be connected at once. Commands are
+terminated by a newline and may be pipelined; each response is a line. Commands from every client
+read and change the EPS state under its lock, so concurrent updates stay consistent. Clients
+watching the state may subscribe to samples of it pushed at a fixed rate instead of polling
+(see subscriptions.py).
+
+Which subsystems are powered is published in a shared power table (see power_table.py), when
+the EPS is given one with --power-table or SIM_POWER_TABLE. The other simulators run with
+SIM_POWER_TABLE set to the same path check it, so a subsystem the EPS turns off stops responding.
+
+Voltage, Current, Temperature, BatteryState and BatteryCharge come from a power model (see
+power_model.py) that runs on a simulation clock. The 'fastforward' command jumps the clock ahead,
+so the power over many orbits can be tested without waiting for them.
+
+Timed events run on the same clock from one scheduler (see sim_scheduler.py): the watchdog, which
+resets the EPS and power-cycles its subsystems unless the OBC kicks it every WatchdogResetTime
+hours, delayed subsystem power-ups and power-downs, and brown-outs. The --time-scale option runs
+the clock faster than real time, so e.g. a 24 hour watchdog can be tested in seconds.
+"""
+import argparse
+import json
+import math
+import os
 import sys
-import socket
+import threading
+import power_model
+import telemetry_history
+
+# Add parent directory to path so we can import modules from there
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import command_handler # pylint: disable=C0413
+import power_table # pylint: disable=C0413
+import sim_clock # pylint: disable=C0413
+import sim_logging # pylint: disable=C0413
+import sim_scheduler # pylint: disable=C0413
+import socket_stuff # pylint: disable=C0413
 
 DEFAULT_HOST = '127.0.0.1'
 DEFAULT_PORT = 1801
-COMMAND_DELIMITER = ':'
+INVALID_COMMAND_FORMAT = "Invalid command format"
+# Responses recorded as errors in the command statistics
+ERROR_RESPONSES = frozenset(("Unknown parameter", "Unknown command", "Invalid subsystem",
+                             INVALID_COMMAND_FORMAT))
+
+LOGGER = sim_logging.get_logger("EPS")
 
 default_eps_state = {
     'EPSState' : 'ON',
@@ -12,9 +53,15 @@ default_eps_state = {
     'Voltage': 5.24,             # in volts
     'Current': 1.32,             # in amps
     'BatteryState': 'Charging',
-    'WatchdogResetTime': 24.0,   # in hours
+    'BatteryCharge': 80.0,       # in percent
+    'WatchdogResetTime': 24.0,   # in hours, counting down to the watchdog resetting the EPS
 }
 
+# Parameters computed by the power model. Updating Voltage or Current pins them to the value
+# given until the device is reset, while updating the others sets the model's state
+MODELLED_PARAMETERS = ('Voltage', 'Current', 'Temperature', 'BatteryState', 'BatteryCharge')
+PINNABLE_PARAMETERS = ('Voltage', 'Current')
+
 default_subsystem_state = {
     'ADCS': False,
     'Deployables': False,
@@ -26,53 +73,321 @@ default_subsystem_state = {
     'UHFBurnWireGPIO': False
 }
 
-class EPSSubsystem:
+HISTORY_INTERVAL = 10.0   # simulation seconds between samples of the telemetry history
+HISTORY_CAPACITY = 25920  # samples kept, three days at HISTORY_INTERVAL
+MAX_HISTORY_POINTS = 1000
+# BatteryState is stored in the history as its index in this tuple
+BATTERY_STATES = ('Empty', 'Discharging', 'Charging', 'Full')
+# Columns of the history and their array typecodes: the modelled values as float32, and
+# BatteryState and the power flag of each subsystem as a byte
+HISTORY_COLUMNS = {
+    'Voltage': 'f',
+    'Current': 'f',
+    'Temperature': 'f',
+    'BatteryCharge': 'f',
+    'BatteryState': 'B',
+    **dict.fromkeys(default_subsystem_state, 'B'),
+}
+
+WATCHDOG_POWER_CYCLE_TIME = 5.0  # simulation seconds subsystems are off for on a watchdog reset
+
+class EPSSubsystem: # pylint: disable=too-many-instance-attributes
     """Handles EPS subsystem state and command execution."""
 
-    def __init__(self):
+    def __init__(self, clock=None, power_table_path=None):
+        """
+        Args:
+            clock (SimClock): The simulation clock the power model runs on, a new one if None
+            power_table_path (str): The path of the power table published, that of
+                SIM_POWER_TABLE if None, or "" for none
+        """
         self.state = default_eps_state.copy()
         self.subsystems = default_subsystem_state.copy()
         self.eps_on = True
+        # Held while reading or changing the state, which clients share
+        self.lock = threading.RLock()
+        self.clock = clock or sim_clock.SimClock()
+        self.power = power_model.PowerModel(default_eps_state['BatteryCharge'] / 100,
+                                            default_eps_state['Temperature'])
+        self.pinned = {}  # modelled parameters pinned to a value by an update
+        self.power_table = power_table.PowerTable(power_table_path)
+        self.history = telemetry_history.TelemetryHistory(HISTORY_CAPACITY, HISTORY_COLUMNS)
+        self.history_tick = 0  # the number of HISTORY_INTERVAL ticks sampled so far
+        # The time the model is being advanced to, past any timed events run on the way there
+        self.history_horizon = 0.0
+        # Timed events run under the state lock, so they are serialized with every command
+        self.scheduler = sim_scheduler.SimScheduler(self.clock, self.lock)
+        self.watchdog_period = default_eps_state['WatchdogResetTime']  # in hours
+        self.watchdog_event = None
+        # The subsystems each power cycle under way will turn back on
+        self.pending_restores = []
+        self.apply_power_states()
+        self.kick_watchdog(self.clock.now())
+        self.update_power_model()
+        self.scheduler.start()
+
+    def update_power_model(self):
+        """Advance the power model to the current simulation time, sampling the history on the
+        way, and copy its outputs to the state. Called before the state is read or changed, so the
+        load up to now is accounted for. Any timed events due by now are run first, in order
+        """
+        now = self.clock.now()
+        self.history_horizon = now
+        self.scheduler.run_due(now)
+        self.advance_model(now)
+        self.state.update(self.modelled_state())
+        self.state['WatchdogResetTime'] = round(
+            max(self.watchdog_event.due - self.power.time, 0.0) / 3600, 4)
+
+    def advance_model(self, now):
+        """Advance the power model to a time, sampling the history on the way. Timed events call
+        this with their due time before changing the load, rather than update_power_model()
+        """
+        self.sample_history(now)
+        self.power.advance_to(now)
+
+    def modelled_state(self):
+        """Returns the modelled parameters at the power model's time, with any pinned values"""
+        modelled = {
+            'Voltage': round(self.power.voltage(), 3),
+            'Current': round(self.power.current(), 3),
+            'Temperature': round(self.power.temperature, 2),
+            'BatteryState': self.power.battery_state(),
+            'BatteryCharge': round(self.power.state_of_charge * 100, 2),
+        }
+        modelled.update(self.pinned)
+        return modelled
+
+    def sample_history(self, now):
+        """Advance the power model through every history tick up to a time, sampling each
 
-    def handle_command(self, command):
-        """Handles commands"""
-        parts = command.strip().split(COMMAND_DELIMITER)
-        cmd_type = parts[0].lower()
+        Args:
+            now (float): The simulation time to sample up to
+        """
+        last_tick = math.floor(now / HISTORY_INTERVAL)
+        if self.history_tick > last_tick:
+            return
+        # Only the latest ticks up to the horizon fit in the history, so the model skips
+        # straight to the first of them, even when timed events stop it short of the horizon
+        horizon_tick = math.floor(max(self.history_horizon, now) / HISTORY_INTERVAL)
+        first_tick = max(self.history_tick, horizon_tick - HISTORY_CAPACITY + 1)
+        powered = {subsystem: self.eps_on and on for subsystem, on in self.subsystems.items()}
 
-        if cmd_type == "request" and len(parts) == 2:
-            return str(self.state.get(parts[1], "Unknown parameter"))
+        for tick in range(first_tick, last_tick + 1):
+            self.power.advance_to(tick * HISTORY_INTERVAL)
+            sample = self.modelled_state()
+            sample['BatteryState'] = BATTERY_STATES.index(sample['BatteryState'])
+            sample.update(powered)
+            self.history.append(tick * HISTORY_INTERVAL, sample)
+        self.history_tick = last_tick + 1
 
-        if cmd_type == "update" and len(parts) == 3:
-            value = parts[2]
-            if value.replace('.', '', 1).isdigit():
-                value = float(value)
-                self.state[parts[1]] = value
-                return f"{parts[1]} updated to {self.state[parts[1]]}"
+    def query_history(self, parameter, start_time, end_time, max_points):
+        """Handles range queries of the telemetry history
+
+        Args:
+            parameter (str): A modelled parameter, or a subsystem for its power flag
+            start_time (float): The start of the range, in simulation seconds
+            end_time (float): The end of the range, in simulation seconds
+            max_points (int): The number of points the range is downsampled to
+
+        Returns:
+            str: The [time, min, max, mean] of each point as a line of JSON, or an error
+        """
+        if parameter not in self.history.columns:
             return "Unknown parameter"
+        # A finite span also rules out infinite and NaN bounds, whose buckets have no width
+        if not (0 < max_points <= MAX_HISTORY_POINTS and start_time <= end_time
+                and end_time - start_time < float("inf")):
+            return INVALID_COMMAND_FORMAT
+        self.update_power_model()
+        points = self.history.query(parameter, start_time, end_time, max_points)
+        return json.dumps({
+            "parameter": parameter,
+            "points": [[round(value, 4) for value in point] for point in points],
+        }, separators=(',', ':'))
+
+    def apply_power_states(self):
+        """Set the load on the power model from the EPS and subsystem power states, and publish
+        them to the power table the other simulators obey
+        """
+        self.power.set_load(self.eps_on, self.subsystems)
+        self.power_table.publish({subsystem: self.eps_on and powered
+                                  for subsystem, powered in self.subsystems.items()})
+
+    def kick_watchdog(self, now):
+        """Restart the watchdog countdown from a simulation time"""
+        if self.watchdog_event is not None:
+            self.watchdog_event.cancel()
+        self.watchdog_event = self.scheduler.schedule(now + self.watchdog_period * 3600,
+                                                      self.watchdog_expired)
+
+    def reset_device(self, now):
+        """Reset the state to its defaults, keeping the watchdog period, and kick the watchdog"""
+        self.state = default_eps_state.copy()
+        self.pinned.clear()
+        self.kick_watchdog(now)
+
+    def watchdog_expired(self, due):
+        """Timed event: the OBC did not kick the watchdog in time, so reset the EPS and
+        power-cycle every subsystem that was on
+        """
+        self.advance_model(due)
+        LOGGER.warning("Watchdog expired at %.1f s, resetting the EPS", due)
+        self.reset_device(due)
+        self.power_cycle(due, WATCHDOG_POWER_CYCLE_TIME)
 
-        if cmd_type == "execute" and len(parts) == 2:
-            return self.execute_command(parts[1])
-        if cmd_type == "execute" and len(parts) == 3:
-            return self.subsystem_commands(parts[1],parts[2])
+    def power_cycle(self, now, off_time):
+        """Turn off every powered subsystem, and schedule turning them back on
 
-        return "Invalid command format"
+        Args:
+            now (float): The simulation time the power goes off, which the model is at
+            off_time (float): The simulation seconds the subsystems stay off for
+
+        Returns:
+            list: The subsystems turned off
+        """
+        powered = [subsystem for subsystem, on in self.subsystems.items() if on]
+        for subsystem in powered:
+            self.subsystems[subsystem] = False
+        self.apply_power_states()
+        if powered:
+            restore = set(powered)
+            self.pending_restores.append(restore)
+            self.scheduler.schedule(now + off_time, self.restore_power, restore)
+        return powered
+
+    def restore_power(self, due, subsystems):
+        """Timed event: turn subsystems back on after a power cycle, except those switched off
+        since it began
+        """
+        self.advance_model(due)
+        self.pending_restores.remove(subsystems)
+        for subsystem in subsystems:
+            self.subsystems[subsystem] = True
+        self.apply_power_states()
+
+    def switch_off(self, subsystems):
+        """Record subsystems being switched off by a command or delayed event, so no power
+        cycle under way turns them back on
+        """
+        for subsystem in subsystems:
+            for restore in self.pending_restores:
+                restore.discard(subsystem)
+
+    def switch_subsystem(self, due, subsystem, powered):
+        """Timed event: turn a subsystem on or off, if the EPS is on"""
+        self.advance_model(due)
+        if not self.eps_on:
+            return
+        self.subsystems[subsystem] = powered
+        if not powered:
+            self.switch_off((subsystem,))
+        self.apply_power_states()
+
+    def brown_out(self, duration):
+        """Handles brown-outs, cutting the power of every subsystem for a number of seconds"""
+        try:
+            duration = float(duration)
+        except ValueError:
+            return INVALID_COMMAND_FORMAT
+        if not 0 < duration < float("inf"):
+            return INVALID_COMMAND_FORMAT
+        if self.eps_on is False:
+            return "EPS is off"
+        self.update_power_model()
+        powered = self.power_cycle(self.power.time, duration)
+        return f"Brown-out of {duration:g} s, {len(powered)} subsystems turned OFF"
+
+    def delayed_subsystem_command(self, command, subsystem, delay):
+        """Handles turning a subsystem on or off after a number of seconds"""
+        if subsystem not in self.subsystems:
+            return "Invalid subsystem"
+        if command not in ("SubsystemOn", "SubsystemOff"):
+            return "Unknown command"
+        try:
+            delay = float(delay)
+        except ValueError:
+            return INVALID_COMMAND_FORMAT
+        if not 0 <= delay < float("inf"):
+            return INVALID_COMMAND_FORMAT
+        self.update_power_model()
+        powered = command == "SubsystemOn"
+        self.scheduler.schedule(self.power.time + delay, self.switch_subsystem, subsystem,
+                                powered)
+        return f"{subsystem} turns {'ON' if powered else 'OFF'} in {delay:g} s"
+
+    def request_parameter(self, parameter):
+        """Handles requests for the value of a parameter"""
+        self.update_power_model()
+        return str(self.state.get(parameter, "Unknown parameter"))
+
+    def update_parameter(self, parameter, value):
+        """Handles updates of a parameter to a numeric value"""
+        if not value.replace('.', '', 1).isdigit():
+            return "Unknown parameter"
+        self.update_power_model()
+        value = float(value)
+        if parameter in PINNABLE_PARAMETERS:
+            self.pinned[parameter] = value
+        elif parameter == 'Temperature':
+            self.power.temperature = value
+        elif parameter == 'BatteryCharge':
+            self.power.state_of_charge = min(value, 100.0) / 100
+        elif parameter == 'BatteryState':
+            return "Unknown parameter"
+        elif parameter == 'WatchdogResetTime':
+            if value <= 0:
+                return INVALID_COMMAND_FORMAT
+            self.watchdog_period = value
+            self.kick_watchdog(self.power.time)
+        else:
+            self.state[parameter] = value
+        self.update_power_model()
+        return f"{parameter} updated to {self.state[parameter]}"
+
+    def fast_forward(self, seconds):
+        """Jump the simulation clock ahead, advancing the power model over the skipped time
+
+        Args:
+            seconds (float): The number of simulated seconds to skip
+
+        Returns:
+            str: The response to the command
+        """
+        self.update_power_model()
+        now = self.clock.advance(seconds)
+        self.update_power_model()
+        # The scheduler thread is sleeping until the next event's old real time
+        self.scheduler.wake()
+        return f"Fast-forwarded to {now:.1f} s"
 
     def execute_command(self, command):
         """Handles all executable commands"""
+        self.update_power_model()
         if command == "ResetDevice":
-            self.state = default_eps_state.copy()
+            self.reset_device(self.power.time)
+            self.update_power_model()
             return "Device reset to default state"
+        if command == "KickWatchdog":
+            self.kick_watchdog(self.power.time)
+            self.update_power_model()
+            return f"Watchdog kicked, resets in {self.watchdog_period} h"
         if command == "ResetSubsystems":
             if self.eps_on is True:
                 self.subsystems = default_subsystem_state.copy()
+                self.switch_off(subsystem for subsystem, on in self.subsystems.items() if not on)
+                self.apply_power_states()
             return "EPS is off" if not self.eps_on else "Subsystems reset to default state"
         if command == "TurnOnEPS":
             self.eps_on = True
             self.state["EPSState"] = "ON"
+            self.apply_power_states()
             return "EPS turned ON"
         if command == "TurnOffEPS":
             self.eps_on = False
             self.state["EPSState"] = "OFF"
+            self.switch_off(self.subsystems)
+            self.apply_power_states()
             return "EPS turned OFF"
         return "Unknown command"
     def subsystem_commands(self,command,subsystem):
@@ -81,44 +396,138 @@ class EPSSubsystem:
             return "EPS is off. Turn on EPS to execute subsystem commands"
         if subsystem not in self.subsystems:
             return "Invalid subsystem"
+        self.update_power_model()
         if command == "SubsystemOn":
             self.subsystems[subsystem] = True
+            self.apply_power_states()
             return f"{subsystem} turned ON"
         if command == "SubsystemOff":
             self.subsystems[subsystem] = False
+            self.switch_off((subsystem,))
+            self.apply_power_states()
             return f"{subsystem} turned OFF"
         if command == "SubsystemState":
             return f"{subsystem} is ON" if self.subsystems[subsystem] else f"{subsystem} is OFF"
         return "Unknown command"
 
+
+class EPSCommandFactory(command_handler.CommandFactory):
+    """Registers the commands of the EPS, each run on the EPS under its lock
+
+    Command types are case insensitive, and every response is a single line. Every parameter
+    may be subscribed to, with samples timestamped in simulation time.
+    """
+    invalid_command_response = INVALID_COMMAND_FORMAT + "\n"
+    telemetry_parameters = tuple(default_eps_state)
+
+    def __init__(self, eps):
+        super().__init__()
+        self.eps = eps
+        self.register_command("request", self.command_request, (("parameter", str),),
+                              "Get the current value of a parameter",
+                              self.invalid_command_response)
+        self.register_command("update", self.command_update,
+                              (("parameter", str), ("value", str)),
+                              "Set a parameter to a numeric value",
+                              self.invalid_command_response)
+        self.register_command("execute", self.command_execute,
+                              (("command", command_handler.Repeated(str)),),
+                              "Run a device command, a subsystem command on a subsystem "
+                              "(e.g. execute:SubsystemOn:GPS), optionally after a delay in "
+                              "seconds (execute:SubsystemOn:GPS:30), or a brown-out "
+                              "(execute:BrownOut:<seconds>)",
+                              self.invalid_command_response)
+        self.register_command("history", self.command_history,
+                              (("parameter", str), ("start", float), ("end", float),
+                               ("max_points", int)),
+                              "Get the min/max/mean of a parameter over a range of simulation "
+                              "time, downsampled to at most max_points",
+                              self.invalid_command_response)
+        self.register_command("fastforward", self.command_fastforward, (("seconds", float),),
+                              "Jump the simulation clock ahead by a number of seconds",
+                              self.invalid_command_response)
+
+    def create_command(self, command_type):
+        """Get the registered command object for a command type, ignoring its case"""
+        return self.commands.get(command_type) or self.commands.get(command_type.lower())
+
+    def keyword(self, command_type):
+        """EPS commands are case insensitive, the handler's keywords included"""
+        return command_type.lower()
+
+    def is_error_response(self, response):
+        """Whether a response is one of the EPS error responses"""
+        return response.rstrip("\n") in ERROR_RESPONSES
+
+    def read_telemetry(self, parameters):
+        """Read the current values of parameters, at the current simulation time"""
+        with self.eps.lock:
+            self.eps.update_power_model()
+            return self.eps.power.time, [self.eps.state[parameter] for parameter in parameters]
+
+    def command_request(self, parameter):
+        """Get the current value of a parameter"""
+        with self.eps.lock:
+            return self.eps.request_parameter(parameter) + "\n"
+
+    def command_update(self, parameter, value):
+        """Set a parameter to a numeric value"""
+        LOGGER.debug("Update command received: %s", parameter)
+        with self.eps.lock:
+            return self.eps.update_parameter(parameter, value) + "\n"
+
+    def command_execute(self, *command):
+        """Run a device command (one arg), a subsystem command on a subsystem (two args) or
+        after a delay (three args), or a brown-out for a duration"""
+        LOGGER.debug("Execute command received: %s", command)
+        with self.eps.lock:
+            if len(command) == 1:
+                return self.eps.execute_command(command[0]) + "\n"
+            if len(command) == 2 and command[0] == "BrownOut":
+                return self.eps.brown_out(command[1]) + "\n"
+            if len(command) == 2:
+                return self.eps.subsystem_commands(*command) + "\n"
+            if len(command) == 3:
+                return self.eps.delayed_subsystem_command(*command) + "\n"
+        return self.invalid_command_response
+
+    def command_history(self, parameter, start, end, max_points):
+        """Get the min/max/mean of a parameter over a range of simulation time"""
+        with self.eps.lock:
+            return self.eps.query_history(parameter, start, end, max_points) + "\n"
+
+    def command_fastforward(self, seconds):
+        """Jump the simulation clock ahead by a number of seconds"""
+        if not 0 <= seconds < float("inf"):
+            return self.invalid_command_response
+        with self.eps.lock:
+            return self.eps.fast_forward(seconds) + "\n"
+
 if __name__ == "__main__":
-    PORT = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
-
-    print(f"Starting EPS subsystem on port {PORT}")
-
-    eps = EPSSubsystem()
-
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
-        server_socket.bind((DEFAULT_HOST, PORT))
-        server_socket.listen()
-        print("EPS subsystem listening for connections...")
-        while True:
-            conn, addr = server_socket.accept()
-            print(f"Connected by {addr}")
-
-            # Keep connection open for multiple commands
-            while True:
-                try:
-                    data = conn.recv(1024).decode().strip()
-                    if not data:
-                        print("Client disconnected.")
-                        break
-
-                    RESPONSE = eps.handle_command(data)
-                    if RESPONSE:
-                        conn.sendall((RESPONSE + "\n").encode())
-
-                except ConnectionResetError:
-                    print("Client disconnected abruptly.")
-                    break  # Exit loop if client forcefully disconnects
-            conn.close()  # Close the connection after client disconnects
+    parser = argparse.ArgumentParser(description="Simulated EPS subsystem")
+    socket_stuff.add_address_arguments(parser, DEFAULT_PORT, message_oriented=True)
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                        help="simulated seconds per real second, for testing timed events "
+                             "such as the watchdog quickly")
+    parser.add_argument("--power-table", nargs="?", const="", metavar="PATH",
+                        help="publish the power table the other simulators obey at PATH (by "
+                             "default one for this port); SIM_POWER_TABLE is used if not given")
+    args = parser.parse_args()
+    if not args.time_scale > 0:
+        parser.error("--time-scale must be positive")
+    if args.power_table == "":
+        args.power_table = power_table.default_path(
+            os.path.basename(args.unix_path) if args.unix_path else args.port)
+
+    sim_logging.configure_logging()
+    LOGGER.info("Starting EPS subsystem on %s", args.unix_path or f"port {args.port}")
+
+    eps_model = EPSSubsystem(sim_clock.SimClock(args.time_scale), args.power_table)
+    if eps_model.power_table.path:
+        LOGGER.info("Publishing the power table at %s; run the other simulators with %s=%s to "
+                    "obey it", eps_model.power_table.path, power_table.POWER_TABLE_ENV,
+                    eps_model.power_table.path)
+    eps_command_handler = command_handler.CommandHandler(EPSCommandFactory(eps_model))
+
+    socket_stuff.create_socket_and_listen(DEFAULT_HOST, args.port, eps_command_handler,
+                                          args.unix_path, args.seqpacket)
@@ -0,0 +1,175 @@
+"""This module contains the power model of the simulated EPS
+
+The model follows the satellite around a circular low Earth orbit: sunlit for the first part of
+each orbit, then in eclipse. The solar panels charge the battery in sunlight, while the EPS, the
+OBC and every powered subsystem draw from it. The battery's state of charge sets its voltage
+through an open circuit voltage (OCV) lookup curve, and the temperature relaxes towards a
+sunlit or eclipse equilibrium, raised by the heat of the load.
+
+Between two changes of load the net power is constant within each sunlit or eclipse period, so
+the model is advanced in closed form one period at a time rather than in small fixed steps.
+Advancing a hundred orbits is then a few hundred iterations, however long the orbits are.
+
+Copyright 2024 [Devin Headrick]. Licensed under the Apache License, Version 2.0
+"""
+
+import bisect
+import math
+
+ORBIT_PERIOD = 5580.0          # seconds, a 93 minute low Earth orbit
+ECLIPSE_DURATION = 2100.0      # seconds of each orbit spent in the Earth's shadow
+SUNSET = ORBIT_PERIOD - ECLIPSE_DURATION  # seconds into each orbit that the eclipse starts
+
+SOLAR_POWER = 7.0              # W generated by the solar panels in sunlight
+BASE_LOAD = 1.2                # W drawn by the EPS and OBC whenever the EPS is on
+SUBSYSTEM_LOADS = {            # W drawn by each subsystem while it is powered
+    'ADCS': 1.5,
+    'Deployables': 0.1,
+    'DFGM': 0.6,
+    'GPS': 0.9,
+    'IRIS': 3.0,
+    'UHF': 2.0,
+    'AntennaBurnWireGPIO': 2.5,
+    'UHFBurnWireGPIO': 2.5,
+}
+
+BATTERY_CAPACITY = 20.0        # Wh
+CHARGE_EFFICIENCY = 0.9        # fraction of the surplus solar power stored in the battery
+INTERNAL_RESISTANCE = 0.12     # ohms
+# (state of charge, open circuit voltage) points of a 2S lithium-ion battery, interpolated
+OCV_CURVE = ((0.0, 6.0), (0.05, 6.5), (0.1, 6.8), (0.2, 7.05), (0.4, 7.3), (0.6, 7.55),
+             (0.8, 7.85), (0.9, 8.05), (1.0, 8.4))
+OCV_CHARGES = tuple(charge for charge, _ in OCV_CURVE)
+
+SUNLIT_TEMPERATURE = 30.0      # degrees C reached in sunlight with no load
+ECLIPSE_TEMPERATURE = -5.0     # degrees C reached in eclipse with no load
+LOAD_HEATING = 2.0             # degrees C added to the equilibrium per W of load
+THERMAL_TIME_CONSTANT = 1200.0 # seconds to close 63% of the gap to the equilibrium
+
+
+def open_circuit_voltage(state_of_charge):
+    """Interpolate the open circuit voltage of the battery from the OCV curve
+
+    Args:
+        state_of_charge (float): The state of charge of the battery, 0 to 1
+
+    Returns:
+        float: The open circuit voltage, in volts
+    """
+    index = min(max(bisect.bisect_right(OCV_CHARGES, state_of_charge), 1), len(OCV_CURVE) - 1)
+    (charge_low, voltage_low), (charge_high, voltage_high) = OCV_CURVE[index - 1:index + 1]
+    fraction = (state_of_charge - charge_low) / (charge_high - charge_low)
+    return voltage_low + fraction * (voltage_high - voltage_low)
+
+
+class PowerModel():
+    """Time-stepped model of the EPS battery, solar input, load and temperature
+
+    The load is set by the EPS when subsystems are switched; advance_to() must be called with
+    the time of the switch first, so the old load applies up to it.
+    """
+
+    def __init__(self, state_of_charge=0.8, temperature=20.0):
+        """
+        Args:
+            state_of_charge (float): The initial state of charge of the battery, 0 to 1
+            temperature (float): The initial temperature, in degrees C
+        """
+        self.time = 0.0
+        self.orbit_phase = 0.0  # seconds into the current orbit, sunlit from 0 until SUNSET
+        self.state_of_charge = state_of_charge
+        self.temperature = temperature
+        self.load = 0.0
+
+    def set_load(self, eps_on, subsystems):
+        """Set the power drawn from the battery from now on
+
+        Args:
+            eps_on (bool): Whether the EPS is on. Nothing is powered while it is off
+            subsystems (dict): Subsystem name to whether it is powered
+        """
+        if not eps_on:
+            self.load = 0.0
+            return
+        self.load = BASE_LOAD + sum(SUBSYSTEM_LOADS.get(subsystem, 0.0)
+                                    for subsystem, powered in subsystems.items() if powered)
+
+    def in_eclipse(self):
+        """Whether the satellite is currently in the Earth's shadow"""
+        return self.orbit_phase >= SUNSET
+
+    def battery_power(self):
+        """The power flowing into the battery in W, negative while discharging"""
+        net_power = (0.0 if self.in_eclipse() else SOLAR_POWER) - self.load
+        if net_power > 0:
+            return 0.0 if self.state_of_charge >= 1.0 else net_power * CHARGE_EFFICIENCY
+        return 0.0 if self.state_of_charge <= 0.0 else net_power
+
+    def current(self):
+        """The battery current in A, positive while charging"""
+        return self.battery_power() / open_circuit_voltage(self.state_of_charge)
+
+    def voltage(self):
+        """The battery terminal voltage in V"""
+        return (open_circuit_voltage(self.state_of_charge)
+                + self.current() * INTERNAL_RESISTANCE)
+
+    def battery_state(self):
+        """One of 'Charging', 'Discharging', 'Full' or 'Empty'"""
+        battery_power = self.battery_power()
+        if battery_power > 0:
+            return "Charging"
+        if battery_power < 0:
+            return "Discharging"
+        return "Full" if self.state_of_charge >= 1.0 else "Empty"
+
+    def advance_to(self, time):
+        """Advance the model to a later simulation time, one sunlit or eclipse period at a time
+
+        Args:
+            time (float): The simulation time to advance to, in seconds. Earlier times are ignored
+        """
+        remaining = time - self.time
+        while remaining > 0:
+            sunlit = not self.in_eclipse()
+            to_boundary = (SUNSET if sunlit else ORBIT_PERIOD) - self.orbit_phase
+            step = min(remaining, to_boundary)
+            self.integrate(step)
+            remaining -= step
+            if step == to_boundary:
+                self.orbit_phase = SUNSET if sunlit else 0.0
+            else:
+                self.orbit_phase += step
+        self.time = max(self.time, time)
+
+    def integrate(self, duration):
+        """Integrate the charge and temperature over a period of constant sunlight and load
+
+        Args:
+            duration (float): The length of the period, in seconds
+        """
+        energy = self.state_of_charge * BATTERY_CAPACITY
+        energy += self.battery_power() * duration / 3600
+        self.state_of_charge = min(max(energy / BATTERY_CAPACITY, 0.0), 1.0)
+
+        equilibrium = ECLIPSE_TEMPERATURE if self.in_eclipse() else SUNLIT_TEMPERATURE
+        equilibrium += self.load * LOAD_HEATING
+        decay = math.exp(-duration / THERMAL_TIME_CONSTANT)
+        self.temperature = equilibrium + (self.temperature - equilibrium) * decay
+
+
+# pylint: disable=duplicate-code
+# no error
+__author__ = "Devin Headrick"
+__copyright__ = """
+    Copyright 2024 [Devin Headrick]
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License."""
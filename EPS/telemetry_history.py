@@ -0,0 +1,127 @@
+"""This module contains the fixed size telemetry history kept by the simulated EPS
+
+Samples are stored in a ring buffer of preallocated arrays, one array per column plus one of
+sample times, so the memory used is fixed when the history is created however long the
+simulator runs. Once full, each new sample overwrites the oldest.
+
+Range queries are downsampled: the requested time range is split into equal width buckets and
+the minimum, maximum and mean of the samples in each bucket are returned, so a client can pull
+a long history at the resolution it can display in a single request.
+
+Copyright 2024 [Devin Headrick]. Licensed under the Apache License, Version 2.0
+"""
+
+import array
+import bisect
+
+
+def preallocated_array(typecode, length):
+    """Returns an array of the given type holding length zeros"""
+    return array.array(typecode, bytes(length * array.array(typecode).itemsize))
+
+
+class RingView(): # pylint: disable=too-few-public-methods
+    """A read-only sequence over the samples of a ring buffer array, oldest first"""
+
+    def __init__(self, values, start, count):
+        self.values = values
+        self.start = start
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError("ring buffer index out of range")
+        return self.values[(self.start + index) % len(self.values)]
+
+
+class TelemetryHistory():
+    """A ring buffer of timestamped samples, each holding a value per column
+
+    Sample times must be appended in increasing order.
+    """
+
+    def __init__(self, capacity, columns):
+        """
+        Args:
+            capacity (int): The number of samples kept
+            columns (dict): Column name to the array typecode its values are stored as
+        """
+        self.capacity = capacity
+        self.times = preallocated_array('d', capacity)
+        self.columns = {name: preallocated_array(typecode, capacity)
+                        for name, typecode in columns.items()}
+        self.start = 0  # index of the oldest sample
+        self.count = 0
+
+    def append(self, time, values):
+        """Add a sample, overwriting the oldest if the history is full
+
+        Args:
+            time (float): The time of the sample, later than every sample before it
+            values (dict): Column name to the value of the sample
+        """
+        if self.count < self.capacity:
+            index = (self.start + self.count) % self.capacity
+            self.count += 1
+        else:
+            index = self.start
+            self.start = (self.start + 1) % self.capacity
+
+        self.times[index] = time
+        for name, column in self.columns.items():
+            column[index] = values[name]
+
+    def query(self, column, start_time, end_time, max_points):
+        """Downsample the samples of a column within a time range
+
+        Args:
+            column (str): The name of the column
+            start_time (float): The start of the range, inclusive
+            end_time (float): The end of the range, inclusive
+            max_points (int): The number of buckets the range is split into
+
+        Returns:
+            list: [bucket start time, min, max, mean] for every bucket holding a sample
+        """
+        times = RingView(self.times, self.start, self.count)
+        values = RingView(self.columns[column], self.start, self.count)
+        first = bisect.bisect_left(times, start_time)
+        last = bisect.bisect_right(times, end_time)
+
+        # An empty range can only hold samples at its start, all in the first bucket
+        width = (end_time - start_time) / max_points or 1.0
+        buckets = {}
+        for index in range(first, last):
+            value = values[index]
+            bucket_index = min(int((times[index] - start_time) / width), max_points - 1)
+            bucket = buckets.get(bucket_index)
+            if bucket is None:
+                buckets[bucket_index] = [value, value, value, 1]
+            else:
+                bucket[0] = min(bucket[0], value)
+                bucket[1] = max(bucket[1], value)
+                bucket[2] += value
+                bucket[3] += 1
+
+        return [[start_time + bucket_index * width, minimum, maximum, total / count]
+                for bucket_index, (minimum, maximum, total, count) in buckets.items()]
+
+
+# pylint: disable=duplicate-code
+# no error
+__author__ = "Devin Headrick"
+__copyright__ = """
+    Copyright 2024 [Devin Headrick]
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License."""
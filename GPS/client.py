@@ -1,7 +1,8 @@
 
 """ This Python program represents the client for a simulation of GPS communication.
 
-This sub System communicates with binary strings using SOCK_SEQPACKET and AF_UNIX. 
+This sub System communicates with binary strings over TCP, or over a Unix domain socket
+(SOCK_STREAM or SOCK_SEQPACKET) when started with --unix PATH [--seqpacket].
 This server recieves incoming commands from the client and echoes back the requested
 information.
 
@@ -17,19 +18,24 @@ At the moment, the three commands are:
 To test the server/client you must run both files in a UNIX environment.
 Afterwards you may enter any of the valid commands from the client.
 """
-import socket
+import argparse
+import os
 import sys
 
+# Add parent directory to path so we can import modules from there
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import socket_stuff # pylint: disable=C0413
+
 DEFAULT_HOST = '127.0.0.1'
 DEFAULT_PORT = 1810
 PATH="/tmp/fifo_socket_gps_device"
 
-def connect(host, port) -> None:
+def connect(host, port, unix_path=None, seqpacket=False) -> None:
     """
     Connects to server and allows for communication.
+    Uses the Unix domain socket at unix_path if one is given (e.g. PATH)
     """
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
-        client.connect((host, port))
+    with socket_stuff.connect_socket(host, port, unix_path, seqpacket) as client:
         print("Client connected.")
 
         while True:
@@ -48,4 +54,7 @@ def connect(host, port) -> None:
     sys.exit(0)
 
 if __name__ == "__main__":
-    connect(DEFAULT_HOST, DEFAULT_PORT)
+    parser = argparse.ArgumentParser(description="Client for the simulated GPS subsystem")
+    socket_stuff.add_address_arguments(parser, DEFAULT_PORT, message_oriented=True)
+    args = parser.parse_args()
+    connect(DEFAULT_HOST, args.port, args.unix_path, args.seqpacket)
@@ -1,6 +1,7 @@
 """ This Python program represents the server for a simulation of GPS communication.
 
-This sub System communicates with binary strings using SOCK_SEQPACKET and AF_UNIX. 
+This sub System communicates with binary strings over TCP, or over a Unix domain socket
+(SOCK_STREAM or SOCK_SEQPACKET) when started with --unix PATH [--seqpacket].
 This server recieves incoming commands from the client and echoes back the requested
 information.
 
@@ -13,49 +14,72 @@ At the moment, the three commands are:
 To test the server/client you must run both files in a UNIX environment.
 Afterwards you may enter any of the valid commands from the client.
 """
-import socket
+import argparse
+import os
 import sys
 
+# Add parent directory to path so we can import modules from there
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import power_table # pylint: disable=C0413
+import sim_logging # pylint: disable=C0413
+import socket_stuff # pylint: disable=C0413
+
 DEFAULT_HOST = '127.0.0.1'
 DEFAULT_PORT = 1810
-def open_server(host, port) -> None:
+
+LOGGER = sim_logging.get_logger("GPS")
+
+RESPONSES = {
+    "time": b"[Server] 12:45 am Friday August 23 2024",
+    "latlong": b"[Server] 53.518291, -113.536530)",
+    "returnstate": b"return state on",
+    "ping": b"[Server] ping successful",
+}
+INVALID_COMMAND_RESPONSE = b"[Server] Invalid command."
+POWER = power_table.PowerSwitch("GPS")
+
+def open_server(host, port, unix_path=None, seqpacket=False) -> None:
     """
-    Opens a listening server
+    Opens a listening server, on a Unix domain socket at unix_path if one is given
     """
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
-        server.bind((host, port))
+    with socket_stuff.create_listening_socket(host, port, unix_path, seqpacket) as server:
         while True:
-            print(f"Server started on port {port}\nWaiting for client.")
-            server.listen()
+            LOGGER.info("Server started on %s. Waiting for client.",
+                        unix_path or f"port {port}")
             conn, addr = server.accept()
             with conn:
-                print("Client connected. Addr:", addr)
+                LOGGER.info("Client connected. Addr: %s", addr)
                 while True:
                     command=conn.recv(1024) #buffsize 1024 bytes
+                    if not command:
+                        LOGGER.info("Client disconnected.")
+                        break
                     command=command.decode("utf-8")
-                    print(f"Command recieved: {command}.")
-                    data=0
+                    LOGGER.debug("Command recieved: %s.", command)
 
                     if command == "disconnect":
-                        print(f"Command recieved: {command}.")
-                        print("Client disconnected.")
+                        LOGGER.info("Client disconnected.")
                         break
                     if command == "terminate":
-                        print("Closing connection.")
+                        LOGGER.info("Closing connection.")
+                        socket_stuff.remove_unix_socket(unix_path)
                         sys.exit(0)
 
-                    if command == "time":
-                        data=b"[Server] 12:45 am Friday August 23 2024"
-                    elif command == "latlong":
-                        data=b"[Server] 53.518291, -113.536530)"
-                    elif command == "returnstate":
-                        data=b"return state on"
-                    elif command == "ping":
-                        data=b"[Server] ping successful"
-                    else:
-                        command="invalid command"
-                        data=b"[Server] Invalid command."
-                    conn.send(data)
+                    conn.send(command_response(command))
+
+def command_response(command) -> bytes:
+    """
+    Returns the response to a command other than disconnect or terminate,
+    nothing while the EPS has the GPS powered off
+    """
+    if not POWER.is_on():
+        return b""
+    return RESPONSES.get(command, INVALID_COMMAND_RESPONSE)
 
 if __name__ == "__main__":
-    open_server(DEFAULT_HOST, DEFAULT_PORT)
+    sim_logging.configure_logging()
+    parser = argparse.ArgumentParser(description="Simulated GPS subsystem")
+    # If there is no port arg, port is default otherwise use the arg
+    socket_stuff.add_address_arguments(parser, DEFAULT_PORT, message_oriented=True)
+    args = parser.parse_args()
+    open_server(DEFAULT_HOST, args.port, args.unix_path, args.seqpacket)
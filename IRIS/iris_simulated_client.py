@@ -19,16 +19,21 @@ there are three types of commands that can be sent:
 
 Usage:
 - From this terminal:
-    - python IRIS/command_terminal.py
+    - python IRIS/iris_simulated_client.py (optional port number, or --unix PATH)
     - type commands like 'request:TempVIS' (without the quotes)
 - From another terminal:
     - python IRIS/iris_simulated_server.py (optional port number)
 
 Copyright 2024 [Ben Fisher]. Licensed under the Apache License, Version 2.0
 """
-import socket
+import argparse
+import os
 import sys
 
+# Add parent directory to path so we can import modules from there
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import socket_stuff # pylint: disable=C0413
+
 DEFAULT_HOST = '127.0.0.1'
 DEFAULT_PORT = 1806
 MAX_RECEIVE = 1024
@@ -37,16 +42,16 @@ END_FLAG = "|END" # END_FLAG should have same length as FLAGSIZE
 FLAGSIZE = 4
 PACKET_DELIMITER = ':'
 
-def main(port):
+def main(port, unix_path=None):
     """ Creates a socket and attempts to connect to a running server
         Once connection is received it listens for input and sends the input to the server
 
         Args:
         port (const uint): The port the socket should be opened on
+        unix_path (str): Connect to the Unix domain socket at this path instead of the port
 
     """
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
-        client.connect((DEFAULT_HOST, port))
+    with socket_stuff.connect_socket(DEFAULT_HOST, port, unix_path) as client:
         while True:
             user_input = input()
             client.sendall(user_input.encode())
@@ -179,8 +184,10 @@ def get_packet_length(conn):
     return packet_len
 
 if __name__ == "__main__":
-    PORT = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PORT
-    main(PORT)
+    parser = argparse.ArgumentParser(description="Client for the simulated IRIS subsystem")
+    socket_stuff.add_address_arguments(parser, DEFAULT_PORT)
+    args = parser.parse_args()
+    main(args.port, args.unix_path)
 
 # pylint: disable=duplicate-code
 # no error
@@ -3,30 +3,43 @@ This python program sets up a TCP server and simulates the IRIS payload componen
 
 Usage:
 - From one terminal:
-    - python IRIS/iris_subsystem.py optional_port_num
+    - python IRIS/iris_simulated_server.py optional_port_num (or --unix PATH)
 - From another terminal:
     - nc host_ip port
     - type commands like 'TKI' or 'FTI:2 (without the quotes)
+    - type 'STATS' for the per-command latency statistics as JSON
 
 Copyright 2024 [Ben Fisher, Abhishek Naik]. Licensed under the Apache License, Version 2.0
 """
+import argparse
+import os
 import socket
 import sys
 import threading
-import logging
+import time
 import queue
 import iris_subsystem
 
+# Add parent directory to path so we can import modules from there
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import command_stats # pylint: disable=C0413
+import power_table # pylint: disable=C0413
+import sim_logging # pylint: disable=C0413
+import socket_stuff # pylint: disable=C0413
+
 DEFAULT_HOST = '127.0.0.1'
 DEFAULT_PORT = 1806
 MAX_COMMANDSIZE = 128
 END_FLAG = "|END|"
+STATS_COMMAND = "STATS"
 
-LOGGER_FORMAT = "%(asctime)s: %(message)s"
+LOGGER = sim_logging.get_logger("IRIS")
 
 Iris = iris_subsystem.IRISSubsystem()
+STATS = command_stats.CommandStats()
+POWER = power_table.PowerSwitch("IRIS")
 
-def input_listen(port, message_buffer, reply_buffer):
+def input_listen(port, message_buffer, reply_buffer, unix_path=None):
     """ Creates a socket and begins a server that continuously listens for connection
         Once connection is received it listens for input and stores it into a FIFO queue
         Once input is terminated it resumes listening for a connection
@@ -37,17 +50,16 @@ def input_listen(port, message_buffer, reply_buffer):
         Args:
         port (const uint): The port the socket should be opened on
         message_buffer (SimpleQueue): The FIFO queue the input is stored in
+        unix_path (str): Listen on a Unix domain socket at this path instead of the port
 
     """
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+    with socket_stuff.create_listening_socket(DEFAULT_HOST, port, unix_path) as server:
         exit_flag = False
-        server.bind((DEFAULT_HOST, port))
-        server.listen()
         # Search for connections until told to exit
         while exit_flag is not True:
             conn, addr = server.accept() # Blocks execution until connection found
             with conn: # Connection is established
-                logging.info("Connected by %s", addr)
+                LOGGER.info("Connected by %s", addr)
                 responder = threading.Thread(target=output_send, args=(conn, reply_buffer,))
                 responder.start()
                 while True:
@@ -63,7 +75,8 @@ def input_listen(port, message_buffer, reply_buffer):
                 # Connection is lost, close the responder
                 responder.join()
 
-    logging.info("Closing socket")
+    socket_stuff.remove_unix_socket(unix_path)
+    LOGGER.info("Closing socket")
 
 def output_send(conn, reply_buffer):
     """ Receives an established socket and continuously checks for responses to be sent
@@ -85,29 +98,38 @@ def output_send(conn, reply_buffer):
         if reply == "EXIT":
             break
         try:
-            if isinstance(reply, list):
-                for element in reply:
-                    # logging.info(element)
-                    #TO-DO implement packet length tracker that is sent before a packet
-                    header = "FLAG:" + str(len(element)) + ':'
-                    if not isinstance(element, bytes):
-                        element = element.encode()
-                    conn.sendall(header.encode())
-                    conn.sendall(element)
-                    logging.info("Sent: %s\n", element)
-            else:
-                header = "FLAG:" + str(len(reply)) + ':'
-                conn.sendall(header.encode())
-                conn.sendall(reply.encode())
-                logging.info("Sent: %s\n", reply)
-            conn.sendall(END_FLAG.encode())
+            conn.sendall(format_reply(reply))
+            LOGGER.debug("Sent: %s", reply)
         except BrokenPipeError:
-            logging.info("Connection to client lost: Force closing output loop")
+            LOGGER.info("Connection to client lost: Force closing output loop")
             return
         except socket.error as exc: # pylint: disable=bare-except
             # May implement counter for too many failures, (connection not lost but data cant send)
-            logging.info("Output socket error %s: connection not lost, continuing responder", exc)
-    logging.info("Closing output loop")
+            LOGGER.info("Output socket error %s: connection not lost, continuing responder", exc)
+    LOGGER.info("Closing output loop")
+
+def format_reply(reply):
+    """ Frames a command reply for sending to the client
+
+        Each element of the reply is preceded by a 'FLAG:<length>:' header, and the
+        whole reply is followed by END_FLAG.
+
+        Args:
+        reply (str or list): The reply of a command, lists may contain str or bytes elements
+
+        Returns:
+        bytes: The framed reply
+    """
+    elements = reply if isinstance(reply, list) else [reply]
+    framed = bytearray()
+    for element in elements:
+        #TO-DO implement packet length tracker that is sent before a packet
+        if not isinstance(element, bytes):
+            element = element.encode()
+        framed += f"FLAG:{len(element)}:".encode()
+        framed += element
+    framed += END_FLAG.encode()
+    return bytes(framed)
 
 
 
@@ -134,30 +156,72 @@ def command_handler(message_buffer, response_buffer):
         # I have taken the liberty to set commands to be simple abbreviations
         # each term passed should be delimited with ':' and each message
         # should begin with either EXECUTE/REQUEST depending on whether it expects a return
-        logging.info("Received %s", message)
-        args = message.split(':')
-        command = iris_subsystem.Command(args)
-
-
-        state = Iris.execute_command(command)
+        LOGGER.debug("Received %s", message)
+        state = run_message(message)
 
         # Only when the command is requesting a response should response be given
-        logging.info(state)
+        LOGGER.debug("%s", state)
         response_buffer.put(state)
 
-    logging.info("Ending command processing")
+    LOGGER.info("Ending command processing")
+
+def run_message(message):
+    """ Runs the command in a message received from the client, recording its statistics
+
+        Args:
+        message (str): The decoded message, the command abbreviation and params delimited by ':'
+
+        Returns:
+        str or list: The reply to send to the client, None while the EPS has IRIS powered off
+    """
+    if message == STATS_COMMAND:
+        return STATS.report()
+    if not POWER.is_on():
+        LOGGER.debug("Powered off, ignoring %s", message)
+        return None
+
+    start = time.perf_counter()
+    args = message.split(':')
+    command = iris_subsystem.Command(args)
+
+    state = Iris.execute_command(command)
+    record_command(command, message, state, time.perf_counter() - start)
+    return state
+
+def record_command(command, message, state, latency):
+    """ Records the statistics of one executed command
+
+        Args:
+        command (Command): The command that was executed
+        message (str): The message the command was parsed from
+        state (str or list): The response of the command
+        latency (float): How long the command took to execute, in seconds
+    """
+    name = command.abbrev
+    if name not in Iris.get_commands():
+        name = command_stats.INVALID_COMMAND
+    if isinstance(state, list):
+        bytes_out = sum(len(element) for element in state)
+        error = False
+    else:
+        bytes_out = len(state)
+        error = state.startswith("ERROR")
+    STATS.record(name, latency, len(message), bytes_out, error)
 
 if __name__ == "__main__":
-    # If there is no arg, port is default otherwise use the arg
-    PORT = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PORT
-    logging.basicConfig(format=LOGGER_FORMAT, level=logging.INFO, datefmt="%H:%M:%S")
-    logging.info("Starting IRIS subsystem on port %s", PORT)
+    parser = argparse.ArgumentParser(description="Simulated IRIS subsystem")
+    # If there is no port arg, port is default otherwise use the arg
+    socket_stuff.add_address_arguments(parser, DEFAULT_PORT)
+    cli_args = parser.parse_args()
+    sim_logging.configure_logging()
+    LOGGER.info("Starting IRIS subsystem on %s", cli_args.unix_path or f"port {cli_args.port}")
     # Initiate server threads
     messages = queue.SimpleQueue()
     responses = queue.SimpleQueue()
 
     # NOTE: listener will create at max 1 sub_thread at a time for responding to the current client
-    listener = threading.Thread(target=input_listen, args=(PORT, messages, responses,))
+    listener = threading.Thread(target=input_listen,
+                                args=(cli_args.port, messages, responses, cli_args.unix_path))
     handler = threading.Thread(target=command_handler, args=(messages, responses,))
 
     listener.start()
@@ -166,7 +230,7 @@ if __name__ == "__main__":
     # Wait for server to exit
     listener.join()
     handler.join()
-    logging.info("Simulated IRIS Server exited")
+    LOGGER.info("Simulated IRIS Server exited")
     # input_listen(PORT, messages)
 
 
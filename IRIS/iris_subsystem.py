@@ -27,6 +27,8 @@ import os
 
 IRIS_COMMAND_SIZE = 1024
 SIMULATED_MAX_PHOTOS = 3 # This is how many photos we actually have for testing
+# Images served by the simulator, found next to this file (with a trailing separator)
+IMAGE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Server_Photos', '')
 
 DEFAULT_STATE_VALUES = {                # at some point, we should simulate temperature changes
             'PowerStatus': 1,           # 1 means powered on, 0 means off
@@ -88,7 +90,7 @@ class IRISSubsystem: # pylint: disable=too-many-instance-attributes
             'NumImages': DEFAULT_STATE_VALUES['NumImages'],
             'MaxNumImages': DEFAULT_STATE_VALUES['MaxNumImages'],
             'Time': DEFAULT_STATE_VALUES['DateTime'],
-            'Images': './Server_Photos/',
+            'Images': IMAGE_DIRECTORY,
             'ImageExt': '.jpeg',
             'TempVIS': 25,              # in degree Celsius
             'TempNIR': 25,              # in degree Celsius
@@ -1,6 +1,7 @@
 """ This program acts like a client to interact with the uhf tranceiver for testing purposes
 
-The port number for server is passed as a commmand line argument.
+The port number for server is passed as a commmand line argument
+(or a Unix domain socket path with --unix PATH).
 hostname is assumed to be local host.
 will listen and print any incoming messages to socket.
 can send messages back to server by simply writing a command in the terminal
@@ -9,10 +10,15 @@ Copyright 2024 [Drake Boulianne]. Licensed under the Apache License, Version 2.0
 """
 
 
-import socket
+import argparse
+import os
 import sys
 import threading
 
+# Add parent directory to path so we can import modules from there
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import socket_stuff # pylint: disable=C0413
+
 def write_to_server(client, lock):
     """
     uses client and lock to communicate with server. messages are sent by reading 
@@ -51,21 +57,25 @@ def main():
         int: -1 for incorrect amount of cmd args, or not being able to connect to host
             returns 0 for successful exit
  """
-    if len(sys.argv) != 2:
+    parser = argparse.ArgumentParser(description="Generic client for the simulated UHF")
+    parser.add_argument("port", nargs="?", type=int, help="Port of the server to connect to")
+    parser.add_argument("--unix", metavar="PATH", dest="unix_path",
+                        help="Connect to the Unix domain socket at PATH instead of a port")
+    args = parser.parse_args()
+    if (args.port is None) == (args.unix_path is None):
         print("Incorrect number of arguments:")
-        print("Usage: python3 generic_client.py <port>")
+        print("Usage: python3 generic_client.py <port> | --unix <path>")
         return -1
 
     host = '127.0.0.1'
-    port = int(sys.argv[1])
+    address = args.unix_path or f"{host}:{args.port}"
 
     try:
-        client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        client.connect((host, port))
-        print(f"Connected to {host}:{port}")
+        client = socket_stuff.connect_socket(host, args.port, args.unix_path)
+        print(f"Connected to {address}")
 
     except OSError as e:
-        print(f"Could not connect to hostname: {host} port: {port} - {e}")
+        print(f"Could not connect to {address} - {e}")
         return -1
 
     client_lock = threading.Lock()
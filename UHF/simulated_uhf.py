@@ -36,12 +36,20 @@ Generally two different kind of usage for our purposes:
 
 """
 
+import os
 import socket
+import sys
 import threading
 import queue
 import time
 import argparse
 
+# Add parent directory to path so we can import modules from there
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import power_table # pylint: disable=C0413
+import sim_logging # pylint: disable=C0413
+import socket_stuff # pylint: disable=C0413
+
 UART_PORT = 1805
 RADIO_PORT = 1808
 BEACON_PORT = 1809
@@ -57,6 +65,9 @@ BEACON_TX_MESSAGE = f"{BEACON_CALL_SIGN}{BEACON_TX_CONTENTS}"
 
 RELAY_SERVER_RECV_SIZE = 128
 
+LOGGER = sim_logging.get_logger("UHF")
+POWER = power_table.PowerSwitch("UHF")
+
 class RelayServer(threading.Thread):
     """
     Server daemon bound to a given port, and IP address.
@@ -72,40 +83,39 @@ class RelayServer(threading.Thread):
     Relay Server.
     """
 
-    def __init__(self, name, ipaddr, port, outbound_buffer, inbound_buffer):
-        """ Creates a Relay Server"""
+    def __init__(self, name, ipaddr, port, outbound_buffer, inbound_buffer, # pylint: disable=too-many-arguments,too-many-positional-arguments
+                 unix_path=None):
+        """ Creates a Relay Server, listening on a Unix domain socket if unix_path is given"""
         super().__init__(daemon=True)
         self.name = name
         self.ipaddr = ipaddr
         self.port = port
         self.outbound_buffer = outbound_buffer
         self.inbound_buffer = inbound_buffer
+        self.unix_path = unix_path
 
     def run(self):
         """
-        Binds the Relay Server it to the IP address and port given in the class constructor.
+        Binds the Relay Server it to the IP address and port (or Unix domain socket path)
+        given in the class constructor.
 
         Connects to at most one client and handles it.
 
         Supports re-connection without restarting server daemon.
         """
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as srv:
-            srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            srv.bind((self.ipaddr, self.port))
-            srv.listen(1)
+        with socket_stuff.create_listening_socket(self.ipaddr, self.port, self.unix_path) as srv:
 
             while True:
                 conn, addr = srv.accept()
-                print(f"[{self.name}] client connected: {addr}")
+                LOGGER.info("[%s] client connected: %s", self.name, addr)
 
                 try:
                     self.handle_client(conn)
                 except Exception as e:
-                    print(f"[{self.name}] Failed to handle client{e.with_traceback}")
-                    print(f"[{self.name}] error: {e}")
+                    LOGGER.exception("[%s] Failed to handle client, error: %s", self.name, e)
                 finally:
                     conn.close()
-                    print(f"[{self.name}] client disconnected")
+                    LOGGER.info("[%s] client disconnected", self.name)
 
     def handle_client(self, conn: socket.socket):
         """
@@ -122,8 +132,10 @@ class RelayServer(threading.Thread):
                 data = conn.recv(RELAY_SERVER_RECV_SIZE)
                 if not data:
                     return
-                print(f"[{self.name}] received: {data}")
-                self.outbound_buffer.put(data)
+                LOGGER.debug("[%s] received: %s", self.name, data)
+                # A UHF powered off by the EPS drops everything it is sent
+                if POWER.is_on():
+                    self.outbound_buffer.put(data)
             except socket.timeout:
                 pass
 
@@ -131,7 +143,7 @@ class RelayServer(threading.Thread):
                 while True:
                     msg = self.inbound_buffer.get_nowait()
                     conn.sendall(msg)
-                    print(f"[{self.name}] forwarded: {msg}")
+                    LOGGER.debug("[%s] forwarded: %s", self.name, msg)
             except queue.Empty:
                 pass
 
@@ -144,12 +156,12 @@ class BeaconServer(threading.Thread):
 
     The Beacon Server supports reconnection if the connection is lost.
     """
-    def __init__(self, name, ipaddr, port, message, interval=30):
+    def __init__(self, name, ipaddr, port, message, interval=30, unix_path=None): # pylint: disable=too-many-arguments,too-many-positional-arguments
         super().__init__(daemon=True)
         """
         Initialize a beacon server.
 
-        Provide a port and ip address for port to bind to. 
+        Provide a port and ip address for port to bind to (or a Unix domain socket path). 
         The given message will be transmitted to a connected
         client every 'interval' seconds (default 30s)
         """
@@ -158,31 +170,29 @@ class BeaconServer(threading.Thread):
         self.port = port
         self.message = message
         self.interval = interval
+        self.unix_path = unix_path
 
     def run(self):
         """
         Run the beacon server daemon.
 
-        This will create a TCP socket and bind it to the BeaconServer's address and port.
-        Only a single client can connect to the server at a time. BeaconServer allows for clients to 
-        disconnect and reconnect without restarting the server.
+        This will create a TCP socket (or Unix domain socket) and bind it to the BeaconServer's
+        address and port. Only a single client can connect to the server at a time. BeaconServer
+        allows for clients to disconnect and reconnect without restarting the server.
         """
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as srv:
-            srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            srv.bind((self.ipaddr, self.port))
-            srv.listen(1)
+        with socket_stuff.create_listening_socket(self.ipaddr, self.port, self.unix_path) as srv:
 
             while True:
                 conn, addr = srv.accept()
-                print(f"[{self.name}] client connected: {addr}")
+                LOGGER.info("[%s] client connected: %s", self.name, addr)
 
                 try:
                     self.handle_client(conn)
                 except Exception as e:
-                    print(f"[{self.name}] error: {e}")
+                    LOGGER.error("[%s] error: %s", self.name, e)
                 finally:
                     conn.close()
-                    print(f"[{self.name}] client disconnected")
+                    LOGGER.info("[%s] client disconnected", self.name)
 
     def handle_client(self, conn: socket.socket):
         """
@@ -192,11 +202,12 @@ class BeaconServer(threading.Thread):
 
         while True:
             try:
-                conn.sendall(self.message.encode('utf-8'))
-                print(f"{self.name} transmit beacon")
+                if POWER.is_on():
+                    conn.sendall(self.message.encode('utf-8'))
+                    LOGGER.debug("%s transmit beacon", self.name)
                 time.sleep(self.interval)
             except (BrokenPipeError, ConnectionResetError, OSError):
-                print(f"{self.name}: client disconnected")
+                LOGGER.info("%s: client disconnected", self.name)
                 return
 
 
@@ -230,25 +241,68 @@ def parse_args():
         help=f"Change the IP address the Beacon Server binds to (default: {BEACON_IPADDR})"
     )
 
+    parser.add_argument(
+        "--uart-port",
+        type=int,
+        default=UART_PORT,
+        help=f"Change the port the Uart Server binds to (default: {UART_PORT})"
+    )
+
+    parser.add_argument(
+        "--radio-port",
+        type=int,
+        default=RADIO_PORT,
+        help=f"Change the port the Radio Server binds to (default: {RADIO_PORT})"
+    )
+
+    parser.add_argument(
+        "--beacon-port",
+        type=int,
+        default=BEACON_PORT,
+        help=f"Change the port the Beacon Server binds to (default: {BEACON_PORT})"
+    )
+
+    parser.add_argument(
+        "--uart-unix",
+        metavar="PATH",
+        help="Bind the Uart Server to a Unix domain socket at PATH instead of TCP"
+    )
+
+    parser.add_argument(
+        "--radio-unix",
+        metavar="PATH",
+        help="Bind the Radio Server to a Unix domain socket at PATH instead of TCP"
+    )
+
+    parser.add_argument(
+        "--beacon-unix",
+        metavar="PATH",
+        help="Bind the Beacon Server to a Unix domain socket at PATH instead of TCP"
+    )
+
     args = parser.parse_args()
     return args
 
 def main():
     """Starts the simulated UHF server daemons and waits forever"""
     args = parse_args()
+    sim_logging.configure_logging()
 
     uart_buffer = queue.Queue()
     radio_buffer = queue.Queue()
 
-    uart_server = RelayServer("UHF Uart Server", args.uart_ip, UART_PORT, radio_buffer, uart_buffer)
-    radio_server = RelayServer("UHF Radio Server", args.radio_ip, RADIO_PORT, uart_buffer, radio_buffer)
-    beacon_server = BeaconServer("UHF Beacon Server", args.beacon_ip, BEACON_PORT, BEACON_TX_MESSAGE, BEACON_TX_PERIOD)
+    uart_server = RelayServer("UHF Uart Server", args.uart_ip, args.uart_port,
+                              radio_buffer, uart_buffer, args.uart_unix)
+    radio_server = RelayServer("UHF Radio Server", args.radio_ip, args.radio_port,
+                               uart_buffer, radio_buffer, args.radio_unix)
+    beacon_server = BeaconServer("UHF Beacon Server", args.beacon_ip, args.beacon_port,
+                                 BEACON_TX_MESSAGE, BEACON_TX_PERIOD, args.beacon_unix)
 
     beacon_server.start()
     radio_server.start()
     uart_server.start()
 
-    print("Simulated UHF up. Ctrl+C to stop.")
+    LOGGER.info("Simulated UHF up. Ctrl+C to stop.")
     while True:
         time.sleep(1)
 
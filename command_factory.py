@@ -1,74 +1,149 @@
 """This module contains a factory class to create command objects based on command type.
 
+Besides single parameter requests, several parameters (or the whole subsystem state) can be read
+in one round-trip. These are read under the state lock so a concurrent update never tears them,
+and are returned as a single line of JSON:
+    mrequest:Voltage:Current    ->  {"Voltage":5.24,"Current":1.32}
+    snapshot                    ->  {"EPSState":"ON","Voltage":5.24,...}
+
 Copyright 2023 [Abhishek Naik, Devin Headrick]. Licensed under the Apache License, Version 2.0
 """
 
 
+import json
+import threading
+
+import command_handler
+import sim_logging
+
+LOGGER = sim_logging.get_logger("command_factory")
+
+
 # Factory pattern: Command Factory
-class CommandFactory:
+class CommandFactory(command_handler.CommandFactory):
     """A factory class to create command objects based on command type.
     
     Commands are overriden as needed to provide functionality specific to the each subsystem.
+    They are registered once on construction; the registry validates each command's params
+    before calling it, so the command methods receive only valid, converted arguments.
+
+    Every command reads or writes the subsystem state under state_lock. Subsystems that
+    change their state from other threads should hold the same lock while doing so.
     """
 
     def __init__(self, subsystem):
         self.subsystem = subsystem
+        self.state_lock = threading.RLock()
+        super().__init__()
+        self.register_command('request', self.command_request_data,
+                              (("parameter", self.state_parameter),),
+                              "Get the current value of a parameter",
+                              "ERROR: Invalid request command \n")
+        self.register_command('update', self.command_update_parameter,
+                              (("parameter", self.updatable_parameter), ("value", str)),
+                              "Update the value of a parameter",
+                              "ERROR: update command \n")
+        self.register_command('execute', self.command_execute,
+                              (("function", self.executable_command),),
+                              "Call a function of the subsystem",
+                              "ERROR: Invalid execute command \n")
+        self.register_command('mrequest', self.command_request_multiple,
+                              (("parameter", command_handler.Repeated(self.state_parameter)),),
+                              "Get the current values of several parameters as JSON",
+                              "ERROR: Invalid mrequest command \n")
+        self.register_command('snapshot', self.command_snapshot,
+                              description="Get the values of every parameter as JSON",
+                              error_response="ERROR: Invalid snapshot command \n")
+
+    def state_parameter(self, parameter):
+        """Argument converter accepting only parameters in the subsystem state"""
+        if parameter not in self.subsystem.state:
+            raise KeyError(parameter)
+        return parameter
+
+    def updatable_parameter(self, parameter):
+        """Argument converter accepting only the subsystem's updatable parameters"""
+        if parameter not in self.subsystem.updatable_parameters:
+            raise KeyError(parameter)
+        return parameter
 
-    def command_request_data(self, params=None):
+    def executable_command(self, function):
+        """Argument converter accepting only the subsystem's executable commands"""
+        if function not in self.subsystem.executable_commands:
+            raise KeyError(function)
+        return function
+
+    def command_request_data(self, parameter):
         """
         Executes a 'request' type command to get the current value of a parameter.
         Args:
-            params (list): Name of the parameter to request from the IRIS subsystem state
+            parameter (str): Name of the parameter to request from the subsystem state
         Returns:
             str: A string containing the requested parameter and its associated value
         """
-        print("Request command received: " + params[0])
-        if params and len(params) == 1 and params[0] in self.subsystem.state:
-            return f"{params[0]}:{self.subsystem.state[params[0]]}\n"
-        return "ERROR: Invalid request command \n"
+        LOGGER.debug("Request command received: %s", parameter)
+        with self.state_lock:
+            return f"{parameter}:{self.subsystem.state[parameter]}\n"
 
-    def command_update_parameter(self, params=None):
+    def command_update_parameter(self, parameter, value):
         """
         Executes an 'update' type command to update a parameter value.
         Args:
-            params (list): Name of the parameter to request from the IRIS subsystem state
+            parameter (str): Name of the parameter to update in the subsystem state
+            value (str): The new value of the parameter
         Returns:
-            str: A string containing the requested parameter and its associated value
+            str: A string containing the updated parameter and its new value
         """
-        print("Update command received: " + params[0])
-        if params and len(params) == 2 and params[0] in self.subsystem.updatable_parameters:
-            self.subsystem.state[params[0]] = params[1]
-            return f"Updated {params[0]} to {params[1]}\n"
-        return "ERROR: update command \n"
+        LOGGER.debug("Update command received: %s", parameter)
+        with self.state_lock:
+            self.subsystem.state[parameter] = value
+        return f"Updated {parameter} to {value}\n"
 
-    def command_execute(self, params=None):
+    def command_execute(self, function):
         """
         Executes an 'execute' type command to call a function.
         Args:
-            params (list): Name of the function to call
+            function (str): Name of the function to call
         Returns:
             str: A string containing the return value from the function call
         """
-        print("Execute command received: " + params[0])
-        if params and len(params) == 1 and params[0] in self.subsystem.executable_commands:
-            self.subsystem.executable_commands[params[0]]()
-            return f"Command {params[0]} executed \n"
-        return "ERROR: Invalid execute command \n"
-
-    def create_command(self, command_type):
-        """Creates a command object based on the command type.
+        LOGGER.debug("Execute command received: %s", function)
+        with self.state_lock:
+            self.subsystem.executable_commands[function]()
+        return f"Command {function} executed \n"
+
+    def command_request_multiple(self, *parameters):
+        """
+        Executes an 'mrequest' type command to get the values of several parameters at once.
         Args:
-            command_type (str): The type of command to be created
+            parameters (str): Names of the parameters to request from the subsystem state
+        Returns:
+            str: A line of JSON mapping each requested parameter to its value
+        """
+        with self.state_lock:
+            values = {parameter: self.subsystem.state[parameter] for parameter in parameters}
+        return encode_state(values)
+
+    def command_snapshot(self):
+        """
+        Executes a 'snapshot' type command to get the values of every parameter at once.
         Returns:
-            the method that was asked for in 'command_type'
+            str: A line of JSON mapping every parameter in the subsystem state to its value
         """
-        if command_type == 'request':
-            return self.command_request_data
-        if command_type == 'update':
-            return self.command_update_parameter
-        if command_type == 'execute':
-            return self.command_execute
-        return None
+        with self.state_lock:
+            values = dict(self.subsystem.state)
+        return encode_state(values)
+
+
+def encode_state(values):
+    """Encodes state values as a single compact line of JSON
+
+    Args:
+        values (dict): Parameter names mapped to their values
+    Returns:
+        str: The JSON encoded values, newline terminated
+    """
+    return json.dumps(values, separators=(',', ':'), default=str) + "\n"
 
 # pylint: disable=duplicate-code
 # no error
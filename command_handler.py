@@ -1,43 +1,455 @@
 """ This modules contains classes for handling commands.
 
-Commands are strings sent over TCP sockets.
+Commands are strings sent over TCP sockets, each terminated by a newline or NUL character.
+Several commands may arrive in one read (pipelining) or one command may be split across reads;
+the handler buffers the stream and processes every complete command in the order received.
 They are parsed into a command type and associated data.
 
+Several commands may also be sent as one batch command, with the subcommands separated by '|':
+    batch:switch_request:DFGM|switch_request:UHF_P
+Each subcommand is run in order and all of their responses are returned in a single write,
+each keeping its usual terminator.
+
+The handler records counts, errors, bytes in/out and a latency histogram for every command
+(see command_stats). The 'stats' command returns them as a line of JSON.
+
+Subsystems that expose telemetry (see CommandFactory.read_telemetry) let clients subscribe to
+samples pushed at a fixed rate, instead of polling for them (see subscriptions).
+
+A client may instead switch its connection to a compact binary encoding, closer to how the flight
+software talks to the real hardware, by sending BINARY_HANDSHAKE (0x02) as the very first byte.
+The handler answers with the same byte. All following requests and replies are then framed as
+(little-endian):
+    request:  <uint16 payload length> <uint8 opcode> <payload>
+    reply:    <uint16 payload length> <uint8 status> <payload>
+Opcodes number the registered commands in registration order, the order HELP lists them in
+(HELP itself is 0). Opcode 255 returns the statistics. Request arguments are packed back to back:
+an int as an int32, a float as a float64, a one_of choice as the uint8 index of the choice, and
+anything else as a uint8 length followed by that many UTF-8 bytes. A repeated argument is
+preceded by a uint8 count of its values. The reply payload is the response text without its
+terminator, with status 0 for success or 1 for an error.
+
 Copyright 2023 [Devin Headrick]. Licensed under the Apache License, Version 2.0
 """
 
+import collections
+import copy
+import re
+import struct
+import time
 # import to support abstract classes
 from abc import ABC, abstractmethod # pylint: disable=unused-import
 
+import command_stats
+import sim_logging
+import subscriptions
+
 
 COMMAND_DELIMITER = ':'
+# Commands are framed by either terminator, matching the NUL terminated Deployables responses
+FRAME_DELIMITER_PATTERN = re.compile(rb'[\n\0]')
+MAX_FRAME_SIZE = 4096  # in bytes, an unterminated command longer than this is discarded
+# In bytes, a client on a non-blocking socket that lets more responses than this back up unread
+# is disconnected
+MAX_PENDING_OUTPUT = 1 << 20
+BATCH_COMMAND = 'batch'
+BATCH_DELIMITER = '|'
+STATS_COMMAND = 'stats'
+
+BINARY_HANDSHAKE = b'\x02'  # STX, never the first byte of an ASCII command
+BINARY_REQUEST_HEADER = struct.Struct('<HB')  # payload length, opcode
+BINARY_REPLY_HEADER = struct.Struct('<HB')  # payload length, status
+BINARY_STATUS_OK = 0
+BINARY_STATUS_ERROR = 1
+BINARY_STATS_OPCODE = 0xFF
+BINARY_INT = struct.Struct('<i')
+BINARY_FLOAT = struct.Struct('<d')
+
+LOGGER = sim_logging.get_logger("command_handler")
+
+HELP_COMMAND = 'help'
+
+
+def one_of(choices):
+    """Create an argument converter that only accepts one of the given choices
+
+    Args:
+        choices (Container): The accepted argument values (e.g. the keys of a state dictionary)
+
+    Returns:
+        function: A converter returning its argument, raising KeyError for anything else
+    """
+    def convert(arg):
+        if arg not in choices:
+            raise KeyError(arg)
+        return arg
+    # Binary encoded commands send the index of the choice instead
+    convert.choices = tuple(choices)
+    return convert
+
+
+class Repeated(): # pylint: disable=too-few-public-methods
+    """Marks the last argument of a command as accepting one or more values
+
+    Args:
+        converter (callable): The converter applied to each of the values
+    """
+
+    def __init__(self, converter):
+        self.converter = converter
+
+
+def compile_validator(converters):
+    """Compile the arity and conversion checks for a command into a single function
+
+    Specialised validators are built for the common 0, 1 and 2 argument cases so that
+    validating a command does no looping or length comparisons beyond tuple unpacking.
+
+    Args:
+        converters (tuple): One converter (callable taking a str) per expected argument.
+            The last converter may be wrapped in Repeated to accept one or more values.
+
+    Returns:
+        function: Takes the list of string params, returns the tuple of converted arguments.
+            Raises ValueError for the wrong number of params, or whatever a converter raises.
+    """
+    if converters and isinstance(converters[-1], Repeated):
+        fixed_converters = converters[:-1]
+        convert_repeated = converters[-1].converter
+        arity = len(fixed_converters)
+
+        def validate(params):
+            if len(params) <= arity:
+                raise ValueError(f"command takes at least {arity + 1} arguments")
+            return (tuple(convert(param) for convert, param in zip(fixed_converters, params))
+                    + tuple(convert_repeated(param) for param in params[arity:]))
+
+    elif not converters:
+        def validate(params):
+            if params:
+                raise ValueError("command takes no arguments")
+            return ()
+
+    elif len(converters) == 1:
+        (convert,) = converters
+
+        def validate(params):
+            (param,) = params
+            return (convert(param),)
+
+    elif len(converters) == 2:
+        convert_first, convert_second = converters
+
+        def validate(params):
+            first, second = params
+            return (convert_first(first), convert_second(second))
+
+    else:
+        arity = len(converters)
+
+        def validate(params):
+            if len(params) != arity:
+                raise ValueError(f"command takes {arity} arguments")
+            return tuple(convert(param) for convert, param in zip(converters, params))
+
+    return validate
+
+
+def binary_argument_decoder(converter):
+    """Create the function decoding one binary packed argument of a command
+
+    Args:
+        converter (callable): The converter of the argument
+
+    Returns:
+        function: Takes the payload and the offset of the argument in it, returns the converted
+            argument and the offset of the next one. Raises for a malformed argument.
+    """
+    if converter is int or converter is float:
+        binary_format = BINARY_INT if converter is int else BINARY_FLOAT
+
+        def decode(payload, offset):
+            return binary_format.unpack_from(payload, offset)[0], offset + binary_format.size
+
+    elif hasattr(converter, 'choices'):
+        choices = converter.choices
+
+        def decode(payload, offset):
+            return choices[payload[offset]], offset + 1
+
+    else:
+        def decode(payload, offset):
+            end = offset + 1 + payload[offset]
+            if end > len(payload):
+                raise ValueError("argument runs past the end of the payload")
+            return converter(bytes(payload[offset + 1:end]).decode()), end
+
+    return decode
+
+
+def compile_binary_decoder(converters):
+    """Compile the decoding of a command's binary packed arguments into a single function
+
+    Args:
+        converters (tuple): The converters of the command, as given to compile_validator
+
+    Returns:
+        function: Takes the payload, returns the list of converted arguments.
+            Raises ValueError, IndexError or struct.error for a malformed payload, or whatever
+            a converter raises.
+    """
+    decode_repeated = None
+    if converters and isinstance(converters[-1], Repeated):
+        decode_repeated = binary_argument_decoder(converters[-1].converter)
+        converters = converters[:-1]
+    decoders = tuple(binary_argument_decoder(converter) for converter in converters)
+
+    def decode(payload):
+        args = []
+        offset = 0
+        for decode_argument in decoders:
+            arg, offset = decode_argument(payload, offset)
+            args.append(arg)
+
+        if decode_repeated is not None:
+            count = payload[offset]
+            offset += 1
+            if not count:
+                raise ValueError("repeated argument takes at least 1 value")
+            for _ in range(count):
+                arg, offset = decode_repeated(payload, offset)
+                args.append(arg)
+
+        if offset != len(payload):
+            raise ValueError("payload is longer than the arguments")
+        return args
+
+    return decode
+
+
+def encode_binary_request(opcode, payload=b''):
+    """Frame a binary encoded request, for clients of the binary encoding
+
+    Args:
+        opcode (int): The opcode of the command
+        payload (bytes): The packed arguments of the command
+
+    Returns:
+        bytes: The framed request
+    """
+    return BINARY_REQUEST_HEADER.pack(len(payload), opcode) + payload
+
+
+def encode_binary_reply(response, error):
+    """Frame the response of a command as a binary encoded reply
+
+    Args:
+        response (str): The response of the command
+        error (bool): Whether the response is an error
+
+    Returns:
+        bytes: The framed reply, the response without its terminator
+    """
+    payload = response.rstrip("\n\0 ").encode()
+    status = BINARY_STATUS_ERROR if error else BINARY_STATUS_OK
+    return BINARY_REPLY_HEADER.pack(len(payload), status) + payload
 
-# Abstract command factory class - subsystems extend this class based
-# on the commands they support
-class CommandFactory(): # pylint: disable=too-few-public-methods
-    """Factory class to create command objects based on command type"""
 
-    @abstractmethod
+class RegisteredCommand(): # pylint: disable=too-few-public-methods
+    """A command handler bound once at startup along with its compiled argument validator
+
+    Calling the command with its list of string params validates and converts them, then
+    calls the handler with the converted arguments. Handlers therefore never check arity or
+    convert arguments themselves; invalid params get the command's error response.
+    """
+    __slots__ = ('name', 'handler', 'arg_names', 'description', 'error_response', 'validate',
+                 'decode_binary')
+
+    def __init__(self, name, handler, args=(), description='', # pylint: disable=too-many-arguments
+                 error_response=None):
+        """
+        Args:
+            name (str): The command type the command is registered under
+            handler (callable): Called with the converted arguments, returns the response
+            args (tuple): (argument name, converter) pairs, one per expected argument
+            description (str): A short description of the command for the HELP output
+            error_response (str): The response sent when the params are invalid
+        """
+        self.name = name
+        self.handler = handler
+        self.arg_names = tuple(f"<{arg_name}>..." if isinstance(converter, Repeated)
+                               else f"<{arg_name}>" for arg_name, converter in args)
+        self.description = description
+        self.error_response = error_response or f"ERROR: Invalid {name} command \n"
+        converters = tuple(converter for _, converter in args)
+        self.validate = compile_validator(converters)
+        self.decode_binary = compile_binary_decoder(converters)
+
+    def __call__(self, params):
+        try:
+            args = self.validate(params)
+        except (ValueError, KeyError, TypeError):
+            return self.error_response
+        return self.handler(*args)
+
+    def run_binary(self, payload):
+        """Run the command with its arguments binary packed in a payload
+
+        Args:
+            payload (bytes): The packed arguments (see the module docstring)
+
+        Returns:
+            str: The response of the command, or its error response for a malformed payload
+        """
+        try:
+            args = self.decode_binary(payload)
+        except (ValueError, KeyError, TypeError, IndexError, struct.error):
+            return self.error_response
+        return self.handler(*args)
+
+    def usage(self):
+        """Returns the usage of the command, e.g. 'burnwire_set:<deployable>:<value>'"""
+        return COMMAND_DELIMITER.join((self.name,) + self.arg_names)
+
+
+# Command factory base class - subsystems extend this class and register the commands
+# they support on construction
+class CommandFactory():
+    """Factory class to create command objects based on command type
+
+    Commands are registered once, as pre-bound callables with their argument converters, in a
+    dictionary keyed on command type. Creating a command is then a single dictionary lookup.
+    A HELP command listing every registered command is always available.
+
+    Each command is also given an opcode, its position in the registration order, for
+    connections using the binary encoding.
+    """
+    response_terminator = '\n'
+    invalid_command_response = "ERROR: Invalid command type \0"
+    # The parameters clients may subscribe to, each readable with read_telemetry
+    telemetry_parameters = ()
+    # The subsystem's entry in the EPS power table (see power_table), None if always powered
+    power_switch = None
+
+    def __init__(self):
+        self.commands = {}
+        self.opcodes = []
+        self.register_command(HELP_COMMAND, self.command_help,
+                              description="List all available commands")
+
+    def register_command(self, name, handler, args=(), description='', # pylint: disable=too-many-arguments
+                         error_response=None):
+        """Register a command with the factory
+
+        Args:
+            name (str): The command type the command is registered under
+            handler (callable): Called with the converted arguments, returns the response
+            args (tuple): (argument name, converter) pairs, one per expected argument
+            description (str): A short description of the command for the HELP output
+            error_response (str): The response sent when the params are invalid
+        """
+        if error_response is None:
+            error_response = f"ERROR: Invalid {name} command {self.response_terminator}"
+        command = RegisteredCommand(name, handler, args, description, error_response)
+
+        # Registering a command again replaces it, keeping its opcode
+        if name in self.commands:
+            self.opcodes[self.opcodes.index(self.commands[name])] = command
+        else:
+            self.opcodes.append(command)
+        self.commands[name] = command
+
     def create_command(self, command_type):
-        """Abstract method to create a command object based on command type
+        """Get the registered command object for a command type
         Args:
             command_type (str): The type of command to be created
 
         Returns:
-            Command: A command object of the associated command type
+            RegisteredCommand: The command object of the associated command type, or None
+        """
+        return self.commands.get(command_type)
+
+    def keyword(self, command_type):
+        """Returns a command type as it is compared to the keywords the handler itself answers
+        (batch, stats, subscribe and unsubscribe). Case sensitive, unless a subsystem overrides it
+        """
+        return command_type
+
+    def command_by_opcode(self, opcode):
+        """Get the registered command object for a binary encoded command's opcode
+        Args:
+            opcode (int): The opcode of the command
+
+        Returns:
+            RegisteredCommand: The command object with the opcode, or None
         """
+        if opcode < len(self.opcodes):
+            return self.opcodes[opcode]
+        return None
 
+    def is_error_response(self, response):
+        """Whether a command's response is an error, for the statistics and binary replies
 
-class CommandHandler():
+        Args:
+            response (str): The response of a command
+
+        Returns:
+            bool: True for an error response
+        """
+        return response.startswith("ERROR")
+
+    def read_telemetry(self, parameters):
+        """Read the current values of telemetry parameters, for a subscription sample
+
+        Only called with names from telemetry_parameters, so factories that declare any must
+        override this. Without telemetry every parameter is unknown.
+
+        Args:
+            parameters (tuple): The names of the parameters to read
+
+        Returns:
+            tuple: (timestamp in seconds, list of the value of each parameter)
+        """
+        raise KeyError(parameters[0])
+
+    def command_help(self):
+        """Returns the usage and description of every registered command, one per line"""
+        lines = [f"{command.usage()} | {command.description}"
+                 for command in self.commands.values()]
+        return "\n".join(lines) + self.response_terminator
+
+
+class CommandHandler(): # pylint: disable=too-many-instance-attributes
     """This takes a client socket arg and uses it to listen for commands
 
     This class can be used by various subsystems that are 'intelligent'.
     They may listen for commands from the client socket and process them.
+
+    One handler is bound to one client connection. The socket_stuff module creates a copy of
+    the handler for each client that connects (see create_connection_handler), so all clients
+    share the same command factory while keeping their own connection state.
+
+    Responses are written with sendall(), unless the connection is given an on_output_change
+    callback: its socket is then non-blocking, and responses it does not take at once are kept
+    in pending_output until the event loop finds it writable and calls drain_output().
+    on_output_change is called whenever the output pending, or the connection, may have changed.
     """
     client_socket = None
+    client_connected = False
+    receive_buffer = b''
+    transmit_buffer = None
+    pending_output = None
+    pending_size = 0
+    on_output_change = None
+    awaiting_handshake = False
+    binary_mode = False
+    subscription = None
 
     def __init__(self, command_factory):
         self.command_factory = command_factory
+        # Shared by the copies made for each connection, so covers every client
+        self.stats = command_stats.CommandStats()
+        self.push_scheduler = subscriptions.PushScheduler()
 
     def set_client_socket(self, client_socket):
         """Set the client socket.
@@ -50,27 +462,139 @@ class CommandHandler():
             client_socket (socket): The client socket to use
         """
         self.client_socket = client_socket
+        self.client_connected = True
+        self.receive_buffer = b''
+        self.transmit_buffer = []
+        self.pending_output = collections.deque()  # memoryviews of what is left of each write
+        self.pending_size = 0
+        self.awaiting_handshake = True
+        self.binary_mode = False
+        self.subscription = None
+
+    def create_connection_handler(self, client_socket):
+        """Create a copy of this handler bound to a single client connection
 
+        Args:
+            client_socket (socket): The newly accepted client socket
+
+        Returns:
+            CommandHandler: A handler sharing this handler's command factory
+        """
+        handler = copy.copy(self)
+        handler.set_client_socket(client_socket)
+        return handler
 
     def handle_command(self):
         """Listen for commands from the client socket and processes them"""
-        while True:
+        while self.client_connected:
             try:
-                data = self.client_socket.recv(1024).decode().strip()
+                data = self.client_socket.recv(1024)
                 if data:
-                    print("RAW data received: " + data, flush=True)
-                    parsed_command = self.parse_command(data)
-                    self.process_command(parsed_command)
+                    self.handle_data(data)
 
                 else:
+                    self.handle_disconnect()
                     break
 
-            except BrokenPipeError:
-                print("Client disconnected abruptly", flush=True)
+            except ConnectionError:
+                LOGGER.info("Client disconnected abruptly")
                 break
 
         self.client_socket.close()
 
+    def handle_data(self, data, end_of_message=False):
+        """Buffer data received from the client socket and process every complete command in it
+
+        Responses to all the commands completed by this data are sent back in a single write.
+        The first byte received decides whether the connection uses the binary encoding.
+
+        Args:
+            data (bytes): The raw bytes received from the client
+            end_of_message (bool): The data is a whole message of a message oriented
+                (SOCK_SEQPACKET) connection, so its last command is complete even if unterminated
+
+        Returns:
+            bool: False once the client can no longer be sent responses, True otherwise
+        """
+        power_switch = self.command_factory.power_switch
+        if power_switch is not None and not power_switch.is_on():
+            LOGGER.debug("Powered off, ignoring %d bytes", len(data))
+            return self.client_connected
+
+        if self.awaiting_handshake:
+            self.awaiting_handshake = False
+            if data[:1] == BINARY_HANDSHAKE:
+                self.binary_mode = True
+                self.send_response(BINARY_HANDSHAKE)
+                data = data[1:]
+
+        if self.binary_mode:
+            self.handle_binary_data(data)
+
+        else:
+            *frames, self.receive_buffer = FRAME_DELIMITER_PATTERN.split(
+                self.receive_buffer + data)
+
+            for frame in frames:
+                self.handle_frame(frame)
+
+            if end_of_message and self.receive_buffer:
+                self.handle_frame(self.receive_buffer)
+                self.receive_buffer = b''
+
+            if len(self.receive_buffer) > MAX_FRAME_SIZE:
+                self.receive_buffer = b''
+                self.send_response("ERROR: Command too long \0")
+
+        self.flush_responses()
+        return self.client_connected
+
+    def handle_binary_data(self, data):
+        """Buffer binary encoded data and process every complete request in it
+
+        Args:
+            data (bytes): The raw bytes received from the client
+        """
+        buffer = self.receive_buffer + data
+        header_size = BINARY_REQUEST_HEADER.size
+        offset = 0
+
+        while len(buffer) - offset >= header_size:
+            length, opcode = BINARY_REQUEST_HEADER.unpack_from(buffer, offset)
+            end = offset + header_size + length
+            if end > len(buffer):
+                break
+            self.process_binary_command(opcode, buffer[offset + header_size:end])
+            offset = end
+
+        self.receive_buffer = buffer[offset:]
+
+    def handle_frame(self, frame):
+        """Decode, parse and process a single command frame
+
+        Args:
+            frame (bytes): One command with its terminator removed
+        """
+        command = frame.decode(errors="replace").strip()
+        if command:
+            LOGGER.debug("RAW data received: %s", command)
+            parsed_command = self.parse_command(command)
+            self.process_command(parsed_command)
+
+    def handle_disconnect(self):
+        """Called once the client has closed its side of the connection
+
+        A final command without a terminator (e.g. sent with 'echo -n') is still processed,
+        as the client may be waiting on the response before closing its side. An incomplete
+        binary encoded request is discarded.
+        """
+        if self.receive_buffer and not self.binary_mode:
+            self.handle_frame(self.receive_buffer)
+            self.receive_buffer = b''
+            self.flush_responses()
+        self.client_connected = False
+        self.subscription = None
+
     def parse_command(self, command):
         """Parse the command into consituent command type, and associated data
 
@@ -84,32 +608,213 @@ class CommandHandler():
         return command.split(COMMAND_DELIMITER)
 
     def process_command(self, command):
-        """Process command data based on the command type
+        """Process command data based on the command type, and send back the response
 
         Args:
-            command_type (str): The type of command to be processed
-            params (list): The associated data for the command
+            command (list): The parsed command, command type first followed by its params
+        """
+
+        keyword = self.command_factory.keyword(command[0])
+        if keyword == BATCH_COMMAND:
+            response = self.run_batch(command[1:])
+        elif keyword == STATS_COMMAND:
+            response = self.stats.report() + self.command_factory.response_terminator
+        elif keyword == subscriptions.SUBSCRIBE_COMMAND:
+            response = self.subscribe(command[1:])
+        elif keyword == subscriptions.UNSUBSCRIBE_COMMAND:
+            self.subscription = None
+            response = "Unsubscribed" + self.command_factory.response_terminator
+        else:
+            response = self.run_command(command)
+
+        self.send_response(response)
+
+    def subscribe(self, params):
+        """Subscribe the connection to telemetry samples, replacing any existing subscription
+
+        Args:
+            params (list): The subscribe command params: parameters, period in ms and optionally
+                a change threshold
+
+        Returns:
+            str: The response to the subscribe command
+        """
+        subscription = subscriptions.parse_subscription(
+            params, self.command_factory.telemetry_parameters)
+        if subscription is None:
+            return self.command_factory.invalid_command_response
+
+        self.subscription = subscription
+        self.push_scheduler.schedule(self, subscription)
+        return (f"Subscribed to {subscriptions.PARAMETER_DELIMITER.join(subscription.parameters)}"
+                f" every {round(subscription.period * 1000)} ms"
+                f"{self.command_factory.response_terminator}")
+
+    def push_sample(self):
+        """Read and push a sample of the subscribed telemetry, if it should be pushed
+
+        A connection that can no longer be written to is closed, with its subscription.
+        """
+        timestamp, values = self.command_factory.read_telemetry(self.subscription.parameters)
+        sample = self.subscription.sample(timestamp, values)
+        if sample is None:
+            return
+        self.send_response(sample + self.command_factory.response_terminator)
+        self.flush_responses()
+        if not self.client_connected:
+            self.subscription = None
+
+    def run_command(self, command):
+        """Run a single parsed command using the command factory, recording its statistics
+
+        Args:
+            command (list): The parsed command, command type first followed by its params
 
         Returns:
             str: A string containing the response to the command
         """
 
+        start = time.perf_counter()
         command_type = command[0]
         params = command[1:]
 
         command_obj = self.command_factory.create_command(command_type)
 
         if command_obj is not None:
+            command_type = command_obj.name
             response = command_obj(params)
         else:
-            response = "ERROR: Invalid command type \0"
+            command_type = command_stats.INVALID_COMMAND
+            response = self.command_factory.invalid_command_response
 
-        try:
-            self.client_socket.sendall(response.encode())
+        # The command's size is the length of its parts plus the delimiters between them
+        self.stats.record(command_type, time.perf_counter() - start,
+                          sum(map(len, command)) + len(params), len(response),
+                          self.command_factory.is_error_response(response))
+        return response
+
+    def process_binary_command(self, opcode, payload):
+        """Process a binary encoded command, and send back the binary encoded response
+
+        Args:
+            opcode (int): The opcode of the command
+            payload (bytes): The packed arguments of the command
+        """
+        if opcode == BINARY_STATS_OPCODE:
+            response = self.stats.report()
+        else:
+            response = self.run_binary_command(opcode, payload)
+
+        self.send_response(encode_binary_reply(
+            response, self.command_factory.is_error_response(response)))
+
+    def run_binary_command(self, opcode, payload):
+        """Run a single binary encoded command, recording its statistics
+
+        Args:
+            opcode (int): The opcode of the command
+            payload (bytes): The packed arguments of the command
 
-        except BrokenPipeError:
-            print("Client disconnected abruptly")
-            self.client_socket.close()
+        Returns:
+            str: A string containing the response to the command
+        """
+        start = time.perf_counter()
+        command_obj = self.command_factory.command_by_opcode(opcode)
+
+        if command_obj is not None:
+            command_type = command_obj.name
+            response = command_obj.run_binary(payload)
+        else:
+            command_type = command_stats.INVALID_COMMAND
+            response = "ERROR: Invalid opcode \0"
+
+        self.stats.record(command_type, time.perf_counter() - start,
+                          BINARY_REQUEST_HEADER.size + len(payload), len(response),
+                          self.command_factory.is_error_response(response))
+        return response
+
+    def run_batch(self, params):
+        """Run each subcommand of a batch command in order
+
+        Args:
+            params (list): The batch command params, still split on the command delimiter
+
+        Returns:
+            str: The responses of every subcommand, concatenated in order
+        """
+
+        subcommands = COMMAND_DELIMITER.join(params).split(BATCH_DELIMITER)
+        responses = [self.run_command(self.parse_command(subcommand.strip()))
+                     for subcommand in subcommands if subcommand.strip()]
+
+        if not responses:
+            return "ERROR: Empty batch command \0"
+        return "".join(responses)
+
+    def send_response(self, response):
+        """Queue a response to be sent to the client on the next flush
+
+        Args:
+            response (str or bytes): The response to send
+        """
+        self.transmit_buffer.append(response.encode() if isinstance(response, str) else response)
+
+    def flush_responses(self):
+        """Send all queued responses to the client in one write
+
+        Marks the client disconnected if it has gone away, or a write to it failed part way
+        through a response, so the connection is closed rather than left holding part of one.
+        """
+        if not self.transmit_buffer or not self.client_connected:
+            self.transmit_buffer.clear()
+            return
+
+        data = b"".join(self.transmit_buffer)
+        self.transmit_buffer.clear()
+        if self.on_output_change is None:
+            try:
+                self.client_socket.sendall(data)
+            except OSError as error_msg:
+                LOGGER.info("Client disconnected abruptly: %s", error_msg)
+                self.client_connected = False
+            return
+
+        self.pending_output.append(memoryview(data))
+        self.pending_size += len(data)
+        if self.pending_size > MAX_PENDING_OUTPUT:
+            LOGGER.info("Client not reading its responses, disconnecting it")
+            self.lose_connection()
+        elif len(self.pending_output) == 1:
+            # Nothing was already waiting for the socket to become writable
+            self.drain_output()
+
+    def drain_output(self):
+        """Write as much of the pending output as the non-blocking socket takes"""
+        pending = self.pending_output
+        try:
+            while pending:
+                sent = self.client_socket.send(pending[0])
+                self.pending_size -= sent
+                if sent < len(pending[0]):
+                    pending[0] = pending[0][sent:]
+                    break
+                pending.popleft()
+        except BlockingIOError:
+            pass
+        except OSError as error_msg:
+            LOGGER.info("Client disconnected abruptly: %s", error_msg)
+            self.lose_connection()
+            return
+        if self.on_output_change is not None:
+            self.on_output_change(self)
+
+    def lose_connection(self):
+        """Mark the client disconnected, discarding any output it has not been sent"""
+        self.client_connected = False
+        self.pending_output.clear()
+        self.pending_size = 0
+        if self.on_output_change is not None:
+            self.on_output_change(self)
 
 
 # pylint: disable=duplicate-code
@@ -0,0 +1,108 @@
+"""This module contains a class for recording per command statistics in the simulated subsystems
+
+For each command name the simulators record the number of times it ran, how many of those were
+errors, the bytes received and sent, and a histogram of how long it took to handle. Histogram
+buckets are fixed, so recording a command is a dictionary lookup, a bisect and a few additions.
+
+The statistics are returned by each simulator's 'stats' command as a single line of JSON:
+    {"uptime_s": 12.5, "buckets_us": [10, 25, ...],
+     "commands": {"request": {"count": 3, "errors": 0, "bytes_in": 45, "bytes_out": 18,
+                              "mean_us": 14.2, "histogram": [0, 3, 0, ...]}}}
+The histogram holds one count per bucket in buckets_us (counting latencies up to and including
+that many microseconds), followed by one count of latencies above the last bucket.
+
+Copyright 2024 [Devin Headrick]. Licensed under the Apache License, Version 2.0
+"""
+
+import bisect
+import json
+import threading
+import time
+
+# Upper bounds of the latency histogram buckets, in microseconds
+LATENCY_BUCKETS_US = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000,
+                      100000, 250000, 1000000)
+INVALID_COMMAND = "invalid"  # Name recorded for unrecognised commands, keeping names bounded
+
+# Indices into each command's list of counters
+COUNT, ERRORS, BYTES_IN, BYTES_OUT, TOTAL_LATENCY_US, HISTOGRAM = range(6)
+
+
+class CommandStats():
+    """Records counts, errors, bytes in/out and a latency histogram for each command name
+
+    Safe to use from several threads at once.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.monotonic()
+        self.commands = {}
+
+    def record(self, name, latency, bytes_in, bytes_out, error=False): # pylint: disable=too-many-arguments
+        """Record one run of a command
+
+        Args:
+            name (str): The command name. Callers should only pass recognised command names
+                (or INVALID_COMMAND) so the number of names stays bounded.
+            latency (float): How long the command took to handle, in seconds
+            bytes_in (int): The size of the command received
+            bytes_out (int): The size of the response sent
+            error (bool): Whether the command failed
+        """
+        latency_us = latency * 1e6
+        bucket = bisect.bisect_left(LATENCY_BUCKETS_US, latency_us)
+
+        with self.lock:
+            counters = self.commands.get(name)
+            if counters is None:
+                counters = [0, 0, 0, 0, 0.0, [0] * (len(LATENCY_BUCKETS_US) + 1)]
+                self.commands[name] = counters
+            counters[COUNT] += 1
+            counters[ERRORS] += error
+            counters[BYTES_IN] += bytes_in
+            counters[BYTES_OUT] += bytes_out
+            counters[TOTAL_LATENCY_US] += latency_us
+            counters[HISTOGRAM][bucket] += 1
+
+    def report(self):
+        """Get the statistics recorded so far
+
+        Returns:
+            str: The statistics as a single line of JSON (without a terminator)
+        """
+        with self.lock:
+            commands = {
+                name: {
+                    "count": counters[COUNT],
+                    "errors": counters[ERRORS],
+                    "bytes_in": counters[BYTES_IN],
+                    "bytes_out": counters[BYTES_OUT],
+                    "mean_us": round(counters[TOTAL_LATENCY_US] / counters[COUNT], 2),
+                    "histogram": list(counters[HISTOGRAM]),
+                }
+                for name, counters in self.commands.items()
+            }
+
+        return json.dumps({
+            "uptime_s": round(time.monotonic() - self.start_time, 3),
+            "buckets_us": LATENCY_BUCKETS_US,
+            "commands": commands,
+        }, separators=(',', ':'))
+
+
+# pylint: disable=duplicate-code
+# no error
+__author__ = "Devin Headrick"
+__copyright__ = """
+    Copyright 2024 [Devin Headrick]
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License."""
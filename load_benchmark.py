@@ -0,0 +1,551 @@
+"""This program load tests the simulated subsystems and reports their throughput and latency
+
+The chosen simulator is started on free ephemeral ports (so runs never collide with simulators
+already running on the default ports), then driven by a number of concurrent clients for a fixed
+duration. Each client cycles through a mix of commands, sending one command and waiting for its
+response before sending the next. The results are printed as JSON.
+
+Clients of simulators whose responses are terminated may instead pipeline commands, writing
+several at once and then reading all of their responses. Each command of a pipelined write is
+recorded with the latency of the whole write.
+
+Simulators are driven in one of three ways:
+    - request  - send a command, wait for the response (EPS, Deployables, IRIS, ADCS, GPS)
+    - relay    - send data into the UHF UART server, wait for it to come out of the radio server
+    - stream   - connect and time the packets the simulator emits on its own (DFGM)
+For the stream mode the latency reported is the time between consecutive packets.
+
+A run can be compared against a stored baseline. The program exits with status 1 if throughput
+dropped, or p99 latency grew, by more than the allowed tolerance.
+
+Usage:
+    python3 load_benchmark.py EPS --clients 8 --duration 5
+    python3 load_benchmark.py EPS --clients 50 --pipeline 8
+    python3 load_benchmark.py Deployables --command switch_request:DFGM@3 --command help
+    python3 load_benchmark.py EPS --save-baseline eps_baseline.json
+    python3 load_benchmark.py EPS --baseline eps_baseline.json --tolerance 0.2
+
+Copyright 2024 [Devin Headrick]. Licensed under the Apache License, Version 2.0
+"""
+
+import argparse
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+HOST = '127.0.0.1'
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STARTUP_TIMEOUT = 10.0  # seconds to wait for a simulator to accept connections
+RESPONSE_TIMEOUT = 5.0  # seconds to wait for a single response before counting an error
+RECV_SIZE = 65536
+DEFAULT_TOLERANCE = 0.10  # allowed fractional regression against a baseline
+
+# How to start and talk to each simulator. 'args' builds the command line from the ports
+# allocated to the simulator. 'suffix' is appended to every command sent. 'terminator' ends
+# every response; None means a response is whatever a single recv returns. 'max_clients' is set
+# for simulators that only serve a single connection at a time.
+TARGETS = {
+    "EPS": {
+        "script": "EPS/eps_subsystem.py",
+        "ports": 1,
+        "args": lambda ports: [str(ports[0])],
+        "mode": "request",
+        "suffix": b"\n",
+        "terminator": b"\n",
+        "commands": ("request:Voltage", "request:Current", "request:Temperature",
+                     "execute:SubsystemState:GPS"),
+    },
+    "Deployables": {
+        "script": "Deployables/deployables_subsystem.py",
+        "ports": 1,
+        "args": lambda ports: [str(ports[0])],
+        "mode": "request",
+        "suffix": b"\n",
+        "terminator": b"\0",
+        "commands": ("switch_request:DFGM", "switch_request:UHF_P", "switch_request:SOLAR_S"),
+    },
+    "IRIS": {
+        "script": "IRIS/iris_simulated_server.py",
+        "ports": 1,
+        "args": lambda ports: [str(ports[0])],
+        "mode": "request",
+        "suffix": b"",
+        "terminator": b"|END|",
+        "commands": ("FNI", "FTT", "FSI:1", "FTH"),
+        "max_clients": 1,
+    },
+    "ADCS": {
+        "script": "ADCS/adcs_server.py",
+        "ports": 1,
+        "args": lambda ports: [str(ports[0]), HOST],
+        "mode": "request",
+        "suffix": b"\n",
+        "terminator": None,
+        "commands": ("GS", "GWS", "GMC", "GOR"),
+        "max_clients": 1,
+    },
+    "GPS": {
+        "script": "GPS/server.py",
+        "ports": 1,
+        "args": lambda ports: [str(ports[0])],
+        "mode": "request",
+        "suffix": b"",
+        "terminator": None,
+        "commands": ("time", "latlong", "returnstate", "ping"),
+        "goodbye": b"disconnect",
+        "max_clients": 1,
+    },
+    "UHF": {
+        "script": "UHF/simulated_uhf.py",
+        "ports": 3,
+        "args": lambda ports: ["--uart-port", str(ports[0]), "--radio-port", str(ports[1]),
+                               "--beacon-port", str(ports[2])],
+        "mode": "relay",
+        "commands": ("ping from the comms handler",),
+        "max_clients": 1,
+    },
+    "DFGM": {
+        "script": "DFGM/dfgm_subsystem.py",
+        "ports": 1,
+        "args": lambda ports: [str(ports[0])],
+        "mode": "stream",
+        "packet_size": 1248,
+        "commands": (),
+        "max_clients": 1,
+    },
+}
+
+
+class ClientResult(): # pylint: disable=too-few-public-methods
+    """Latencies and error count recorded by a single benchmark client"""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+
+
+def find_free_ports(count):
+    """Ask the OS for free ephemeral ports
+
+    Args:
+        count (int): The number of ports needed
+
+    Returns:
+        list: The port numbers
+    """
+    sockets = []
+    try:
+        for _ in range(count):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind((HOST, 0))
+            sockets.append(sock)
+        return [sock.getsockname()[1] for sock in sockets]
+    finally:
+        for sock in sockets:
+            sock.close()
+
+
+def port_is_bound(port):
+    """Check whether a simulator has bound a port, without connecting to it
+
+    Connecting would use up the only connection some simulators ever accept, so instead try to
+    bind the port ourselves; failing to do so means the simulator holds it.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        try:
+            sock.bind((HOST, port))
+        except OSError:
+            return True
+    return False
+
+
+def start_simulator(target, ports):
+    """Start a simulator on the given ports and wait until they are all bound
+
+    Args:
+        target (dict): The target description from TARGETS
+        ports (list): The ports to start the simulator on
+
+    Returns:
+        subprocess.Popen: The running simulator process
+    """
+    script = os.path.join(REPO_DIR, target["script"])
+    # Without the EPS power table the simulator is always powered, whatever else is running
+    env = dict(os.environ, SIM_LOG_LEVEL="quiet", SIM_POWER_TABLE="")
+    # Run from their own directory, as they are by hand
+    process = subprocess.Popen(  # pylint: disable=consider-using-with
+        [sys.executable, script] + target["args"](ports), cwd=os.path.dirname(script), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while not all(port_is_bound(port) for port in ports):
+        if process.poll() is not None or time.monotonic() > deadline:
+            stop_simulator(process)
+            raise RuntimeError(f"{target['script']} failed to start on ports {ports}")
+        time.sleep(0.05)
+    return process
+
+
+def stop_simulator(process):
+    """Stop a simulator process started by start_simulator"""
+    process.terminate()
+    try:
+        process.wait(timeout=2)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def connect(port):
+    """Connect to a simulator, retrying while it finishes starting to listen"""
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while True:
+        try:
+            sock = socket.create_connection((HOST, port), timeout=RESPONSE_TIMEOUT)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return sock
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def expected_responses(command):
+    """The number of terminated responses a command produces (one per batch subcommand)"""
+    if command.startswith("batch:"):
+        return command.count("|") + 1
+    return 1
+
+
+def read_response(sock, terminator, count):
+    """Read a response from the socket
+
+    Args:
+        sock (socket): The connected socket
+        terminator (bytes): The terminator ending each response, or None for a single recv
+        count (int): The number of terminated responses to read
+
+    Returns:
+        bytes: The response data
+    """
+    data = sock.recv(RECV_SIZE)
+    if not data:
+        raise ConnectionError("simulator closed the connection")
+    if terminator is None:
+        return data
+    while data.count(terminator) < count:
+        chunk = sock.recv(RECV_SIZE)
+        if not chunk:
+            raise ConnectionError("simulator closed the connection")
+        data += chunk
+    return data
+
+
+def run_request_client(target, ports, commands, deadline, result):
+    """Send commands, 'pipeline' at a time, until the deadline, recording the latency of each"""
+    terminator = target["terminator"]
+    suffix = target["suffix"]
+    pipeline = target.get("pipeline", 1)
+    with connect(ports[0]) as sock:
+        while time.monotonic() < deadline:
+            pipelined = list(itertools.islice(commands, pipeline))
+            if not pipelined:
+                break
+            message = b"".join(command.encode() + suffix for command in pipelined)
+            start = time.perf_counter()
+            try:
+                sock.sendall(message)
+                read_response(sock, terminator,
+                              sum(expected_responses(command) for command in pipelined))
+            except OSError:
+                result.errors += 1
+                return
+            result.latencies.extend([time.perf_counter() - start] * len(pipelined))
+
+        if "goodbye" in target:
+            sock.sendall(target["goodbye"])
+
+
+def run_relay_client(_target, ports, commands, deadline, result):
+    """Relay data from the UHF UART server to the radio server until the deadline"""
+    with connect(ports[1]) as radio, connect(ports[0]) as uart:
+        for command in commands:
+            if time.monotonic() >= deadline:
+                break
+            message = command.encode()
+            received = b""
+            start = time.perf_counter()
+            try:
+                uart.sendall(message)
+                while len(received) < len(message):
+                    chunk = radio.recv(RECV_SIZE)
+                    if not chunk:
+                        raise ConnectionError("simulator closed the connection")
+                    received += chunk
+            except OSError:
+                result.errors += 1
+                return
+            result.latencies.append(time.perf_counter() - start)
+
+
+def run_stream_client(target, ports, _commands, deadline, result):
+    """Read the packets a simulator emits until the deadline, recording their spacing"""
+    packet_size = target["packet_size"]
+    with connect(ports[0]) as sock:
+        buffer = b""
+        last_packet = None
+        while time.monotonic() < deadline:
+            try:
+                chunk = sock.recv(RECV_SIZE)
+            except OSError:
+                result.errors += 1
+                return
+            if not chunk:
+                result.errors += 1
+                return
+            buffer += chunk
+            while len(buffer) >= packet_size:
+                buffer = buffer[packet_size:]
+                now = time.perf_counter()
+                if last_packet is not None:
+                    result.latencies.append(now - last_packet)
+                last_packet = now
+
+
+CLIENT_RUNNERS = {
+    "request": run_request_client,
+    "relay": run_relay_client,
+    "stream": run_stream_client,
+}
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(name, clients, duration, results):
+    """Combine the client results into the benchmark report"""
+    latencies = sorted(itertools.chain.from_iterable(result.latencies for result in results))
+    milliseconds = [latency * 1000 for latency in latencies]
+
+    def rounded(value):
+        return None if value is None else round(value, 4)
+
+    return {
+        "target": name,
+        "clients": clients,
+        "duration_s": round(duration, 3),
+        "requests": len(latencies),
+        "errors": sum(result.errors for result in results),
+        "throughput_per_s": round(len(latencies) / duration, 2) if duration else 0.0,
+        "latency_ms": {
+            "mean": rounded(sum(milliseconds) / len(milliseconds)) if milliseconds else None,
+            "p50": rounded(percentile(milliseconds, 0.50)),
+            "p95": rounded(percentile(milliseconds, 0.95)),
+            "p99": rounded(percentile(milliseconds, 0.99)),
+            "max": rounded(milliseconds[-1]) if milliseconds else None,
+        },
+    }
+
+
+def run_benchmark(name, clients, duration, mix, ports=None, pipeline=1): # pylint: disable=too-many-arguments,too-many-positional-arguments
+    """Run a benchmark against a simulator
+
+    Args:
+        name (str): The simulator to benchmark, a key of TARGETS
+        clients (int): The number of concurrent clients
+        duration (float): How long to apply load for, in seconds
+        mix (list): The commands each client cycles through
+        ports (list): Benchmark a simulator already listening on these ports, as many as the
+            target has, instead of starting one
+        pipeline (int): The number of commands each request client writes at once
+
+    Returns:
+        dict: The benchmark report
+    """
+    target = dict(TARGETS[name], pipeline=pipeline)
+    clients = min(clients, target.get("max_clients", clients))
+
+    process = None
+    if ports is None:
+        ports = find_free_ports(target["ports"])
+        process = start_simulator(target, ports)
+
+    try:
+        results, elapsed = run_clients(target, ports, clients, duration, mix)
+    finally:
+        if process is not None:
+            stop_simulator(process)
+
+    report = summarize(name, clients, elapsed, results)
+    report["pipeline"] = pipeline
+    return report
+
+
+def run_clients(target, ports, clients, duration, mix):
+    """Run the benchmark clients concurrently, each in its own thread
+
+    Returns:
+        tuple: (list of ClientResult, seconds the clients ran for)
+    """
+    results = [ClientResult() for _ in range(clients)]
+    start = time.monotonic()
+    threads = []
+    for index, result in enumerate(results):
+        # Stagger each client's starting point in the mix
+        commands = itertools.islice(itertools.cycle(mix), index % max(len(mix), 1), None)
+        thread = threading.Thread(target=run_client, daemon=True,
+                                  args=(target, ports, commands, start + duration, result))
+        threads.append(thread)
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.monotonic() - start
+
+
+def run_client(target, ports, commands, deadline, result):
+    """Run one benchmark client, counting a failure to connect, or any other failure, as an
+    error. Failures other than connection errors are also reported
+    """
+    try:
+        CLIENT_RUNNERS[target["mode"]](target, ports, commands, deadline, result)
+    except OSError:
+        result.errors += 1
+    except Exception as error_msg:  # pylint: disable=broad-exception-caught
+        result.errors += 1
+        print(f"Benchmark client failed: {error_msg!r}", file=sys.stderr)
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    """Compare a report against a baseline report
+
+    Args:
+        report (dict): The report of this run
+        baseline (dict): A report previously saved as the baseline
+        tolerance (float): The allowed fractional regression, e.g. 0.1 for 10%
+
+    Returns:
+        list: A description of each regression found, empty if there were none
+    """
+    regressions = []
+    base_throughput = baseline.get("throughput_per_s") or 0
+    if report["throughput_per_s"] < base_throughput * (1 - tolerance):
+        regressions.append(f"throughput {report['throughput_per_s']}/s is below baseline "
+                           f"{base_throughput}/s")
+
+    base_p99 = baseline.get("latency_ms", {}).get("p99")
+    p99 = report["latency_ms"]["p99"]
+    if base_p99 is not None and p99 is not None and p99 > base_p99 * (1 + tolerance):
+        regressions.append(f"p99 latency {p99} ms is above baseline {base_p99} ms")
+
+    if report["errors"] > baseline.get("errors", 0):
+        regressions.append(f"{report['errors']} errors, baseline had {baseline.get('errors', 0)}")
+    return regressions
+
+
+def parse_mix(command_args, default_commands):
+    """Expand '--command CMD[@WEIGHT]' arguments into the list of commands clients cycle through"""
+    if not command_args:
+        return list(default_commands)
+
+    mix = []
+    for command_arg in command_args:
+        command, _, weight = command_arg.rpartition("@")
+        if not command or not weight.isdigit():
+            command, weight = command_arg, "1"
+        mix.extend([command] * int(weight))
+    return mix
+
+
+def parse_args():
+    """Parses command line arguments. Use '--help' flag for more information on usage."""
+    parser = argparse.ArgumentParser(
+        description="Load test a simulated subsystem and report throughput and latency as JSON")
+    parser.add_argument("target", choices=sorted(TARGETS), help="The simulator to benchmark")
+    parser.add_argument("--clients", type=int, default=4,
+                        help="Number of concurrent clients (default: 4)")
+    parser.add_argument("--duration", type=float, default=5.0,
+                        help="Seconds to apply load for (default: 5)")
+    parser.add_argument("--command", action="append", metavar="CMD[@WEIGHT]",
+                        help="Add a command to the mix, optionally weighted. May be repeated. "
+                             "Defaults to a mix of read-only commands for the target")
+    parser.add_argument("--pipeline", type=int, default=1,
+                        help="Commands each client writes before reading their responses "
+                             "(default: 1, no pipelining)")
+    parser.add_argument("--port", dest="ports", metavar="PORT[,PORT...]",
+                        type=lambda ports: [int(port) for port in ports.split(',')],
+                        help="Benchmark a simulator already running on these ports, one for "
+                             "each port the simulator listens on (UHF: UART,radio,beacon)")
+    parser.add_argument("--output", help="Also write the report to this file")
+    parser.add_argument("--save-baseline", metavar="FILE", help="Save the report as a baseline")
+    parser.add_argument("--baseline", metavar="FILE",
+                        help="Compare against a saved baseline, exiting 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"Allowed fractional regression (default: {DEFAULT_TOLERANCE})")
+    args = parser.parse_args()
+    target = TARGETS[args.target]
+    if args.pipeline < 1:
+        parser.error("--pipeline must be at least 1")
+    if args.pipeline > 1 and (target["mode"] != "request" or target["terminator"] is None):
+        parser.error(f"{args.target} responses are not terminated, so cannot be pipelined")
+    if args.ports is not None and len(args.ports) != target["ports"]:
+        parser.error(f"--port must give {target['ports']} comma separated port(s) for "
+                     f"{args.target}")
+    return args
+
+
+def main():
+    """Runs the benchmark described by the command line arguments"""
+    args = parse_args()
+    target = TARGETS[args.target]
+    mix = parse_mix(args.command, target["commands"])
+
+    report = run_benchmark(args.target, args.clients, args.duration, mix, args.ports,
+                           args.pipeline)
+    report_json = json.dumps(report, indent=2)
+    print(report_json)
+
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w", encoding="utf-8") as report_file:
+            report_file.write(report_json + "\n")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_to_baseline(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+
+# pylint: disable=duplicate-code
+# no error
+__author__ = "Devin Headrick"
+__copyright__ = """
+    Copyright 2024 [Devin Headrick]
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License."""
@@ -0,0 +1,205 @@
+"""This module contains the power table the simulated EPS shares with the other simulators
+
+The EPS publishes which subsystems it powers in a small memory mapped file: its process ID as a
+uint32, then one byte per subsystem (1 for powered, 0 for off) in the order of SUBSYSTEMS. Each
+other simulator maps the same file and checks its own byte before serving a command or emitting
+a packet, so a subsystem turned off by the EPS stops responding. Reading a byte of the mapping
+is a lock-free memory read; the EPS only ever writes single bytes, so a reader never sees a
+partial update.
+
+The table is opt-in: only simulators run with the SIM_POWER_TABLE environment variable set to the
+path of the table obey it, and the EPS only publishes it when given a path, through the same
+variable or its --power-table option. Without a table every subsystem is taken to be powered, so
+each simulator still works alone, as it does while the EPS that owns the table is not running
+(the file missing, or the process that wrote it gone). default_path() gives each EPS port a table
+of its own, so EPS instances run side by side never share one.
+
+Copyright 2024 [Devin Headrick]. Licensed under the Apache License, Version 2.0
+"""
+
+import atexit
+import mmap
+import os
+import signal
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+POWER_TABLE_ENV = "SIM_POWER_TABLE"
+SUBSYSTEMS = ('ADCS', 'Deployables', 'DFGM', 'GPS', 'IRIS', 'UHF', 'AntennaBurnWireGPIO',
+              'UHFBurnWireGPIO')
+TABLE_HEADER = struct.Struct('<I')  # process ID of the EPS that owns the table
+TABLE_SIZE = TABLE_HEADER.size + len(SUBSYSTEMS)
+RECHECK_INTERVAL = 1.0  # seconds between readers checking the EPS still owns the table
+
+
+def table_path():
+    """Returns the path of the power table file, or None if the table is disabled"""
+    return os.environ.get(POWER_TABLE_ENV) or None
+
+
+def default_path(instance):
+    """Returns the path of the power table of an EPS instance
+
+    Args:
+        instance: What tells the EPS instance apart from others, e.g. its port
+    """
+    return os.path.join(tempfile.gettempdir(), f"ex3_power_table_{instance}")
+
+
+class PowerTable():
+    """The EPS's side of the power table, written whenever a subsystem is switched
+
+    The table file is removed when the EPS exits, including when it is terminated with SIGTERM, so
+    the simulators go back to being powered rather than obeying a stale table. It is left alone if
+    another EPS has since taken it over.
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str): The path of the table file, table_path() if None, or "" for no table
+        """
+        self.path = table_path() if path is None else path or None
+        self.table = None
+        if self.path is None:
+            return
+
+        # Written in place rather than replaced, so readers already mapping it see every update
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, TABLE_SIZE)
+            self.table = mmap.mmap(fd, TABLE_SIZE)
+        finally:
+            os.close(fd)
+        TABLE_HEADER.pack_into(self.table, 0, os.getpid())
+        atexit.register(self.close)
+        # By default SIGTERM ends the process without running atexit functions
+        if (threading.current_thread() is threading.main_thread()
+                and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL):
+            signal.signal(signal.SIGTERM, exit_on_signal)
+
+    def publish(self, powered):
+        """Write the power state of every subsystem to the table
+
+        Args:
+            powered (dict): Subsystem name to whether it is powered. Missing subsystems are off
+        """
+        if self.table is None:
+            return
+        for index, subsystem in enumerate(SUBSYSTEMS, TABLE_HEADER.size):
+            self.table[index] = 1 if powered.get(subsystem) else 0
+
+    def close(self):
+        """Unmap the table, and remove the table file if this process still owns it"""
+        if self.table is None:
+            return
+        self.table.close()
+        self.table = None
+        # The file at the path is checked, not the mapping, as it may have been recreated since
+        try:
+            with open(self.path, "rb") as table_file:
+                header = table_file.read(TABLE_HEADER.size)
+            if (len(header) == TABLE_HEADER.size
+                    and TABLE_HEADER.unpack(header)[0] == os.getpid()):
+                os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class PowerSwitch():
+    """A simulator's view of its own entry in the power table
+
+    The table is mapped on first use. At most every RECHECK_INTERVAL the file is checked to
+    still be the one mapped and its EPS process to still be running, so is_on() is normally a
+    clock read and a memory read.
+    """
+
+    def __init__(self, subsystem, path=None):
+        """
+        Args:
+            subsystem (str): The subsystem the switch powers, one of SUBSYSTEMS
+            path (str): The path of the table file, table_path() if None, or "" for no table
+        """
+        self.index = TABLE_HEADER.size + SUBSYSTEMS.index(subsystem)
+        self.path = table_path() if path is None else path or None
+        self.table = None
+        self.inode = None
+        self.next_check = 0.0
+
+    def is_on(self):
+        """Whether the EPS powers the subsystem, True if there is no power table"""
+        if self.path is None:
+            return True
+        now = time.monotonic()
+        if now >= self.next_check:
+            self.next_check = now + RECHECK_INTERVAL
+            self.attach()
+        return self.table is None or self.table[self.index] != 0
+
+    def attach(self):
+        """Map the table file if it exists, remapping it if the EPS has since recreated it, and
+        unmapping it if the EPS that wrote it is no longer running
+        """
+        try:
+            status = os.stat(self.path)
+        except FileNotFoundError:
+            status = None
+
+        if status is None or status.st_ino != self.inode:
+            self.detach()
+            if status is None or status.st_size < TABLE_SIZE:
+                return
+            try:
+                with open(self.path, "rb") as table_file:
+                    self.table = mmap.mmap(table_file.fileno(), TABLE_SIZE,
+                                           access=mmap.ACCESS_READ)
+                self.inode = status.st_ino
+            except (FileNotFoundError, ValueError):
+                return
+
+        if not process_running(TABLE_HEADER.unpack_from(self.table)[0]):
+            self.detach()
+
+    def detach(self):
+        """Unmap the table, if it is mapped"""
+        if self.table is not None:
+            self.table.close()
+        self.table = None
+        self.inode = None
+
+
+def exit_on_signal(signum, frame):
+    """Signal handler exiting the process normally, so atexit functions run"""
+    del frame
+    sys.exit(128 + signum)
+
+
+def process_running(pid):
+    """Whether a process with the given ID is running"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # running, as another user
+    return True
+
+
+# pylint: disable=duplicate-code
+# no error
+__author__ = "Devin Headrick"
+__copyright__ = """
+    Copyright 2024 [Devin Headrick]
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License."""
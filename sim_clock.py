@@ -0,0 +1,80 @@
+"""This module contains the simulation clock shared by the simulated subsystems
+
+Simulated time runs alongside real time, optionally scaled, and can be jumped ahead so that
+hours of orbit can be tested without waiting for them:
+    clock = SimClock(scale=60.0)  # one simulated minute per real second
+    clock.advance(3600)           # jump one simulated hour ahead
+Simulated time is measured in seconds from when the clock was created, and never goes backwards.
+
+Copyright 2024 [Devin Headrick]. Licensed under the Apache License, Version 2.0
+"""
+
+import threading
+import time
+
+
+class SimClock():
+    """A monotonic simulation clock that can be scaled and fast-forwarded
+
+    Safe to use from several threads at once.
+    """
+
+    def __init__(self, scale=1.0):
+        """
+        Args:
+            scale (float): Simulated seconds that pass per real second
+        """
+        if scale <= 0:
+            raise ValueError("Clock scale must be positive")
+        self.lock = threading.Lock()
+        self.scale = scale
+        # Simulated time at the real (monotonic) time 'real_start'
+        self.sim_start = 0.0
+        self.real_start = time.monotonic()
+
+    def now(self):
+        """Returns the current simulated time, in seconds since the clock was created"""
+        with self.lock:
+            return self.sim_start + (time.monotonic() - self.real_start) * self.scale
+
+    def advance(self, seconds):
+        """Jump the simulated time ahead
+
+        Args:
+            seconds (float): The number of simulated seconds to skip, not negative
+
+        Returns:
+            float: The simulated time after the jump
+        """
+        if seconds < 0:
+            raise ValueError("The clock cannot be moved backwards")
+        with self.lock:
+            self.sim_start += seconds
+            return self.sim_start + (time.monotonic() - self.real_start) * self.scale
+
+    def set_scale(self, scale):
+        """Change how many simulated seconds pass per real second, from now on"""
+        if scale <= 0:
+            raise ValueError("Clock scale must be positive")
+        with self.lock:
+            real_now = time.monotonic()
+            self.sim_start += (real_now - self.real_start) * self.scale
+            self.real_start = real_now
+            self.scale = scale
+
+
+# pylint: disable=duplicate-code
+# no error
+__author__ = "Devin Headrick"
+__copyright__ = """
+    Copyright 2024 [Devin Headrick]
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License."""
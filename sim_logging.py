@@ -0,0 +1,139 @@
+"""This module contains the shared logging setup used by every simulated subsystem
+
+Log records are put on a queue by the thread that logs them, and are formatted and written to
+the terminal by a background listener thread. Logging a message on the command hot path is
+therefore never a blocking write to the terminal.
+
+Each simulator logs through its own named logger (see get_logger), so levels can be set per
+subsystem with the SIM_LOG_LEVEL environment variable. It holds a default level optionally
+followed by per-logger levels, all comma separated:
+    SIM_LOG_LEVEL=WARNING,EPS=DEBUG python3 eps_subsystem.py
+
+Setting SIM_LOG_LEVEL=quiet disables all simulator logging. Loggers then reject records before
+they are created, so the hot path does no string formatting at all.
+
+Copyright 2024 [Devin Headrick]. Licensed under the Apache License, Version 2.0
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+LOG_LEVEL_ENV = "SIM_LOG_LEVEL"
+LOG_FORMAT = "%(asctime)s [%(name)s] %(levelname)s: %(message)s"
+LOG_DATE_FORMAT = "%H:%M:%S"
+DEFAULT_LOG_LEVEL = logging.INFO
+QUIET = "quiet"
+QUIET_LEVEL = logging.CRITICAL + 1  # above every level that is ever logged
+
+ROOT_LOGGER_NAME = "simulated"
+
+_LISTENER = None
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """A QueueHandler that leaves most of the formatting to the listener thread
+
+    The standard QueueHandler formats the whole log line in the logging thread before queueing
+    it. Here only the message is built from its arguments, so it holds their values when they were
+    logged even if they are mutated later (e.g. a state dict). The timestamp, level and name are
+    added by the listener. prepare() is only called for records that pass the level check, so
+    nothing is formatted for records that are not emitted.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def get_logger(name):
+    """Get the logger for a simulated subsystem or shared module
+
+    Args:
+        name (str): The name of the subsystem or module, e.g. 'EPS' or 'socket_stuff'
+
+    Returns:
+        logging.Logger: The logger, a child of the shared simulator logger
+    """
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+
+def parse_log_levels(setting):
+    """Parse a log level setting into a default level and per-logger levels
+
+    Args:
+        setting (str): A setting such as 'WARNING,EPS=DEBUG' or 'quiet'
+
+    Returns:
+        tuple: (default level, dict of logger name to level)
+    """
+    default_level = DEFAULT_LOG_LEVEL
+    logger_levels = {}
+
+    for item in filter(None, (item.strip() for item in setting.split(','))):
+        name, _, level = item.rpartition('=')
+        level = QUIET_LEVEL if level.lower() == QUIET else logging.getLevelName(level.upper())
+        if not isinstance(level, int):
+            print(f"Ignoring unknown log level in {LOG_LEVEL_ENV}: {item}", file=sys.stderr)
+        elif name:
+            logger_levels[name] = level
+        else:
+            default_level = level
+
+    return default_level, logger_levels
+
+
+def configure_logging(quiet=False):
+    """Set up queue backed logging for the simulator process
+
+    Safe to call more than once; only the first call installs the handler.
+
+    Args:
+        quiet (bool): Disable all simulator logging regardless of SIM_LOG_LEVEL
+    """
+    global _LISTENER  # pylint: disable=global-statement
+
+    default_level, logger_levels = parse_log_levels(os.environ.get(LOG_LEVEL_ENV, ""))
+    if quiet:
+        default_level, logger_levels = QUIET_LEVEL, {}
+
+    root_logger = logging.getLogger(ROOT_LOGGER_NAME)
+    root_logger.setLevel(default_level)
+    for name, level in logger_levels.items():
+        get_logger(name).setLevel(level)
+
+    if _LISTENER is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    root_logger.addHandler(DeferredQueueHandler(log_queue))
+    root_logger.propagate = False
+
+    _LISTENER = logging.handlers.QueueListener(log_queue, stream_handler)
+    _LISTENER.start()
+    # Write out anything still queued when the simulator exits
+    atexit.register(_LISTENER.stop)
+
+
+# pylint: disable=duplicate-code
+# no error
+__author__ = "Devin Headrick"
+__copyright__ = """
+    Copyright 2024 [Devin Headrick]
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License."""
@@ -0,0 +1,154 @@
+"""This module contains the scheduler of timed events in simulation time
+
+Every event of a simulator (a watchdog expiring, a delayed power-up, the end of a brown-out) is
+kept in one heap ordered by its due time on a SimClock. A single thread sleeps until the earliest
+event is due and runs it, so there is never a thread per event, and scaling the clock makes
+the events fire proportionally sooner in real time.
+
+Events can also be run on demand with run_due(), e.g. before a simulator's state is read or
+after its clock is fast-forwarded, so they always take effect in due time order whichever thread
+gets to them first. Callbacks are passed the simulation time the event was due at.
+
+A cancelled event stays in the heap until it reaches the top. Once most of the heap is cancelled
+(e.g. a watchdog kicked many times within its period), the cancelled events are dropped, so the
+heap never grows with how often events are cancelled.
+
+Copyright 2024 [Devin Headrick]. Licensed under the Apache License, Version 2.0
+"""
+
+import heapq
+import itertools
+import threading
+
+import sim_logging
+
+LOGGER = sim_logging.get_logger("sim_scheduler")
+
+
+class ScheduledEvent(): # pylint: disable=too-few-public-methods
+    """An event in the scheduler, which may be cancelled until it runs"""
+    __slots__ = ('due', 'callback', 'args', 'cancelled', 'scheduler')
+
+    def __init__(self, due, callback, args, scheduler):
+        self.due = due
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.scheduler = scheduler
+
+    def cancel(self):
+        """Stop the event from running, if it has not already"""
+        if not self.cancelled:
+            self.cancelled = True
+            self.scheduler.event_cancelled()
+
+
+class SimScheduler():
+    """Runs callbacks at simulation times, from a single thread
+
+    Callbacks run while holding the scheduler's lock. Given the lock that guards a simulator's
+    state, events are therefore serialized with every command that changes it.
+    """
+
+    def __init__(self, clock, lock=None):
+        """
+        Args:
+            clock (SimClock): The simulation clock events are due on
+            lock (threading.RLock): The lock held while events run, a new one if None
+        """
+        self.clock = clock
+        self.condition = threading.Condition(lock or threading.RLock())
+        self.events = []  # heap of (due time, sequence, ScheduledEvent)
+        self.cancelled = 0  # cancelled events still in the heap
+        self.sequence = itertools.count()
+        self.thread = None
+
+    def start(self):
+        """Start the thread that runs events as they fall due"""
+        self.thread = threading.Thread(target=self.run, name="sim_scheduler", daemon=True)
+        self.thread.start()
+
+    def schedule(self, due, callback, *args):
+        """Schedule a callback to run at a simulation time
+
+        Args:
+            due (float): The simulation time to run the callback at
+            callback (callable): Called with the due time followed by args
+            args: Further arguments for the callback
+
+        Returns:
+            ScheduledEvent: The event, which can be cancelled
+        """
+        event = ScheduledEvent(due, callback, args, self)
+        with self.condition:
+            heapq.heappush(self.events, (due, next(self.sequence), event))
+            self.condition.notify()
+        return event
+
+    def run_due(self, now=None):
+        """Run every event due at or before a simulation time, in due time order
+
+        Args:
+            now (float): The simulation time to run events up to, the clock's time if None
+        """
+        with self.condition:
+            if now is None:
+                now = self.clock.now()
+            while self.events and self.events[0][0] <= now:
+                _, _, event = heapq.heappop(self.events)
+                if event.cancelled:
+                    self.cancelled -= 1
+                else:
+                    event.cancelled = True  # it has run, so can no longer be cancelled
+                    event.callback(event.due, *event.args)
+
+    def event_cancelled(self):
+        """Count an event in the heap being cancelled, dropping every cancelled event once they
+        are most of the heap
+        """
+        with self.condition:
+            self.cancelled += 1
+            if self.cancelled > len(self.events) // 2:
+                self.events = [entry for entry in self.events if not entry[2].cancelled]
+                heapq.heapify(self.events)
+                self.cancelled = 0
+
+    def wake(self):
+        """Wake the scheduler thread to recheck the next due time, e.g. after a fast-forward"""
+        with self.condition:
+            self.condition.notify()
+
+    def run(self):
+        """Run events as they fall due, sleeping in between, forever"""
+        with self.condition:
+            while True:
+                try:
+                    self.run_due()
+                # One failing event must not stop every event after it
+                except Exception as error_msg:  # pylint: disable=broad-exception-caught
+                    LOGGER.exception("Error running a scheduled event: %r", error_msg)
+
+                while self.events and self.events[0][2].cancelled:
+                    heapq.heappop(self.events)
+                    self.cancelled -= 1
+                timeout = None
+                if self.events:
+                    timeout = max(self.events[0][0] - self.clock.now(), 0) / self.clock.scale
+                self.condition.wait(timeout)
+
+
+# pylint: disable=duplicate-code
+# no error
+__author__ = "Devin Headrick"
+__copyright__ = """
+    Copyright 2024 [Devin Headrick]
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License."""
@@ -0,0 +1,486 @@
+"""This program hosts every simulated subsystem in one process, on a single asyncio event loop
+
+Running each simulator as its own program costs an interpreter and a set of threads per
+subsystem. The host instead imports the logic of each subsystem (the EPS and Deployables
+command factories, DFGMSimulator, the GPS responses, the IRIS and ADCS command runners and the UHF
+relays) and serves all of them from one event loop, on their usual default ports. Clients connect
+exactly as they would to the standalone simulators.
+
+Once every server is listening the host prints how long startup took and its peak resident
+memory. The standalone programs are unchanged and can still be run on their own.
+
+Differences from the standalone simulators:
+    - Any number of clients may connect to each subsystem at once.
+    - Commands that shut a standalone simulator down ('terminate' for GPS, 'EXIT' for IRIS and
+      ADCS) only close the connection they were sent on.
+
+Usage:
+    python3 simulation_host.py [--only EPS,GPS] [--port-offset N] [--host ADDR] [--startup-only]
+
+Copyright 2024 [Devin Headrick]. Licensed under the Apache License, Version 2.0
+"""
+
+import argparse
+import asyncio
+import functools
+import os
+import resource
+import sys
+import time
+
+START_TIME = time.perf_counter()
+
+import command_handler # pylint: disable=C0413
+import sim_logging # pylint: disable=C0413
+import socket_stuff # pylint: disable=C0413
+
+# Each simulator imports the modules next to it by name, so its directory must be on the path
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+for subsystem_dir in ("ADCS", "Deployables", "DFGM", "EPS", "GPS", "IRIS", "UHF"):
+    sys.path.append(os.path.join(REPO_DIR, subsystem_dir))
+
+# pylint: disable=wrong-import-position,wrong-import-order
+import adcs_server
+import deployables_subsystem
+import dfgm_dataset
+import dfgm_subsystem
+import eps_subsystem
+import iris_simulated_server
+import packet_broadcaster
+import server as gps_server
+import simulated_uhf
+# pylint: enable=wrong-import-position,wrong-import-order
+
+DEFAULT_HOST = '127.0.0.1'
+SUBSYSTEMS = ("EPS", "Deployables", "DFGM", "GPS", "IRIS", "ADCS", "UHF")
+
+UHF_UART = "UART"
+UHF_RADIO = "Radio"
+
+LOGGER = sim_logging.get_logger("host")
+
+
+class StreamSocket():
+    """Gives an asyncio stream writer the socket send methods the simulators call
+
+    Args:
+        writer (asyncio.StreamWriter): The writer of the client connection
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def sendall(self, data):
+        """Queue data to be written to the client, which must still be connected"""
+        if self.writer.is_closing():
+            raise ConnectionResetError("client connection closed")
+        # The transport may hold on to data it cannot send yet, and simulators may reuse their
+        # send buffers, so buffers are copied
+        self.writer.write(bytes(data))
+
+    def send(self, data):
+        """Queue data to be written to the client, returning the number of bytes queued"""
+        self.writer.write(data)
+        return len(data)
+
+
+def command_handler_session(handler, writer):
+    """Create the responder of a connection served by a CommandHandler (e.g. EPS, Deployables)
+
+    The handler copy bound to the connection writes its responses itself.
+
+    Args:
+        handler (CommandHandler): The handler copied for each connection
+        writer (asyncio.StreamWriter): The writer of the client connection
+
+    Returns:
+        function: Takes the bytes read, returns the bytes to send (None closes the connection)
+    """
+    connection_handler = handler.create_connection_handler(StreamSocket(writer))
+
+    def respond(data):
+        if not data:
+            connection_handler.handle_disconnect()
+            return None
+        return b"" if connection_handler.handle_data(data) else None
+    return respond
+
+
+def run_push_timers(push_scheduler):
+    """Push the telemetry samples of a CommandHandler's subscribed clients from the event loop
+
+    A single event loop timer is kept armed for the next sample due.
+
+    Args:
+        push_scheduler (PushScheduler): The scheduler shared by the handler's connections
+    """
+    timer = None
+
+    def arm():
+        nonlocal timer
+        if timer is not None:
+            timer.cancel()
+        timeout = push_scheduler.timeout()
+        timer = None if timeout is None else asyncio.get_running_loop().call_later(timeout, run)
+
+    def run():
+        try:
+            push_scheduler.run_due()
+        finally:
+            arm()
+
+    push_scheduler.on_schedule = arm
+
+
+def gps_session(_writer):
+    """Create the responder of a GPS connection, see command_handler_session"""
+    def respond(data):
+        command = data.decode("utf-8")
+        if command in ("", "disconnect", "terminate"):
+            return None
+        return gps_server.command_response(command)
+    return respond
+
+
+def iris_session(_writer):
+    """Create the responder of an IRIS connection, see command_handler_session"""
+    def respond(data):
+        message = data.decode()
+        if message in ("", "EXIT"):
+            return None
+        reply = iris_simulated_server.run_message(message)
+        return iris_simulated_server.format_reply(reply) if reply else b""
+    return respond
+
+
+def adcs_session(adcs, _writer):
+    """Create the responder of an ADCS connection, see command_handler_session"""
+    def respond(data):
+        if not data or data.rstrip() == adcs_server.EXIT_FLAG:
+            return None
+        data_list = adcs_server.command_parser(data.decode("utf-8"))
+        return adcs_server.execute_command(data_list, adcs) or b""
+    return respond
+
+
+async def serve_client(name, make_session, reader, writer):
+    """Serve one client connection, passing everything it sends to the subsystem's responder
+
+    Args:
+        name (str): The name of the subsystem, for logging
+        make_session (function): Takes the writer, returns the responder for the connection
+        reader (asyncio.StreamReader): The reader of the client connection
+        writer (asyncio.StreamWriter): The writer of the client connection
+    """
+    LOGGER.info("[%s] Connected with %s", name, writer.get_extra_info("peername"))
+    respond = make_session(writer)
+    try:
+        while True:
+            data = await reader.read(socket_stuff.RECV_BUFFER_SIZE)
+            response = respond(data)
+            if response is None:
+                break
+            writer.write(response)
+            await writer.drain()
+
+    except ConnectionError as error_msg:
+        LOGGER.info("[%s] Client connection closed: %s", name, error_msg)
+
+    finally:
+        writer.close()
+        LOGGER.info("[%s] Client disconnected", name)
+
+
+class DFGMBroadcast():
+    """One DFGM simulator, whose packets are written to every connected client
+
+    Packets are generated from the first connection on, whether or not anyone is connected. A
+    client whose unsent data reaches MAX_QUEUED_PACKETS packets loses packets until it catches up.
+    """
+
+    def __init__(self):
+        self.writers = {}  # writer of each connected client to the packets it was not sent
+        self.simulator = dfgm_subsystem.DFGMSimulator(self)
+        self.task = None
+        # Set to wake the emitter early, so a new schedule takes effect at once
+        self.wake = asyncio.Event()
+
+    def sendall(self, data):
+        """Write a packet to every connected client that is keeping up"""
+        packet = bytes(data)
+        limit = packet_broadcaster.MAX_QUEUED_PACKETS * len(packet)
+        for writer in self.writers:
+            if writer.transport.get_write_buffer_size() >= limit:
+                self.writers[writer] += 1
+            else:
+                writer.write(packet)
+
+    async def emit_packets(self):
+        """Emit packets on the simulator's schedule, forever"""
+        while True:
+            self.simulator.emit()
+            try:
+                await asyncio.wait_for(self.wake.wait(), self.simulator.schedule.timeout())
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+
+    async def serve_client(self, reader, writer):
+        """Send the DFGM packets to a client until it leaves
+
+        Args:
+            reader (asyncio.StreamReader): The reader of the client connection, which only
+                carries control lines changing the schedule
+            writer (asyncio.StreamWriter): The writer of the client connection
+        """
+        LOGGER.info("[DFGM] Connected with %s", writer.get_extra_info("peername"))
+        self.writers[writer] = 0
+        if self.task is None:
+            self.task = asyncio.create_task(self.emit_packets())
+        control_buffer = b''  # this client's control line so far, up to its newline
+        try:
+            while data := await reader.read(socket_stuff.RECV_BUFFER_SIZE):
+                *lines, control_buffer = (control_buffer + data).split(b'\n')
+                if len(control_buffer) > packet_broadcaster.MAX_CONTROL_LINE:
+                    LOGGER.info("[DFGM] Client sent a control line that is too long")
+                    break
+                for line in lines:
+                    self.simulator.handle_control(line)
+                self.wake.set()
+
+        except ConnectionError as error_msg:
+            LOGGER.info("[DFGM] Client connection closed: %s", error_msg)
+
+        finally:
+            dropped = self.writers.pop(writer)
+            writer.close()
+            LOGGER.info("[DFGM] Client disconnected, %d packets dropped. Emitted %s", dropped,
+                        self.simulator.schedule.report())
+
+
+class UHFRelay():
+    """Relays data between the clients of the simulated UHF UART and radio servers
+
+    Anything sent by the client of one side is forwarded, unchanged, to the client of the other.
+    Data for a side with no client connected is held until one connects, as the standalone
+    simulator's queues do.
+    """
+
+    def __init__(self):
+        self.writers = {UHF_UART: None, UHF_RADIO: None}
+        self.pending = {UHF_UART: [], UHF_RADIO: []}
+
+    def forward(self, side, data):
+        """Send data to the client of a side, or hold it until one connects
+
+        Args:
+            side (str): UHF_UART or UHF_RADIO
+            data (bytes): The data to send
+        """
+        writer = self.writers[side]
+        if writer is None or writer.is_closing():
+            self.pending[side].append(data)
+        else:
+            writer.write(data)
+
+    async def serve_client(self, side, other_side, reader, writer):
+        """Serve the client of one side of the relay, the newest client replacing any other
+
+        Args:
+            side (str): The side the client connected to, UHF_UART or UHF_RADIO
+            other_side (str): The side its data is forwarded to
+            reader (asyncio.StreamReader): The reader of the client connection
+            writer (asyncio.StreamWriter): The writer of the client connection
+        """
+        LOGGER.info("[UHF %s] client connected: %s", side, writer.get_extra_info("peername"))
+        self.writers[side] = writer
+        for data in self.pending[side]:
+            writer.write(data)
+        self.pending[side].clear()
+
+        try:
+            while True:
+                data = await reader.read(simulated_uhf.RELAY_SERVER_RECV_SIZE)
+                if not data:
+                    break
+                LOGGER.debug("[UHF %s] received: %s", side, data)
+                if simulated_uhf.POWER.is_on():
+                    self.forward(other_side, data)
+                await writer.drain()
+
+        except ConnectionError as error_msg:
+            LOGGER.info("[UHF %s] Client connection closed: %s", side, error_msg)
+
+        finally:
+            if self.writers[side] is writer:
+                self.writers[side] = None
+            writer.close()
+            LOGGER.info("[UHF %s] client disconnected", side)
+
+
+async def transmit_beacon(reader, writer):
+    """Send the UHF beacon message to the client every BEACON_TX_PERIOD seconds until it leaves
+
+    Args:
+        reader (asyncio.StreamReader): The reader of the client connection (unused)
+        writer (asyncio.StreamWriter): The writer of the client connection
+    """
+    del reader
+    LOGGER.info("[UHF Beacon] client connected: %s", writer.get_extra_info("peername"))
+    try:
+        while not writer.is_closing():
+            if simulated_uhf.POWER.is_on():
+                writer.write(simulated_uhf.BEACON_TX_MESSAGE.encode('utf-8'))
+            await writer.drain()
+            await asyncio.sleep(simulated_uhf.BEACON_TX_PERIOD)
+
+    except ConnectionError as error_msg:
+        LOGGER.info("[UHF Beacon] Client connection closed: %s", error_msg)
+
+    finally:
+        writer.close()
+        LOGGER.info("[UHF Beacon] client disconnected")
+
+
+def subsystem_servers(subsystems):
+    """Create the state of the hosted subsystems, and the servers that serve them
+
+    Each subsystem is only created when it is hosted, so a partial host pays for the startup time
+    and memory of the subsystems it hosts alone (e.g. the DFGM dataset is only loaded with the
+    DFGM). The EPS power table in particular must not be created without the EPS: with every
+    subsystem off and no EPS to switch them on, it would silence the others.
+
+    Args:
+        subsystems (list): The names of the subsystems to host
+
+    Returns:
+        dict: Subsystem name to a list of (default port, client connected callback) pairs
+    """
+    def serve(name, make_session):
+        return functools.partial(serve_client, name, make_session)
+
+    servers = {}
+    if "EPS" in subsystems:
+        eps = command_handler.CommandHandler(
+            eps_subsystem.EPSCommandFactory(eps_subsystem.EPSSubsystem()))
+        run_push_timers(eps.push_scheduler)
+        servers["EPS"] = [(eps_subsystem.DEFAULT_PORT,
+                           serve("EPS", functools.partial(command_handler_session, eps)))]
+    if "Deployables" in subsystems:
+        deployables = command_handler.CommandHandler(
+            deployables_subsystem.DeployablesCommandFactory())
+        run_push_timers(deployables.push_scheduler)
+        servers["Deployables"] = [(deployables_subsystem.DEFAULT_PORT,
+                                   serve("Deployables",
+                                         functools.partial(command_handler_session, deployables)))]
+    if "DFGM" in subsystems:
+        # Loaded up front, so no connection waits for it
+        dfgm_dataset.load_dataset(dfgm_subsystem.DATA_FILE)
+        dfgm = DFGMBroadcast()
+        servers["DFGM"] = [(dfgm_subsystem.DEFAULT_PORT, dfgm.serve_client)]
+    if "GPS" in subsystems:
+        servers["GPS"] = [(gps_server.DEFAULT_PORT, serve("GPS", gps_session))]
+    if "IRIS" in subsystems:
+        servers["IRIS"] = [(iris_simulated_server.DEFAULT_PORT, serve("IRIS", iris_session))]
+    if "ADCS" in subsystems:
+        # The host does the ADCS networking, so the subsystem is never given a link of its own
+        adcs = adcs_server.ADCSSubsystem(None)
+        servers["ADCS"] = [(adcs_server.DEFAULT_PORT,
+                            serve("ADCS", functools.partial(adcs_session, adcs)))]
+    if "UHF" in subsystems:
+        uhf = UHFRelay()
+        servers["UHF"] = [(simulated_uhf.UART_PORT,
+                           functools.partial(uhf.serve_client, UHF_UART, UHF_RADIO)),
+                          (simulated_uhf.RADIO_PORT,
+                           functools.partial(uhf.serve_client, UHF_RADIO, UHF_UART)),
+                          (simulated_uhf.BEACON_PORT, transmit_beacon)]
+    return servers
+
+
+def peak_rss_mib():
+    """Returns the peak resident memory of this process in MiB"""
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports the peak in KiB, macOS in bytes
+    return peak_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+async def run_host(host, subsystems, port_offset, startup_only=False):
+    """Start the servers of the given subsystems and serve clients until interrupted
+
+    Args:
+        host (str): The host address to bind every server to
+        subsystems (list): The names of the subsystems to host
+        port_offset (int): Added to every default port
+        startup_only (bool): Report the startup time and memory, then exit
+    """
+    servers_by_subsystem = subsystem_servers(subsystems)
+    servers = []
+    for name in subsystems:
+        for port, callback in servers_by_subsystem[name]:
+            servers.append(await asyncio.start_server(callback, host, port + port_offset))
+            LOGGER.info("%s listening on port %s", name, port + port_offset)
+
+    print(f"Hosting {len(subsystems)} subsystems on {len(servers)} ports. "
+          f"Startup took {time.perf_counter() - START_TIME:.3f} s, "
+          f"peak resident memory {peak_rss_mib():.1f} MiB", flush=True)
+
+    if startup_only:
+        for server in servers:
+            server.close()
+        return
+
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+
+
+def parse_args():
+    """Parses command line arguments. Use '--help' for more information."""
+    parser = argparse.ArgumentParser(
+        description="Host every simulated subsystem in one process on their default ports")
+
+    parser.add_argument("--only", type=lambda names: names.split(','), default=SUBSYSTEMS,
+                        help=f"Comma separated subsystems to host (default: all of "
+                             f"{','.join(SUBSYSTEMS)})")
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help=f"Address every server binds to (default: {DEFAULT_HOST})")
+    parser.add_argument("--port-offset", type=int, default=0,
+                        help="Added to every default port, e.g. to run hosts side by side")
+    parser.add_argument("--startup-only", action="store_true",
+                        help="Report the startup time and memory, then exit")
+
+    args = parser.parse_args()
+    unknown = set(args.only) - set(SUBSYSTEMS)
+    if unknown:
+        parser.error(f"unknown subsystems: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main():
+    """Hosts the simulated subsystems until interrupted"""
+    args = parse_args()
+    sim_logging.configure_logging()
+
+    try:
+        asyncio.run(run_host(args.host, args.only, args.port_offset, args.startup_only))
+    except KeyboardInterrupt:
+        LOGGER.info("Keyboard interrupt detected. Closing servers.")
+
+
+if __name__ == "__main__":
+    main()
+
+
+# pylint: disable=duplicate-code
+# no error
+__author__ = "Devin Headrick"
+__copyright__ = """
+    Copyright 2024 [Devin Headrick]
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License."""
@@ -1,46 +1,278 @@
-
 """This module contains functions for creating a socket and listening for client connections
 
+Client connections are multiplexed with the selectors module, so any number of clients may be
+connected at once. Each accepted client is given its own copy of the command handler, meaning
+per-connection state (client socket, receive buffer) is never shared between clients. A client
+disconnecting (or misbehaving) only ever closes that client's socket, never the listening socket.
+Client sockets are non-blocking: responses a client does not read at once wait in its handler
+until the selector finds it writable, so a client that stops reading never stalls the others.
+
+Simulators listen on TCP by default. Given a path (the --unix option of each simulator) they
+listen on a Unix domain socket instead, avoiding the TCP stack and port collisions when the
+client runs on the same host. Simulators whose clients send one command per message may also
+use SOCK_SEQPACKET (--seqpacket), which keeps message boundaries.
+
+The same loop pushes the telemetry samples of subscribed clients: the selector waits no longer
+than until the next sample is due.
+
 Copyright 2023 [Devin Headrick]. Licensed under the Apache License, Version 2.0
 """
 
+import functools
+import os
+import selectors
 import socket
+import stat
 
+import sim_logging
 
-def create_socket_and_listen(host, port, command_handler_obj):
-    """Create a socket and bind it to the port. Listen indefinitely for client connections
+RECV_BUFFER_SIZE = 4096
+
+LOGGER = sim_logging.get_logger("socket_stuff")
+
+
+def add_address_arguments(parser, default_port, message_oriented=False):
+    """Add the arguments selecting the address to listen on (or connect to) to a parser
+
+    Adds an optional positional port, --unix PATH and, for message oriented subsystems,
+    --seqpacket.
 
     Args:
-        host (str): The host address to bind the socket to
-        port (int): The port to bind the socket to
-        command_handler (CommandHandler): The command handler to use to process commands
+        parser (argparse.ArgumentParser): The parser of the simulator or client
+        default_port (int): The TCP port used when none is given
+        message_oriented (bool): Whether the subsystem's clients send one command per message,
+            so SOCK_SEQPACKET may be used
+    """
+    parser.add_argument("port", nargs="?", type=int, default=default_port,
+                        help=f"TCP port (default: {default_port})")
+    parser.add_argument("--unix", metavar="PATH", dest="unix_path",
+                        help="Use a Unix domain socket at PATH instead of TCP")
+    if message_oriented:
+        parser.add_argument("--seqpacket", action="store_true",
+                            help="Use SOCK_SEQPACKET for the Unix domain socket, "
+                                 "keeping message boundaries")
+    else:
+        parser.set_defaults(seqpacket=False)
 
-    Returns:
-        socket: The socket object created
+
+def unix_socket_type(seqpacket):
+    """Returns the socket type of a Unix domain socket, SOCK_SEQPACKET or SOCK_STREAM"""
+    return socket.SOCK_SEQPACKET if seqpacket else socket.SOCK_STREAM
+
+
+def remove_unix_socket(unix_path):
+    """Remove the Unix domain socket file at a path, if there is one
+
+    Left behind when a simulator exits, it would stop the next one from binding to the path.
+    Anything at the path other than a socket is left alone.
+
+    Args:
+        unix_path (str): The path of the socket file, or None
     """
+    try:
+        if unix_path and stat.S_ISSOCK(os.stat(unix_path).st_mode):
+            os.unlink(unix_path)
+    except FileNotFoundError:
+        pass
 
-   # Create a socket and bind it to the port. Listen indefinitely for client connections
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as socket_obj:
+
+def create_listening_socket(host, port, unix_path=None, seqpacket=False):
+    """Create a socket bound to the listen address, and start listening on it
+
+    Args:
+        host (str): The host address to bind a TCP socket to
+        port (int): The port to bind a TCP socket to
+        unix_path (str): Bind a Unix domain socket to this path instead of using TCP
+        seqpacket (bool): Use SOCK_SEQPACKET rather than SOCK_STREAM for the Unix domain socket
+
+    Returns:
+        socket: The listening socket
+    """
+    if unix_path is None:
+        socket_obj = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         # Tell OS to reuse socket addr if not previously closed
         socket_obj.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        socket_obj.bind((host, int(port)))
+        address = (host, int(port))
+    else:
+        socket_obj = socket.socket(socket.AF_UNIX, unix_socket_type(seqpacket))
+        remove_unix_socket(unix_path)
+        address = unix_path
+
+    try:
+        socket_obj.bind(address)
         socket_obj.listen()
-        while True:
+    except OSError:
+        socket_obj.close()
+        raise
+    return socket_obj
+
+
+def connect_socket(host, port, unix_path=None, seqpacket=False):
+    """Create a socket connected to a simulator, for the test clients
+
+    Args:
+        host (str): The host address of a TCP simulator
+        port (int): The port of a TCP simulator
+        unix_path (str): Connect to the Unix domain socket at this path instead of using TCP
+        seqpacket (bool): Use SOCK_SEQPACKET rather than SOCK_STREAM for the Unix domain socket
+
+    Returns:
+        socket: The connected socket
+    """
+    if unix_path is None:
+        return socket.create_connection((host, int(port)))
+
+    socket_obj = socket.socket(socket.AF_UNIX, unix_socket_type(seqpacket))
+    try:
+        socket_obj.connect(unix_path)
+    except OSError:
+        socket_obj.close()
+        raise
+    return socket_obj
+
+
+def create_socket_and_listen(host, port, command_handler_obj, unix_path=None, # pylint: disable=too-many-arguments,too-many-positional-arguments
+                             seqpacket=False):
+    """Create a socket and bind it to the port. Listen indefinitely for client connections
+
+    Args:
+        host (str): The host address to bind the socket to
+        port (int): The port to bind the socket to
+        command_handler (CommandHandler): The command handler to use to process commands.
+            A copy of it is made for each client that connects.
+        unix_path (str): Listen on a Unix domain socket at this path instead of using TCP
+        seqpacket (bool): Use SOCK_SEQPACKET for the Unix domain socket, in which case each
+            message received is taken to end with a complete command
+    """
+
+   # Create a socket and bind it to the port. Listen indefinitely for client connections
+    with create_listening_socket(host, port, unix_path, seqpacket) as socket_obj:
+        socket_obj.setblocking(False)
+
+        with selectors.DefaultSelector() as selector:
+            # The listening socket is the only registered object without a handler attached
+            selector.register(socket_obj, selectors.EVENT_READ, None)
+            push_scheduler = command_handler_obj.push_scheduler
             try:
-                conn, addr = socket_obj.accept()
-                with conn:
-                    print(f"Connected with {addr}", flush=True)
-                    command_handler_obj.set_client_socket(conn)
-                    command_handler_obj.handle_command()
+                while True:
+                    for key, mask in selector.select(push_scheduler.timeout()):
+                        if key.data is None:
+                            accept_client(selector, key.fileobj, command_handler_obj)
+                        else:
+                            service_client(selector, key.fileobj, key.data, mask)
+                    run_pushes(push_scheduler)
 
             except KeyboardInterrupt:
-                print("Keyboard interrupt detected. Closing socket.", flush=True)
-                socket_obj.close()
-                break
+                LOGGER.info("Keyboard interrupt detected. Closing socket.")
+
+            finally:
+                for key in list(selector.get_map().values()):
+                    if key.data is not None:
+                        close_client(selector, key.fileobj)
+                remove_unix_socket(unix_path)
+
 
-            except BrokenPipeError as error_msg:
-                print(f"Client connection closed: {error_msg}", flush=True)
-                socket_obj.close()
+def accept_client(selector, listening_socket, command_handler_obj):
+    """Accept a pending client connection and register it with the selector
+
+    Args:
+        selector (selectors.BaseSelector): The selector multiplexing all client connections
+        listening_socket (socket): The listening socket with a pending connection
+        command_handler_obj (CommandHandler): The handler copied for the new connection
+    """
+    try:
+        conn, addr = listening_socket.accept()
+    except BlockingIOError:
+        return
+
+    LOGGER.info("Connected with %s", addr)
+    conn.setblocking(False)
+    handler = command_handler_obj.create_connection_handler(conn)
+    handler.on_output_change = functools.partial(update_client, selector, conn)
+    selector.register(conn, selectors.EVENT_READ, handler)
+
+
+def service_client(selector, conn, handler, mask):
+    """Write the pending output of a writable client connection, and read the data available on
+    a readable one and pass it to the client's handler
+
+    Args:
+        selector (selectors.BaseSelector): The selector multiplexing all client connections
+        conn (socket): The ready client socket
+        handler (CommandHandler): The command handler bound to this client
+        mask (int): The events the client socket is ready for
+    """
+    try:
+        if mask & selectors.EVENT_WRITE:
+            handler.drain_output()
+        if mask & selectors.EVENT_READ and handler.client_connected:
+            data = conn.recv(RECV_BUFFER_SIZE)
+            if data:
+                handler.handle_data(data, conn.type == socket.SOCK_SEQPACKET)
+            else:
+                handler.handle_disconnect()
+            update_client(selector, conn, handler)
+        return
+
+    except OSError as error_msg:
+        LOGGER.info("Client connection closed: %s", error_msg)
+
+    # A bug in one command must not take down every other client, so drop only this one
+    except Exception as error_msg:  # pylint: disable=broad-exception-caught
+        LOGGER.exception("Error handling client, closing connection: %r", error_msg)
+
+    close_client(selector, conn)
+
+
+def update_client(selector, conn, handler):
+    """Wait for a client socket to become writable only while it has output pending, and close
+    it once it is disconnected with nothing left to send
+
+    Args:
+        selector (selectors.BaseSelector): The selector multiplexing all client connections
+        conn (socket): The client socket
+        handler (CommandHandler): The command handler bound to this client
+    """
+    if conn.fileno() < 0:  # already closed
+        return
+    if not handler.client_connected and not handler.pending_output:
+        close_client(selector, conn)
+        return
+    # A client that has closed its side is no longer read from, only sent what is left
+    events = ((selectors.EVENT_READ if handler.client_connected else 0)
+              | (selectors.EVENT_WRITE if handler.pending_output else 0))
+    if selector.get_key(conn).events != events:
+        selector.modify(conn, events, handler)
+
+
+def run_pushes(push_scheduler):
+    """Push the telemetry samples that are due. A push that fails is logged and its subscription
+    is not scheduled again, without taking down the server
+
+    Args:
+        push_scheduler (PushScheduler): The scheduler of the subscribed clients
+    """
+    try:
+        push_scheduler.run_due()
+    except Exception as error_msg:  # pylint: disable=broad-exception-caught
+        LOGGER.exception("Error pushing telemetry samples: %r", error_msg)
+
+
+def close_client(selector, conn):
+    """Unregister a client connection from the selector and close it, if it is still open
+
+    Args:
+        selector (selectors.BaseSelector): The selector multiplexing all client connections
+        conn (socket): The client socket to close
+    """
+    key = selector.get_map().get(conn) if conn.fileno() >= 0 else None
+    if key is None:
+        return
+    selector.unregister(conn)
+    key.data.subscription = None
+    key.data.client_connected = False
+    conn.close()
+    LOGGER.info("Client disconnected")
 
 
 # pylint: disable=duplicate-code
@@ -0,0 +1,169 @@
+"""This module contains the telemetry subscriptions served by the command handler
+
+Instead of polling a parameter with request commands, a client may subscribe to a set of them:
+    subscribe:Voltage,Current,Temperature:<period_ms>[:<threshold>]
+The simulator then pushes a timestamped sample of the parameters on the connection every period,
+until the client sends 'unsubscribe' or disconnects:
+    sample:<timestamp>:Voltage=7.93,Current=0.32,Temperature=30.12
+Given a threshold, the parameters are still sampled every period but a sample is only pushed when
+one of them has changed by more than the threshold since the last sample pushed (any change for
+a threshold of 0, or for values that are not numbers).
+
+Each connection has at most one subscription; subscribing again replaces it. The pushes of every
+connection are timed by one PushScheduler, a heap of due times that the server's event loop
+runs, so idle subscriptions cost nothing between samples.
+
+Copyright 2024 [Devin Headrick]. Licensed under the Apache License, Version 2.0
+"""
+
+import heapq
+import itertools
+import time
+
+SUBSCRIBE_COMMAND = 'subscribe'
+UNSUBSCRIBE_COMMAND = 'unsubscribe'
+PARAMETER_DELIMITER = ','
+SAMPLE_PREFIX = 'sample'
+MIN_PERIOD_MS = 10  # bounds the load a single subscriber can put on a simulator
+
+
+class Subscription(): # pylint: disable=too-few-public-methods
+    """The parameters a connection is subscribed to, how often, and the last values pushed"""
+    __slots__ = ('parameters', 'period', 'threshold', 'last_values')
+
+    def __init__(self, parameters, period, threshold=None):
+        """
+        Args:
+            parameters (tuple): The names of the parameters to sample
+            period (float): The sampling period, in seconds
+            threshold (float): Only push samples that changed by more than this, None for all
+        """
+        self.parameters = parameters
+        self.period = period
+        self.threshold = threshold
+        self.last_values = None
+
+    def sample(self, timestamp, values):
+        """Format a sample of the parameters, or return None if it should not be pushed
+
+        Args:
+            timestamp (float): The time the values were read at, in seconds
+            values (list): The value of each parameter, in order
+
+        Returns:
+            str: The sample line without its terminator, or None if nothing changed enough
+        """
+        if self.threshold is not None and self.last_values is not None and not any(
+                changed(old, new, self.threshold) for old, new in zip(self.last_values, values)):
+            return None
+        self.last_values = values
+        fields = PARAMETER_DELIMITER.join(f"{parameter}={value}"
+                                          for parameter, value in zip(self.parameters, values))
+        return f"{SAMPLE_PREFIX}:{timestamp:.3f}:{fields}"
+
+
+def changed(old, new, threshold):
+    """Whether a value changed by more than the threshold (numbers) or at all (anything else)"""
+    if isinstance(old, (int, float)) and isinstance(new, (int, float)):
+        return abs(new - old) > threshold
+    return old != new
+
+
+def parse_subscription(params, available):
+    """Parse the params of a subscribe command
+
+    Args:
+        params (list): The command params: parameters, period in ms and optionally a threshold
+        available (tuple): The parameters that may be subscribed to
+
+    Returns:
+        Subscription: The subscription described, or None if the params are invalid
+    """
+    if len(params) not in (2, 3):
+        return None
+    parameters = tuple(parameter.strip() for parameter in params[0].split(PARAMETER_DELIMITER))
+    if not all(parameter in available for parameter in parameters):
+        return None
+    try:
+        period_ms = int(params[1])
+        threshold = float(params[2]) if len(params) == 3 else None
+    except ValueError:
+        return None
+    if period_ms < MIN_PERIOD_MS or (threshold is not None and not 0 <= threshold < float("inf")):
+        return None
+    return Subscription(parameters, period_ms / 1000, threshold)
+
+
+class PushScheduler():
+    """Times the samples pushed to every subscribed connection of a server
+
+    The server's event loop waits at most timeout() for client data, then calls run_due().
+    Connections are handlers with 'subscription' and 'client_connected' attributes and a
+    push_sample() method. Entries for replaced or cancelled subscriptions are skipped when due.
+    """
+
+    def __init__(self):
+        self.timers = []  # heap of (due time, sequence, handler, subscription)
+        self.sequence = itertools.count()
+        # Called whenever a new subscription is scheduled, so an event loop can rearm its timer
+        self.on_schedule = None
+
+    def schedule(self, handler, subscription):
+        """Push the first sample of a new subscription as soon as the event loop runs
+
+        Args:
+            handler (CommandHandler): The connection the samples are pushed to
+            subscription (Subscription): The connection's new subscription
+        """
+        heapq.heappush(self.timers, (time.monotonic(), next(self.sequence), handler,
+                                     subscription))
+        if self.on_schedule is not None:
+            self.on_schedule()
+
+    def timeout(self):
+        """Returns the seconds until the next sample is due, or None if nothing is subscribed"""
+        while self.timers and not self.is_current(self.timers[0]):
+            heapq.heappop(self.timers)
+        if not self.timers:
+            return None
+        return max(0.0, self.timers[0][0] - time.monotonic())
+
+    def run_due(self):
+        """Push every sample that is due, and schedule the next sample of each subscription
+
+        Samples keep to their period; a subscriber that has fallen more than a period behind
+        skips the samples it missed rather than being sent a burst of them.
+        """
+        now = time.monotonic()
+        while self.timers and self.timers[0][0] <= now:
+            entry = heapq.heappop(self.timers)
+            if not self.is_current(entry):
+                continue
+            due, _, handler, subscription = entry
+            handler.push_sample()
+            if handler.subscription is subscription and handler.client_connected:
+                due = max(due + subscription.period, now)
+                heapq.heappush(self.timers, (due, next(self.sequence), handler, subscription))
+
+    @staticmethod
+    def is_current(entry):
+        """Whether a timer entry's subscription is still the one on its live connection"""
+        _, _, handler, subscription = entry
+        return handler.subscription is subscription and handler.client_connected
+
+
+# pylint: disable=duplicate-code
+# no error
+__author__ = "Devin Headrick"
+__copyright__ = """
+    Copyright 2024 [Devin Headrick]
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License."""